@@ -0,0 +1,103 @@
+# abmci/services/badges.py
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+from datetime import timedelta
+from functools import lru_cache
+from typing import Optional
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+# Durée de validité par défaut d’un badge membre
+BADGE_TTL_DAYS = 365
+
+
+def _b64e(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64d(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+@lru_cache(maxsize=1)
+def _private_key() -> Ed25519PrivateKey:
+    """
+    Clé privée Ed25519 des badges : ne quitte jamais le serveur.
+    BADGE_SIGNING_KEY (PEM PKCS8) si défini, sinon graine dérivée de SECRET_KEY.
+    """
+    explicit = getattr(settings, "BADGE_SIGNING_KEY", None)
+    if explicit:
+        key = serialization.load_pem_private_key(explicit.encode("utf-8"), password=None)
+        if not isinstance(key, Ed25519PrivateKey):
+            raise ImproperlyConfigured("BADGE_SIGNING_KEY doit être une clé privée Ed25519 (PEM).")
+        return key
+    seed = hmac.new(settings.SECRET_KEY.encode("utf-8"), b"abmci.badge.ed25519.v2", hashlib.sha256).digest()
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+def public_key_b64() -> str:
+    """Clé publique brute (32 octets, base64url) : seule clé distribuée aux applis de scan."""
+    return _b64e(_private_key().public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw,
+    ))
+
+
+def _message(fidele_id: int, eglise_id: int | None, exp: int) -> bytes:
+    return f"{fidele_id}.{eglise_id or 0}.{exp}".encode("utf-8")
+
+
+def sign_badge(fidele_id: int, eglise_id: int | None = None, *, ttl_days: int = BADGE_TTL_DAYS) -> str:
+    """
+    Badge membre signé (Ed25519), à encoder dans un QR :
+    base64url({"fid": 12, "egl": 3, "exp": 1735689600, "sig": <signature>})
+    """
+    exp = int((timezone.now() + timedelta(days=ttl_days)).timestamp())
+    sig = _private_key().sign(_message(fidele_id, eglise_id, exp))
+    payload = {"fid": fidele_id, "egl": eglise_id or 0, "exp": exp, "sig": _b64e(sig)}
+    return _b64e(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def verify_badge(payload_b64: str, *, at_ts: float | None = None) -> Optional[dict]:
+    """
+    Retourne {"fidele_id", "eglise_id"} si la signature est valide et le badge non expiré
+    à l’instant `at_ts` (heure du scan hors ligne), sinon None.
+    """
+    try:
+        data = json.loads(_b64d(payload_b64).decode("utf-8"))
+        fid, egl, exp = int(data["fid"]), int(data.get("egl") or 0), int(data["exp"])
+        try:
+            _private_key().public_key().verify(_b64d(data["sig"]), _message(fid, egl, exp))
+        except InvalidSignature:
+            return None
+        if (at_ts if at_ts is not None else timezone.now().timestamp()) > exp:
+            return None
+        return {"fidele_id": fid, "eglise_id": egl or None}
+    except Exception:
+        return None
+
+
+def verify_event_qr(payload_b64: str) -> Optional[str]:
+    """
+    QR d’évènement signé : base64url({"code":"EVT123","exp":1699999999,"sig":<hmac>}).
+    Retourne le code si la signature est valide et non expirée, sinon None.
+    """
+    try:
+        data = json.loads(_b64d(payload_b64).decode("utf-8"))
+        msg = f"{data['code']}.{data['exp']}".encode("utf-8")
+        expected = hmac.new(settings.SECRET_KEY.encode("utf-8"), msg, hashlib.sha256).digest()
+        if not hmac.compare_digest(_b64d(data["sig"]), expected):
+            return None
+        if timezone.now().timestamp() > float(data["exp"]):
+            return None
+        return data["code"]
+    except Exception:
+        return None
@@ -0,0 +1,189 @@
+# abmci/services/calendar_feed.py
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from event.models import Evenement
+
+# Un mois de calendrier reste en cache 1h ; l'invalidation se fait par version (signaux).
+MONTH_TTL = 60 * 60
+VERSION_TTL = None  # jamais expirée
+
+# Plafond de sécurité : FullCalendar demande au plus ~6 semaines, on tolère une année.
+MAX_RANGE_DAYS = 366
+
+PALETTE = {
+    "meeting": "#6576ff",
+    "conférence": "#f56b6b",
+    "conference": "#f56b6b",
+    "atelier": "#45cb85",
+    "workshop": "#45cb85",
+    "formation": "#ffaa00",
+    "training": "#ffaa00",
+    "culte": "#9b51e0",
+}
+DEFAULT_COLOR = "#6576ff"  # défaut (DashLite primary)
+
+
+def color_for_type(type_name: str | None) -> str:
+    """Mappe un type d’évènement vers une couleur FullCalendar."""
+    if not type_name:
+        return DEFAULT_COLOR
+    return PALETTE.get(type_name.strip().lower(), DEFAULT_COLOR)
+
+
+# -------------------------------
+# Versionnement (invalidation)
+# -------------------------------
+
+def _scope(eglise_id: int | None) -> str:
+    return str(eglise_id) if eglise_id else "all"
+
+
+def _version_key(eglise_id: int | None) -> str:
+    return f"calfeed:v:{_scope(eglise_id)}"
+
+
+def _get_version(eglise_id: int | None) -> int:
+    key = _version_key(eglise_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, VERSION_TTL)
+        version = cache.get(key) or 1
+    return int(version)
+
+
+def bump_version(eglise_id: int | None) -> None:
+    """
+    Invalide tous les mois en cache de l’église (et la vue “toutes églises”).
+    Les anciennes clés expirent d’elles-mêmes (TTL).
+    """
+    for scope_id in {eglise_id, None}:
+        key = _version_key(scope_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, VERSION_TTL)
+
+
+def _month_key(eglise_id: int | None, month: date) -> str:
+    return f"calfeed:{_scope(eglise_id)}:{_get_version(eglise_id)}:{month:%Y-%m}"
+
+
+# -------------------------------
+# Bornes de la requête FullCalendar
+# -------------------------------
+
+def parse_bound(value: str | None) -> Optional[datetime]:
+    """
+    FullCalendar envoie start/end en ISO8601 (avec ou sans heure / fuseau).
+    Retourne un datetime “aware”, ou None si invalide.
+    """
+    if not value:
+        return None
+    value = value.strip().replace(" ", "+")  # '+' du fuseau décodé en espace
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value[:10])
+        if d is None:
+            return None
+        dt = datetime.combine(d, time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _months_between(start: datetime, end: datetime) -> Iterable[date]:
+    month = _month_start(timezone.localtime(start).date())
+    last = timezone.localtime(end).date()
+    while month <= last:
+        yield month
+        month = _next_month(month)
+
+
+# -------------------------------
+# Sérialisation
+# -------------------------------
+
+def _serialize(ev: Evenement) -> dict:
+    color = color_for_type(ev.type.name if ev.type else None)
+    return {
+        "id": ev.id,
+        "title": ev.titre,
+        "start": ev.date_debut.isoformat(),
+        "end": ev.date_fin.isoformat() if ev.date_fin else None,
+        "url": reverse("event-detail", args=[ev.pk]),
+        "backgroundColor": color,
+        "borderColor": color,
+        "extendedProps": {
+            "lieu": ev.lieu or "",
+            "description": ev.description or "",
+            "banner": ev.banner.url if ev.banner else "",
+            "qr_code": ev.qr_code.url if ev.qr_code else "",
+            "participants": ev.nb_participants,
+        },
+    }
+
+
+def _month_events(eglise_id: int | None, month: date) -> List[dict]:
+    """Évènements qui chevauchent le mois (une seule requête, comptage annoté)."""
+    key = _month_key(eglise_id, month)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    tz = timezone.get_current_timezone()
+    lo = timezone.make_aware(datetime.combine(month, time.min), tz)
+    hi = timezone.make_aware(datetime.combine(_next_month(month), time.min), tz)
+
+    qs = (
+        Evenement.objects.select_related("type")
+        .filter(date_debut__lt=hi, date_fin__gte=lo)
+        .annotate(nb_participants=Count("participationevenement"))
+        .order_by("date_debut", "id")
+    )
+    if eglise_id:
+        qs = qs.filter(eglise_id=eglise_id)
+
+    events = [_serialize(ev) for ev in qs]
+    cache.set(key, events, MONTH_TTL)
+    return events
+
+
+def calendar_feed(start: datetime, end: datetime, eglise_id: int | None = None) -> List[dict]:
+    """
+    Flux JSON compatible FullCalendar pour [start, end[.
+    Assemblé à partir des mois en cache, dédoublonné (évènements à cheval).
+    """
+    if end <= start:
+        return []
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        end = start + timedelta(days=MAX_RANGE_DAYS)
+
+    seen = set()
+    out: List[dict] = []
+    for month in _months_between(start, end):
+        for item in _month_events(eglise_id, month):
+            if item["id"] in seen:
+                continue
+            item_end = parse_datetime(item["end"] or item["start"])
+            if parse_datetime(item["start"]) >= end or item_end < start:
+                continue
+            seen.add(item["id"])
+            out.append(item)
+    return out
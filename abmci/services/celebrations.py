@@ -0,0 +1,212 @@
+# abmci/services/celebrations.py
+from __future__ import annotations
+
+import calendar
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from eden.models import Mariage
+from fidele.models import Fidele, Notification
+
+# Codes de Anniversaire.type_anniversaire
+KINDS = {
+    "NAISS": "Anniversaire",
+    "BAPT": "Anniversaire de baptême",
+    "MARI": "Anniversaire de mariage",
+}
+TYPE_MEMBER = "CELEBRATION"
+TYPE_PASTOR = "CELEBRATIONS_DIGEST"
+# Destinataires du récapitulatif : comptes de l’église ayant accès à l’annuaire des fidèles
+PASTOR_PERMISSION = "fidele.view_fidele"
+PUSH_TTL = 2 * 24 * 3600
+MAX_BODY_NAMES = 15
+
+
+def _month_days(day: date) -> List[tuple]:
+    """(mois, jour) célébrés `day` ; les 29 février sont fêtés le 28 les années non bissextiles."""
+    out = [(day.month, day.day)]
+    if (day.month, day.day) == (2, 28) and not calendar.isleap(day.year):
+        out.append((2, 29))
+    return out
+
+
+def _match(field: str, day: date) -> Q:
+    # Lookups __month / __day = EXTRACT(...) : servis par les index d’expressions (mois, jour)
+    q = Q()
+    for month, dom in _month_days(day):
+        q |= Q(**{f"{field}__month": month, f"{field}__day": dom})
+    return q
+
+
+def _is_today(value: Optional[date], day: date) -> bool:
+    return bool(value) and (value.month, value.day) in _month_days(day) and value.year < day.year
+
+
+def _name(first, last) -> str:
+    return f"{first or ''} {last or ''}".strip()
+
+
+def celebrations_for(day: Optional[date] = None, *, eglise_id: Optional[int] = None) -> Dict[Optional[int], List[dict]]:
+    """
+    Célébrations du jour par église : anniversaires de naissance et de baptême (une requête
+    sur les fidèles), anniversaires de mariage (une requête sur les couples des mariages du jour).
+    Entrée : {"kind", "label", "nom", "years", "fidele_ids", "user_ids"}.
+    """
+    day = day or timezone.localdate()
+    by_eglise: Dict[Optional[int], List[dict]] = defaultdict(list)
+
+    members = Fidele.objects.filter(is_deleted=0).filter(_match("birthdate", day) | _match("date_bapteme", day))
+    if eglise_id:
+        members = members.filter(eglise_id=eglise_id)
+    for row in members.values("id", "user_id", "user__first_name", "user__last_name", "eglise_id",
+                              "birthdate", "date_bapteme"):
+        for kind, value in (("NAISS", row["birthdate"]), ("BAPT", row["date_bapteme"])):
+            if _is_today(value, day):
+                by_eglise[row["eglise_id"]].append({
+                    "kind": kind,
+                    "label": KINDS[kind],
+                    "nom": _name(row["user__first_name"], row["user__last_name"]),
+                    "years": day.year - value.year,
+                    "fidele_ids": [row["id"]],
+                    "user_ids": [row["user_id"]],
+                })
+
+    couples = (Mariage.couple.through.objects
+               .filter(mariage__in=Mariage.objects.filter(_match("date_mariage", day)), fidele__is_deleted=0)
+               .values("mariage_id", "mariage__date_mariage", "fidele_id", "fidele__user_id",
+                       "fidele__user__first_name", "fidele__user__last_name", "fidele__eglise_id")
+               .order_by("mariage_id", "fidele_id"))
+    weddings: Dict[int, List[dict]] = defaultdict(list)
+    for row in couples:
+        weddings[row["mariage_id"]].append(row)
+    for spouses in weddings.values():
+        married = spouses[0]["mariage__date_mariage"]
+        if not _is_today(married, day):
+            continue
+        entry = {
+            "kind": "MARI",
+            "label": KINDS["MARI"],
+            "nom": " & ".join(_name(s["fidele__user__first_name"], s["fidele__user__last_name"]) for s in spouses),
+            "years": day.year - married.year,
+            "fidele_ids": [s["fidele_id"] for s in spouses],
+            "user_ids": [s["fidele__user_id"] for s in spouses],
+        }
+        # Un couple dont les conjoints sont dans deux églises apparaît dans chacune
+        for eglise in {s["fidele__eglise_id"] for s in spouses}:
+            if not eglise_id or eglise == eglise_id:
+                by_eglise[eglise].append(entry)
+
+    for entries in by_eglise.values():
+        entries.sort(key=lambda e: (list(KINDS).index(e["kind"]), e["nom"]))
+    return dict(by_eglise)
+
+
+def _years(entry: dict) -> str:
+    return f"{entry['years']} an{'s' if entry['years'] > 1 else ''}"
+
+
+def digest_body(entries: List[dict]) -> str:
+    """« Anniversaire : A (30 ans), B (41 ans) · Anniversaire de mariage : C & D (10 ans) »."""
+    parts = []
+    for kind, label in KINDS.items():
+        names = [f"{e['nom']} ({_years(e)})" for e in entries if e["kind"] == kind]
+        if names:
+            more = len(names) - MAX_BODY_NAMES
+            text = ", ".join(names[:MAX_BODY_NAMES]) + (f" et {more} autre(s)" if more > 0 else "")
+            parts.append(f"{label} : {text}")
+    return " · ".join(parts)
+
+
+def _member_message(entries: List[dict]) -> tuple:
+    labels = [f"{e['label'].lower()} ({_years(e)})" for e in entries]
+    if len(entries) == 1 and entries[0]["kind"] == "NAISS":
+        return "Joyeux anniversaire !", "Toute l’église se réjouit avec vous en ce jour."
+    return "Joyeuse célébration !", f"L’église célèbre avec vous aujourd’hui : {', '.join(labels)}."
+
+
+def pastors_by_eglise(eglise_ids) -> Dict[int, List[int]]:
+    """Comptes ayant PASTOR_PERMISSION (directe ou par groupe), par église de leur fiche fidèle."""
+    out: Dict[int, List[int]] = defaultdict(list)
+    users = (User.objects.with_perm(PASTOR_PERMISSION, include_superusers=False,
+                                    backend="django.contrib.auth.backends.ModelBackend")
+             .filter(is_active=True, fidele__eglise_id__in=[e for e in eglise_ids if e])
+             .values_list("id", "fidele__eglise_id"))
+    for user_id, eglise_id in users:
+        out[eglise_id].append(user_id)
+    return out
+
+
+def _push(eglise_id: int, day: date, entries: List[dict]) -> bool:
+    from abmci.notifications.fcm import send_to_topic
+
+    # Une seule diffusion par église et par jour, même si la tâche est relancée
+    if not cache.add(f"celebrations:push:{day.isoformat()}:{eglise_id}", 1, PUSH_TTL):
+        return False
+    try:
+        send_to_topic(f"eglise_{eglise_id}", "Célébrations du jour", digest_body(entries),
+                      {"type": TYPE_MEMBER, "date": day.isoformat(), "eglise_id": eglise_id})
+        return True
+    except Exception as e:
+        print(f"[FCM][eglise_{eglise_id}] Échec envoi célébrations : {e!r}")
+        return False
+
+
+def send_daily(day: Optional[date] = None, *, push: bool = True, dry_run: bool = False) -> dict:
+    """
+    Notifications groupées du jour :
+      - chaque fidèle célébré : une notification (toutes ses célébrations du jour réunies) ;
+      - pasteurs / responsables de chaque église : un récapitulatif ;
+      - fidèles de l’église : une diffusion FCM sur le topic eglise_<id>.
+    Relançable : les destinataires déjà notifiés pour `day` sont ignorés.
+    """
+    day = day or timezone.localdate()
+    iso = day.isoformat()
+    groups = celebrations_for(day)
+    result = {"date": iso, "eglises": len(groups), "celebrations": sum(len(v) for v in groups.values()),
+              "members": 0, "pastors": 0, "pushes": 0}
+    if dry_run or not groups:
+        return result
+
+    done = set(Notification.objects.filter(type__in=[TYPE_MEMBER, TYPE_PASTOR], data__date=iso)
+               .values_list("user_id", "type"))
+    notifications = []
+
+    per_user: Dict[int, List[dict]] = defaultdict(list)
+    for entries in groups.values():
+        for entry in entries:
+            for user_id in entry["user_ids"]:
+                if entry not in per_user[user_id]:
+                    per_user[user_id].append(entry)
+    for user_id, entries in per_user.items():
+        if (user_id, TYPE_MEMBER) in done:
+            continue
+        title, body = _member_message(entries)
+        notifications.append(Notification(user_id=user_id, type=TYPE_MEMBER, title=title, body=body,
+                                          data={"date": iso, "kinds": [e["kind"] for e in entries]}))
+        result["members"] += 1
+
+    for eglise_id, user_ids in pastors_by_eglise(groups).items():
+        entries = groups[eglise_id]
+        for user_id in user_ids:
+            if (user_id, TYPE_PASTOR) in done:
+                continue
+            notifications.append(Notification(
+                user_id=user_id, type=TYPE_PASTOR,
+                title=f"Célébrations du jour ({len(entries)})",
+                body=digest_body(entries),
+                data={"date": iso, "eglise_id": eglise_id,
+                      "fidele_ids": sorted({pk for e in entries for pk in e["fidele_ids"]})},
+            ))
+            result["pastors"] += 1
+
+    Notification.objects.bulk_create(notifications, batch_size=1000)
+
+    if push:
+        result["pushes"] = sum(_push(eglise_id, day, entries) for eglise_id, entries in groups.items() if eglise_id)
+    return result
@@ -0,0 +1,278 @@
+# abmci/services/checkin.py
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from event.models import Evenement, ParticipationEvenement
+from fidele.models import Fidele
+
+# Fenêtre d’activation du QR : [start - 15min, end + 6h]
+ALLOW_BEFORE_MIN = 15
+ALLOW_AFTER_MIN = 6 * 60
+
+EVENT_TTL = 10 * 60  # fenêtre d’un évènement en cache (invalidée à chaque écriture)
+MISSING_TTL = 30  # codes inconnus : cache négatif court (scans erronés en rafale)
+FIDELE_TTL = 60 * 60
+# Fidèle autorisé à scanner (compte actif, fiche non supprimée) : invalidé par signal,
+# TTL court pour les modifications faites sans save() (queryset.update)
+ACTIVE_TTL = 5 * 60
+
+# Taille d’un INSERT multi-lignes (4 paramètres par ligne, sous la limite SQLite)
+BULK_INSERT_ROWS = 1000
+
+_MISSING = {"missing": True}
+
+
+def _event_key(code: str) -> str:
+    return f"checkin:event:{code}"
+
+
+def _fidele_key(user_id: int) -> str:
+    return f"checkin:fidele:{user_id}"
+
+
+def _active_key(fidele_id: int) -> str:
+    return f"checkin:active:{fidele_id}"
+
+
+def invalidate_event(code: str) -> None:
+    cache.delete(_event_key(code))
+
+
+def invalidate_member(fidele_id: int) -> None:
+    cache.delete(_active_key(fidele_id))
+
+
+def is_active_member(fidele_id: int) -> bool:
+    """Compte actif et fiche non supprimée (le JWT sans état ne le vérifie pas)."""
+    key = _active_key(fidele_id)
+    active = cache.get(key)
+    if active is None:
+        active = Fidele.objects.filter(pk=fidele_id, is_deleted=0, user__is_active=True).exists()
+        cache.set(key, active, ACTIVE_TTL)
+    return active
+
+
+def get_event_window(code: str) -> Optional[dict]:
+    """
+    Fenêtre de validité d’un évènement, par code, sans toucher la base en régime établi.
+    Retourne {"id", "eglise_id", "opens", "closes"} (timestamps) ou None si inconnu.
+    """
+    key = _event_key(code)
+    window = cache.get(key)
+    if window is None:
+        row = (Evenement.objects.filter(code=code)
+               .values_list("id", "eglise_id", "date_debut", "date_fin").first())
+        if row is None:
+            cache.set(key, _MISSING, MISSING_TTL)
+            return None
+        pk, eglise_id, start, end = row
+        window = {
+            "id": pk,
+            "eglise_id": eglise_id,
+            "opens": (start - timedelta(minutes=ALLOW_BEFORE_MIN)).timestamp(),
+            "closes": (end + timedelta(minutes=ALLOW_AFTER_MIN)).timestamp(),
+        }
+        cache.set(key, window, EVENT_TTL)
+    if window.get("missing"):
+        return None
+    return window
+
+
+def window_status(window: dict, now: datetime | None = None) -> str:
+    """'open' | 'not_started' | 'expired'"""
+    ts = (now or timezone.now()).timestamp()
+    if ts < window["opens"]:
+        return "not_started"
+    if ts > window["closes"]:
+        return "expired"
+    return "open"
+
+
+def fidele_id_for_request(request) -> Optional[int]:
+    """
+    Identifiant du fidèle : claim JWT `fidele_id` si présent, sinon résolution user → fidèle ;
+    None si le compte est désactivé ou la fiche supprimée (drapeau en cache).
+    """
+    fid = None
+    token = getattr(request, "auth", None)
+    if token is not None and hasattr(token, "get"):
+        fid = token.get("fidele_id")
+
+    if not fid:
+        user_id = getattr(request.user, "id", None) or getattr(request.user, "pk", None)
+        if not user_id:
+            return None
+        fid = fidele_id_for_user(user_id)
+    if not fid or not is_active_member(int(fid)):
+        return None
+    return int(fid)
+
+
+def fidele_id_for_user(user_id: int) -> Optional[int]:
+    key = _fidele_key(user_id)
+    fid = cache.get(key)
+    if fid is None:
+        fid = Fidele.objects.filter(user_id=user_id).values_list("id", flat=True).first()
+        if fid is None:
+            return None
+        cache.set(key, fid, FIDELE_TTL)
+    return fid
+
+
+def insert_participation(evenement_id: int, fidele_id: int, scanned_at: datetime | None = None) -> Optional[int]:
+    """
+    INSERT … ON CONFLICT DO NOTHING (PostgreSQL / SQLite ≥ 3.35).
+    Retourne l’id créé, ou None si la présence existait déjà.
+    Les signaux ne sont pas émis : les compteurs sont mis à jour par l’appelant.
+    """
+    meta = ParticipationEvenement._meta
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(meta.db_table)} "
+        f"({qn('fidele_id')}, {qn('evenement_id')}, {qn('date')}, {qn('qr_code_scanned')}) "
+        f"VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT ({qn('fidele_id')}, {qn('evenement_id')}) DO NOTHING "
+        f"RETURNING {qn('id')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [fidele_id, evenement_id, scanned_at or timezone.now(), True])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def insert_participations(evenement_id: int, rows: Iterable[Tuple[int, datetime]]) -> Set[int]:
+    """
+    Variante ensembliste de insert_participation pour la synchro hors ligne :
+    un INSERT multi-lignes … ON CONFLICT DO NOTHING par paquet de BULK_INSERT_ROWS.
+    `rows` : (fidele_id, scanned_at), fidèles existants et sans doublon.
+    Retourne l’ensemble des fidele_id effectivement créés.
+    """
+    meta = ParticipationEvenement._meta
+    qn = connection.ops.quote_name
+    rows = list(rows)
+    created: Set[int] = set()
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), BULK_INSERT_ROWS):
+            chunk = rows[i:i + BULK_INSERT_ROWS]
+            sql = (
+                f"INSERT INTO {qn(meta.db_table)} "
+                f"({qn('fidele_id')}, {qn('evenement_id')}, {qn('date')}, {qn('qr_code_scanned')}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT ({qn('fidele_id')}, {qn('evenement_id')}) DO NOTHING "
+                f"RETURNING {qn('fidele_id')}"
+            )
+            params = []
+            for fidele_id, scanned_at in chunk:
+                params += [fidele_id, evenement_id, scanned_at, True]
+            cursor.execute(sql, params)
+            created.update(r[0] for r in cursor.fetchall())
+    return created
+
+
+def after_checkins(window: dict, created: int, attendances: Iterable[Tuple[int, datetime]] = ()) -> None:
+    """
+    Effets de bord des signaux (stats + calendrier + assiduité), une fois par lot.
+    `attendances` : (fidele_id, date) des présences créées.
+    """
+    if not created:
+        return
+    from abmci.services.calendar_feed import bump_version
+    from abmci.services.engagement import record_attendances
+    from abmci.services.event_stats import record_participations
+
+    record_participations(window["id"], created)
+    bump_version(window["eglise_id"])
+    record_attendances(attendances)
+
+
+# -------------------------------
+# Synchro hors ligne (lots de scans)
+# -------------------------------
+
+MAX_SYNC_ROWS = 5000
+
+CREATED = "created"
+ALREADY_PRESENT = "already_present"
+DUPLICATE_IN_BATCH = "duplicate_in_batch"
+INVALID_BADGE = "invalid_badge"
+INVALID_TIMESTAMP = "invalid_timestamp"
+OUTSIDE_WINDOW = "outside_window"
+UNKNOWN_FIDELE = "unknown_fidele"
+
+
+def _parse_scanned_at(value) -> Optional[datetime]:
+    """Heure du scan, ou None si absente / illisible / impossible (ex. 2024-02-30)."""
+    if not value:
+        return None
+    try:
+        dt = parse_datetime(str(value))
+    except ValueError:
+        return None
+    if dt is not None and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def sync_checkins(window: dict, rows: List[dict]) -> List[dict]:
+    """
+    Enregistre un lot de scans hors ligne pour un évènement.
+    Chaque ligne : {"badge": "<payload>", "scanned_at": "<ISO8601>", "client_id": ...}.
+    Retourne un résultat par ligne, dans l’ordre : {"index", "client_id", "fidele_id", "status"}.
+
+    Coût constant en requêtes : un SELECT des fidèles + un INSERT par paquet de 1000.
+    """
+    from abmci.services.badges import verify_badge
+
+    now = timezone.now()
+    results: List[dict] = []
+    pending: Dict[int, Tuple[int, datetime]] = {}  # fidele_id -> (index, scanned_at)
+
+    for index, row in enumerate(rows):
+        row = row if isinstance(row, dict) else {}
+        result = {"index": index, "client_id": row.get("client_id"), "fidele_id": None, "status": None}
+        results.append(result)
+
+        scanned_at = _parse_scanned_at(row.get("scanned_at"))
+        if scanned_at is None or scanned_at > now + timedelta(minutes=5):
+            result["status"] = INVALID_TIMESTAMP
+            continue
+
+        badge = verify_badge(str(row.get("badge") or ""), at_ts=scanned_at.timestamp())
+        if badge is None:
+            result["status"] = INVALID_BADGE
+            continue
+        fidele_id = badge["fidele_id"]
+        result["fidele_id"] = fidele_id
+
+        if window_status(window, scanned_at) != "open":
+            result["status"] = OUTSIDE_WINDOW
+            continue
+
+        if fidele_id in pending:
+            result["status"] = DUPLICATE_IN_BATCH
+            continue
+        pending[fidele_id] = (index, scanned_at)
+
+    existing = set()
+    if pending:
+        # Fidèles supprimés (logiquement) : refusés comme inconnus
+        existing = set(Fidele.objects.filter(pk__in=pending, is_deleted=0).values_list("pk", flat=True))
+    for fidele_id in set(pending) - existing:
+        results[pending.pop(fidele_id)[0]]["status"] = UNKNOWN_FIDELE
+
+    created = insert_participations(
+        window["id"], ((fid, scanned_at) for fid, (_, scanned_at) in pending.items())
+    )
+    for fidele_id, (index, _) in pending.items():
+        results[index]["status"] = CREATED if fidele_id in created else ALREADY_PRESENT
+
+    after_checkins(window, len(created),
+                   [(fid, scanned_at) for fid, (_, scanned_at) in pending.items() if fid in created])
+    return results
@@ -0,0 +1,135 @@
+# abmci/services/church_index.py
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
+from django.core.cache import cache
+
+from fidele.models import Eglise
+
+# Index spatial en mémoire (par processus) des églises : grille régulière en degrés.
+# Quelques centaines d’églises → reconstruction en une requête, recherche en µs.
+CELL_DEG = 0.5  # ~55 km à l’équateur
+EARTH_RADIUS_M = 6_371_008.8
+
+VERSION_KEY = "church_index:version"
+
+_lock = threading.Lock()
+_state = {"version": None, "grid": None, "count": 0}
+
+
+def invalidate() -> None:
+    """
+    Appelé quand la géométrie d’une église change : tous les processus reconstruiront
+    leur index (et les caches géographiques qui incluent la version sont abandonnés).
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY) or 1
+    return int(version)
+
+
+def _cell(lon: float, lat: float) -> Tuple[int, int]:
+    return int(math.floor(lon / CELL_DEG)), int(math.floor(lat / CELL_DEG))
+
+
+def haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def rebuild(version: int | None = None) -> int:
+    """Charge (id, lon, lat) de toutes les églises géolocalisées et remplit la grille."""
+    version = current_version() if version is None else version
+    grid: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = defaultdict(list)
+    count = 0
+    for pk, loc in Eglise.objects.filter(location__isnull=False).values_list("pk", "location"):
+        grid[_cell(loc.x, loc.y)].append((pk, loc.x, loc.y))
+        count += 1
+    with _lock:
+        _state.update(version=version, grid=dict(grid), count=count)
+    return count
+
+
+def _ring(cx: int, cy: int, r: int):
+    """Cellules à distance de Tchebychev exactement r de (cx, cy)."""
+    if r == 0:
+        yield cx, cy
+        return
+    for dx in range(-r, r + 1):
+        yield cx + dx, cy - r
+        yield cx + dx, cy + r
+    for dy in range(-r + 1, r):
+        yield cx - r, cy + dy
+        yield cx + r, cy + dy
+
+
+def _search(grid, lon: float, lat: float, max_m: float | None) -> Optional[Tuple[int, float]]:
+    """
+    Parcours des anneaux de cellules autour du point, jusqu’à ce que l’anneau suivant
+    soit forcément plus loin que le meilleur candidat (ou que le rayon max).
+    """
+    if not grid:
+        return None
+    cx, cy = _cell(lon, lat)
+    cell_m = math.radians(CELL_DEG) * EARTH_RADIUS_M
+    best: Optional[Tuple[int, float]] = None
+
+    for r in range(0, int(180 / CELL_DEG) + 1):
+        # Minorant de la distance à tout point de l’anneau r (pire cas : longitude à la latitude max)
+        lat_max = min(90.0, abs(lat) + (r + 1) * CELL_DEG)
+        lower_bound = max(0, r - 1) * cell_m * math.cos(math.radians(lat_max))
+        if best is not None and lower_bound > best[1]:
+            break
+        if max_m is not None and lower_bound > max_m:
+            break
+        for cell in _ring(cx, cy, r):
+            for pk, ex, ey in grid.get(cell, ()):
+                d = haversine_m(lon, lat, ex, ey)
+                if best is None or d < best[1]:
+                    best = (pk, d)
+
+    if best is not None and max_m is not None and best[1] > max_m:
+        return None
+    return best
+
+
+def _postgis_nearest(point, max_m: float | None) -> Optional[Tuple[int, float]]:
+    qs = Eglise.objects.filter(location__isnull=False)
+    if max_m is not None:
+        qs = qs.filter(location__distance_lte=(point, D(m=max_m)))
+    row = (qs.annotate(distance=Distance("location", point))
+           .order_by("distance").values_list("pk", "distance").first())
+    return (row[0], row[1].m) if row else None
+
+
+def nearest(point, *, max_radius_km: float | None = None) -> Optional[Tuple[int, float]]:
+    """
+    (eglise_id, distance en mètres) de l’église la plus proche de `point` (SRID 4326), ou None.
+    Index chaud → recherche en mémoire ; index froid (démarrage / église modifiée)
+    → PostGIS pour cet appel, puis reconstruction pour les suivants.
+    """
+    max_m = float(max_radius_km) * 1000.0 if max_radius_km is not None else None
+    version = current_version()
+    grid = _state["grid"]
+    if grid is not None and _state["version"] == version:
+        return _search(grid, point.x, point.y, max_m)
+
+    result = _postgis_nearest(point, max_m)
+    rebuild(version)
+    return result
@@ -0,0 +1,112 @@
+# abmci/services/church_tiles.py
+from __future__ import annotations
+
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import connection
+
+from abmci.services import church_index
+from fidele.models import Eglise
+
+MAX_ZOOM = 22
+# En dessous de ce zoom, les églises sont regroupées (grille de CLUSTER_GRID × CLUSTER_GRID par tuile)
+CLUSTER_MAX_ZOOM = 11
+CLUSTER_GRID = 64
+
+EXTENT = 4096
+BUFFER = 64
+LAYER = "eglises"
+# Les tuiles sont invalidées par la version de l’index (géométries modifiées) ; TTL de sécurité.
+TILE_TTL = 24 * 60 * 60
+
+# Demi-circonférence Web Mercator (EPSG:3857)
+_MERCATOR_HALF = 20037508.342789244
+
+_POINTS_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+),
+pts AS (
+    SELECT e.id, e.name, e.ville, ST_Transform(e.location, 3857) AS geom
+    FROM {eglise} e, bounds b
+    WHERE e.location IS NOT NULL
+      AND e.location && ST_Transform(b.geom, 4326)
+      AND ST_Intersects(ST_Transform(e.location, 3857), b.geom)
+),
+mvtgeom AS (
+    SELECT ST_AsMVTGeom(p.geom, b.geom, {extent}, {buffer}, true) AS geom,
+           p.id, p.name, p.ville, 1 AS point_count
+    FROM pts p, bounds b
+)
+SELECT ST_AsMVT(mvtgeom.*, '{layer}', {extent}, 'geom') FROM mvtgeom
+"""
+
+# Regroupement sur une grille alignée sur les tuiles (les groupes ne chevauchent pas deux tuiles)
+_CLUSTERS_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+),
+pts AS (
+    SELECT e.id, e.name, e.ville, ST_Transform(e.location, 3857) AS geom
+    FROM {eglise} e, bounds b
+    WHERE e.location IS NOT NULL
+      AND e.location && ST_Transform(b.geom, 4326)
+      AND ST_Intersects(ST_Transform(e.location, 3857), b.geom)
+),
+clusters AS (
+    SELECT count(*) AS point_count,
+           min(id) AS id,
+           min(name) AS name,
+           min(ville) AS ville,
+           ST_Centroid(ST_Collect(geom)) AS geom
+    FROM pts
+    GROUP BY ST_SnapToGrid(geom, %(origin)s, %(origin)s, %(cell)s, %(cell)s)
+),
+mvtgeom AS (
+    SELECT ST_AsMVTGeom(c.geom, b.geom, {extent}, {buffer}, true) AS geom,
+           CASE WHEN c.point_count = 1 THEN c.id END AS id,
+           CASE WHEN c.point_count = 1 THEN c.name END AS name,
+           CASE WHEN c.point_count = 1 THEN c.ville END AS ville,
+           c.point_count
+    FROM clusters c, bounds b
+)
+SELECT ST_AsMVT(mvtgeom.*, '{layer}', {extent}, 'geom') FROM mvtgeom
+"""
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_version() -> int:
+    return church_index.current_version()
+
+
+def _render(z: int, x: int, y: int) -> bytes:
+    clustered = z <= CLUSTER_MAX_ZOOM
+    template = _CLUSTERS_SQL if clustered else _POINTS_SQL
+    sql = template.format(
+        eglise=connection.ops.quote_name(Eglise._meta.db_table),
+        extent=EXTENT, buffer=BUFFER, layer=LAYER,
+    )
+    params = {"z": z, "x": x, "y": y}
+    if clustered:
+        cell = 2 * _MERCATOR_HALF / (2 ** z) / CLUSTER_GRID
+        # Origine décalée d’une demi-cellule : ST_SnapToGrid arrondit au nœud le plus proche
+        params.update(cell=cell, origin=-_MERCATOR_HALF + cell / 2)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+def get_tile(z: int, x: int, y: int, version: Optional[int] = None) -> bytes:
+    """Tuile MVT (éventuellement vide), en cache jusqu’au prochain changement de géométrie."""
+    version = tile_version() if version is None else version
+    key = f"eglises:tile:{version}:{z}/{x}/{y}"
+    tile = cache.get(key)
+    if tile is None:
+        tile = _render(z, x, y)
+        cache.set(key, tile, TILE_TTL)
+    return tile
@@ -0,0 +1,202 @@
+# abmci/services/engagement.py
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from event.models import ParticipationEvenement
+from fidele.models import Fidele, MemberEngagement
+
+# Fenêtres glissantes (jours)
+SHORT_WINDOW_DAYS = 28
+LONG_WINDOW_DAYS = 84
+# Décrochage : fidèle régulier (au moins DRIFT_MIN_ATTENDANCES présences sur 12 semaines) dont
+# les 4 dernières semaines sont inférieures à DRIFT_RATIO fois son rythme moyen sur 4 semaines
+DRIFT_MIN_ATTENDANCES = 3
+DRIFT_RATIO = 0.5
+FOLLOW_UP_LIMIT = 50
+FOLLOW_UP_MAX_LIMIT = 200
+
+_WINDOWS_PER_LONG = LONG_WINDOW_DAYS // SHORT_WINDOW_DAYS
+
+
+def is_drifting(attended_4w: int, attended_12w: int) -> bool:
+    """Même règle que _drift_sql (affichage d’une ligne modifiée en mémoire)."""
+    return attended_12w >= DRIFT_MIN_ATTENDANCES and attended_4w * _WINDOWS_PER_LONG < attended_12w * DRIFT_RATIO
+
+
+def _drift_sql(n4: str, n12: str) -> str:
+    # Constantes du module (entiers / flottant) : pas de paramètre utilisateur dans le SQL
+    return (f"({n12} >= {int(DRIFT_MIN_ATTENDANCES)} "
+            f"AND {n4} * {int(_WINDOWS_PER_LONG)} < {n12} * {float(DRIFT_RATIO)})")
+
+
+def _tables() -> dict:
+    qn = connection.ops.quote_name
+    return {
+        "engagement": qn(MemberEngagement._meta.db_table),
+        "participation": qn(ParticipationEvenement._meta.db_table),
+        "fidele": qn(Fidele._meta.db_table),
+    }
+
+
+def _require_postgres():
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Le calcul de l’assiduité nécessite PostgreSQL (fonctions de fenêtrage, ON CONFLICT).")
+
+
+# -------------------------------
+# Mise à jour incrémentale (chaque présence)
+# -------------------------------
+
+_RECORD_SQL = """
+INSERT INTO {engagement} AS e
+    (fidele_id, eglise_id, last_attended_at, attended_4w, attended_12w, drifting, computed_at)
+SELECT f.id, f.eglise_id, v.at, v.n4, v.n12, FALSE, %s
+FROM (VALUES {values}) AS v(fidele_id, at, n4, n12)
+JOIN {fidele} f ON f.id = v.fidele_id
+ON CONFLICT (fidele_id) DO UPDATE SET
+    eglise_id = EXCLUDED.eglise_id,
+    last_attended_at = GREATEST(e.last_attended_at, EXCLUDED.last_attended_at),
+    attended_4w = e.attended_4w + EXCLUDED.attended_4w,
+    attended_12w = e.attended_12w + EXCLUDED.attended_12w,
+    drifting = {drift},
+    computed_at = EXCLUDED.computed_at
+"""
+
+
+def record_attendances(rows: Iterable[Tuple[int, datetime]]) -> int:
+    """
+    Présences nouvellement enregistrées (fidele_id, date) : un INSERT … ON CONFLICT DO UPDATE
+    pour tout le lot (dernière présence, compteurs +1, drapeau de décrochage).
+    Les compteurs ne font qu’augmenter ici ; le glissement des fenêtres est fait par recompute().
+    """
+    if connection.vendor != "postgresql":
+        return 0
+    now = timezone.now()
+    since_4w = now - timedelta(days=SHORT_WINDOW_DAYS)
+    since_12w = now - timedelta(days=LONG_WINDOW_DAYS)
+
+    # Un fidèle par ligne (ON CONFLICT ne peut pas modifier deux fois la même ligne)
+    merged: Dict[int, list] = {}
+    for fidele_id, at in rows:
+        at = at or now
+        entry = merged.setdefault(fidele_id, [at, 0, 0])
+        entry[0] = max(entry[0], at)
+        entry[1] += at >= since_4w
+        entry[2] += at >= since_12w
+    if not merged:
+        return 0
+
+    params: list = [now]
+    for fidele_id, (at, n4, n12) in merged.items():
+        params += [fidele_id, at, n4, n12]
+    sql = _RECORD_SQL.format(
+        values=", ".join(["(%s::integer, %s::timestamptz, %s::integer, %s::integer)"] * len(merged)),
+        drift=_drift_sql("(e.attended_4w + EXCLUDED.attended_4w)", "(e.attended_12w + EXCLUDED.attended_12w)"),
+        **_tables(),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+# -------------------------------
+# Recalcul par lot (fenêtres glissantes)
+# -------------------------------
+
+# Une passe sur les présences : dernière présence (ROW_NUMBER) et présences dans chaque
+# fenêtre (COUNT … FILTER OVER) par fidèle, puis upsert de la ligne d’assiduité.
+_RECOMPUTE_SQL = """
+WITH ranked AS (
+    SELECT p.fidele_id,
+           p.date,
+           ROW_NUMBER() OVER latest AS rn,
+           COUNT(*) FILTER (WHERE p.date >= %(since_4w)s) OVER member AS n4,
+           COUNT(*) FILTER (WHERE p.date >= %(since_12w)s) OVER member AS n12
+    FROM {participation} p
+    {where}
+    WINDOW member AS (PARTITION BY p.fidele_id),
+           latest AS (PARTITION BY p.fidele_id ORDER BY p.date DESC)
+)
+INSERT INTO {engagement}
+    (fidele_id, eglise_id, last_attended_at, attended_4w, attended_12w, drifting, computed_at)
+SELECT r.fidele_id, f.eglise_id, r.date, r.n4, r.n12, COALESCE(f.is_deleted, 0) = 0 AND {drift}, %(now)s
+FROM ranked r
+JOIN {fidele} f ON f.id = r.fidele_id
+WHERE r.rn = 1
+ON CONFLICT (fidele_id) DO UPDATE SET
+    eglise_id = EXCLUDED.eglise_id,
+    last_attended_at = EXCLUDED.last_attended_at,
+    attended_4w = EXCLUDED.attended_4w,
+    attended_12w = EXCLUDED.attended_12w,
+    drifting = EXCLUDED.drifting,
+    computed_at = EXCLUDED.computed_at
+"""
+
+
+def recompute(fidele_ids: Optional[Iterable[int]] = None, *, log=None) -> dict:
+    """
+    Recalcule l’assiduité de tous les fidèles (tâche nocturne) ou de `fidele_ids`
+    (présence supprimée) : fenêtres glissantes à jour, église actuelle, décrochage.
+    Les fidèles sans aucune présence n’ont pas de ligne.
+    """
+    _require_postgres()
+    now = timezone.now()
+    params = {
+        "since_4w": now - timedelta(days=SHORT_WINDOW_DAYS),
+        "since_12w": now - timedelta(days=LONG_WINDOW_DAYS),
+        "now": now,
+    }
+    where = ""
+    if fidele_ids is not None:
+        params["ids"] = sorted({pk for pk in fidele_ids if pk})
+        if not params["ids"]:
+            return {"members": 0, "removed": 0, "drifting": None}
+        where = "WHERE p.fidele_id = ANY(%(ids)s)"
+
+    sql = _RECOMPUTE_SQL.format(where=where, drift=_drift_sql("r.n4", "r.n12"), **_tables())
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            members = cursor.rowcount
+        stale = MemberEngagement.objects.filter(computed_at__lt=now)
+        if fidele_ids is not None:
+            stale = stale.filter(fidele_id__in=params["ids"])
+        removed, _ = stale.delete()
+
+    drifting = MemberEngagement.objects.filter(drifting=True).count() if fidele_ids is None else None
+    if log:
+        log(f"  {members} fidèle(s) recalculé(s), {removed} ligne(s) supprimée(s), {drifting} à relancer")
+    return {"members": members, "removed": removed, "drifting": drifting}
+
+
+# -------------------------------
+# Lecture
+# -------------------------------
+
+def follow_up(eglise_id: Optional[int], *, limit: int = FOLLOW_UP_LIMIT,
+              after_id: Optional[int] = None) -> List[MemberEngagement]:
+    """
+    Fidèles à relancer d’une église, absents depuis le plus longtemps d’abord.
+    Pagination par clé (`after_id` = dernier fidèle de la page précédente) : parcours de
+    l’index partiel engagement_follow_up_idx, coût indépendant de la taille de l’église.
+    """
+    qs = (MemberEngagement.objects.filter(drifting=True, eglise_id=eglise_id)
+          .select_related("fidele__user")
+          .order_by("last_attended_at", "fidele_id"))
+    if after_id:
+        last_at = (MemberEngagement.objects.filter(fidele_id=after_id)
+                   .values_list("last_attended_at", flat=True).first())
+        if last_at is not None:
+            qs = qs.filter(Q(last_attended_at__gt=last_at) | Q(last_attended_at=last_at, fidele_id__gt=after_id))
+    # +1 : l’appelant demande une ligne de plus pour savoir s’il existe une page suivante
+    return list(qs[:max(1, min(int(limit), FOLLOW_UP_MAX_LIMIT + 1))])
+
+
+def for_member(fidele_id: int) -> Optional[MemberEngagement]:
+    return MemberEngagement.objects.filter(fidele_id=fidele_id).first()
@@ -0,0 +1,140 @@
+# abmci/services/event_stats.py
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional
+
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from event.models import Evenement, EvenementStats, ParticipationEvenement
+from fidele.models import Fidele
+
+
+def _active_fideles(eglise_id: int | None) -> int:
+    if not eglise_id:
+        return 0
+    return Fidele.objects.filter(eglise_id=eglise_id, is_deleted=0).count()
+
+
+def ensure_stats(event: Evenement) -> EvenementStats:
+    """Crée (ou recalcule) la ligne de statistiques d’un évènement — un agrégat et un COUNT indexés."""
+    agg = ParticipationEvenement.objects.filter(evenement_id=event.pk).aggregate(
+        participants=Count("id"),
+        scannes=Count("id", filter=Q(qr_code_scanned=True)),
+    )
+    stats, _ = EvenementStats.objects.update_or_create(
+        evenement_id=event.pk,
+        defaults={
+            "participants": agg["participants"] or 0,
+            "scannes": agg["scannes"] or 0,
+            "invites": _active_fideles(event.eglise_id),
+        },
+    )
+    return stats
+
+
+def refresh_invites(event: Evenement) -> None:
+    """Changement d’église : seul le nombre d’invités est recalculé (compteurs de présence intacts)."""
+    if not EvenementStats.objects.filter(evenement_id=event.pk).update(invites=_active_fideles(event.eglise_id)):
+        ensure_stats(event)
+
+
+# -------------------------------
+# Mises à jour incrémentales
+# -------------------------------
+
+def record_participations(evenement_id: int, created: int, scanned: int | None = None) -> None:
+    """
+    Ajoute `created` participations (négatif pour des suppressions) à l’évènement.
+    `scanned` : nombre d’entre elles marquées qr_code_scanned (par défaut = created).
+    """
+    if not created:
+        return
+    scanned = created if scanned is None else scanned
+    updated = EvenementStats.objects.filter(evenement_id=evenement_id).update(
+        participants=F("participants") + created,
+        scannes=F("scannes") + scanned,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        # Pas encore de ligne : on l’initialise depuis la base (contient déjà les nouvelles lignes)
+        event = Evenement.objects.filter(pk=evenement_id).only("pk", "eglise_id").first()
+        if event:
+            ensure_stats(event)
+
+
+def refresh_scanned(evenement_id: int) -> None:
+    """Recalcule le nombre de scans (cas rare : qr_code_scanned modifié après coup)."""
+    scannes = ParticipationEvenement.objects.filter(evenement_id=evenement_id, qr_code_scanned=True).count()
+    EvenementStats.objects.filter(evenement_id=evenement_id).update(scannes=scannes, updated_at=timezone.now())
+
+
+def shift_invites(eglise_id: int | None, delta: int) -> None:
+    """
+    Ajuste le nombre d’invités des évènements non terminés d’une église (un seul UPDATE) :
+    les évènements passés gardent le nombre d’invités (et le taux) qu’ils avaient.
+    """
+    if not eglise_id or not delta:
+        return
+    EvenementStats.objects.filter(evenement__eglise_id=eglise_id, evenement__date_fin__gte=timezone.now()).update(
+        invites=F("invites") + delta,
+        updated_at=timezone.now(),
+    )
+
+
+def fidele_invite_deltas(
+    old: Optional[tuple], new: Optional[tuple]
+) -> Dict[int, int]:
+    """
+    Calcule les variations d’invités par église à partir de l’état (eglise_id, is_deleted)
+    avant/après une écriture. None = fidèle inexistant (création/suppression).
+    """
+    deltas: Dict[int, int] = {}
+
+    def _active(state):
+        return bool(state and state[0] and not state[1])
+
+    if _active(old):
+        deltas[old[0]] = deltas.get(old[0], 0) - 1
+    if _active(new):
+        deltas[new[0]] = deltas.get(new[0], 0) + 1
+    return {k: v for k, v in deltas.items() if v}
+
+
+# -------------------------------
+# Recalcul complet (commande de maintenance)
+# -------------------------------
+
+def rebuild_stats(events: Iterable[Evenement] | None = None, batch_size: int = 1000) -> int:
+    """
+    Recalcule toutes les lignes en requêtes groupées :
+    un agrégat par évènement + un comptage par église, puis bulk upsert.
+    """
+    qs = Evenement.objects.all() if events is None else events
+    qs = qs.annotate(
+        nb_participants=Count("participationevenement"),
+        nb_scannes=Count("participationevenement", filter=Q(participationevenement__qr_code_scanned=True)),
+    ).values_list("pk", "eglise_id", "nb_participants", "nb_scannes")
+
+    invites_by_eglise = dict(
+        Fidele.objects.filter(is_deleted=0, eglise__isnull=False)
+        .values("eglise_id").annotate(c=Count("id")).values_list("eglise_id", "c")
+    )
+
+    rows = [
+        EvenementStats(
+            evenement_id=pk,
+            participants=nb_part,
+            scannes=nb_scan,
+            invites=invites_by_eglise.get(eglise_id, 0),
+        )
+        for pk, eglise_id, nb_part, nb_scan in qs.iterator(chunk_size=batch_size)
+    ]
+    EvenementStats.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["evenement"],
+        update_fields=["participants", "scannes", "invites", "updated_at"],
+    )
+    return len(rows)
@@ -0,0 +1,280 @@
+# abmci/services/exports.py
+from __future__ import annotations
+
+import csv
+import os
+import tempfile
+from typing import Callable, Dict, Iterator
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.utils import build_q_object_from_lookup_parameters, prepare_lookup_value
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from event.models import ParticipationEvenement
+from fidele.models import Donation, ExportJob, FidelePosition
+
+# Lignes lues par aller-retour du curseur serveur
+CHUNK_SIZE = 2000
+# Au-delà, l’export CSV part en tâche de fond (fichier téléchargeable)
+STREAM_MAX_ROWS = getattr(settings, "EXPORT_STREAM_MAX_ROWS", 50_000)
+
+
+def _dt(value) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+# -------------------------------
+# Définition des exports
+# -------------------------------
+
+def _participants_qs(params: dict):
+    return (ParticipationEvenement.objects
+            .filter(evenement_id__in=params.get("evenement_ids") or [])
+            .order_by("evenement__code", "-date")
+            .values_list("evenement__code", "evenement__titre", "fidele_id",
+                         "fidele__user__last_name", "fidele__user__first_name",
+                         "fidele__phone", "date", "qr_code_scanned"))
+
+
+def _participants_row(r) -> list:
+    code, titre, fidele_id, nom, prenom, phone, date, scanned = r
+    return [code, titre, fidele_id, nom or "", prenom or "", phone or "", _dt(date), "1" if scanned else "0"]
+
+
+def apply_selection(qs, params: dict):
+    """
+    Sélection d’une action d’admin : ids cochés, ou critères de la liste pour « tout
+    sélectionner » (filtres latéraux + recherche, relus tels que l’admin les applique).
+    """
+    if "ids" in params:
+        qs = qs.filter(pk__in=params["ids"])
+    lookups = params.get("lookups") or {}
+    if lookups:
+        qs = qs.filter(build_q_object_from_lookup_parameters({
+            key: [prepare_lookup_value(key, v) for v in values] for key, values in lookups.items()
+        }))
+    fields = params.get("search_fields") or []
+    for term in (params.get("search") or "").split() if fields else ():
+        q = Q()
+        for field in fields:
+            q |= Q(**{f"{field}__icontains": term})
+        qs = qs.filter(q)
+    return qs
+
+
+def _positions_qs(params: dict):
+    return (apply_selection(FidelePosition.objects.all(), params)
+            .order_by("-captured_at")
+            .values_list("fidele__user__first_name", "fidele__user__last_name",
+                         "latitude", "longitude", "accuracy", "captured_at", "source"))
+
+
+def _positions_row(r) -> list:
+    prenom, nom, lat, lon, accuracy, captured_at, source = r
+    return [f"{prenom or ''} {nom or ''}".strip(), lat, lon, "" if accuracy is None else accuracy,
+            _dt(captured_at), source]
+
+
+def filter_donations(qs, data):
+    """Filtres de la liste des dons (statut, catégorie id/code, période) — partagés avec l’export."""
+    status = (data.get("status") or "").strip()
+    category = (data.get("category") or "").strip()
+    date_from = parse_date(data.get("date_from") or "")
+    date_to = parse_date(data.get("date_to") or "")
+
+    if status:
+        qs = qs.filter(status=status)
+    if category:
+        if category.isdigit():
+            qs = qs.filter(category_id=int(category))
+        else:
+            qs = qs.filter(category__code=category)
+    if date_from:
+        qs = qs.filter(created_at__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__date__lte=date_to)
+    return qs
+
+
+def _donations_qs(params: dict):
+    qs = apply_selection(Donation.objects.all(), params)
+    if params.get("user_id"):
+        qs = qs.filter(user_id=params["user_id"])
+    qs = filter_donations(qs, params.get("filters") or {})
+    return (qs.order_by("-created_at")
+            .values_list("reference", "created_at", "paid_at", "amount", "currency",
+                         "category__name", "anonymous", "user__email", "user__first_name",
+                         "user__last_name", "payment_method", "recurrence", "status"))
+
+
+def _donations_row(r) -> list:
+    ref, created_at, paid_at, amount, currency, category, anonymous, email, prenom, nom, method, rec, status = r
+    donor = "" if anonymous else f"{prenom or ''} {nom or ''}".strip()
+    return [ref, _dt(created_at), _dt(paid_at), amount, currency, category, donor,
+            "" if anonymous else (email or ""), method, rec, status]
+
+
+EXPORTS: Dict[str, dict] = {
+    "participants": {
+        "filename": "participants_events",
+        "header": ["event_code", "event_title", "fidele_id", "fidele_nom", "fidele_prenom",
+                   "phone", "date_participation", "qr_code_scanned"],
+        "queryset": _participants_qs,
+        "row": _participants_row,
+    },
+    "positions": {
+        "filename": "positions",
+        "header": ["Fidèle", "Latitude", "Longitude", "Précision", "Date", "Source"],
+        "queryset": _positions_qs,
+        "row": _positions_row,
+    },
+    "donations": {
+        "filename": "donations",
+        "header": ["Référence", "Créé le", "Payé le", "Montant", "Devise", "Catégorie",
+                   "Donateur", "Email", "Moyen de paiement", "Récurrence", "Statut"],
+        "queryset": _donations_qs,
+        "row": _donations_row,
+    },
+}
+
+
+def iter_rows(kind: str, params: dict) -> Iterator[list]:
+    """Lignes de l’export, lues par curseur serveur (mémoire constante)."""
+    spec = EXPORTS[kind]
+    row: Callable = spec["row"]
+    for r in spec["queryset"](params).iterator(chunk_size=CHUNK_SIZE):
+        yield row(r)
+
+
+# -------------------------------
+# Écriture
+# -------------------------------
+
+class _Echo:
+    """Pseudo-fichier : csv.writer renvoie directement la ligne formatée."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(kind: str, params: dict) -> StreamingHttpResponse:
+    spec = EXPORTS[kind]
+    writer = csv.writer(_Echo())
+
+    def _lines():
+        yield writer.writerow(spec["header"])
+        for row in iter_rows(kind, params):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(_lines(), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{spec["filename"]}.csv"'
+    return response
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _write_csv(path: str, kind: str, params: dict) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(EXPORTS[kind]["header"])
+        for row in iter_rows(kind, params):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(path: str, kind: str, params: dict) -> int:
+    from openpyxl import Workbook  # dépendance optionnelle
+
+    wb = Workbook(write_only=True)  # écriture en flux, sans garder les cellules en mémoire
+    ws = wb.create_sheet(kind)
+    ws.append(EXPORTS[kind]["header"])
+    count = 0
+    for row in iter_rows(kind, params):
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+
+def run_job(job: ExportJob) -> ExportJob:
+    """Produit le fichier d’un ExportJob (appelé par la tâche Celery)."""
+    job.status = "running"
+    job.save(update_fields=["status"])
+
+    fd, path = tempfile.mkstemp(suffix=f".{job.format}")
+    os.close(fd)
+    try:
+        writer = _write_xlsx if job.format == "xlsx" else _write_csv
+        job.rows = writer(path, job.kind, job.params)
+        # Stockage privé, nom aléatoire (voir abmci.utils.storage) ; nom lisible au téléchargement
+        with open(path, "rb") as fh:
+            job.file.save(f"{job.kind}.{job.format}", File(fh), save=False)
+        job.status = "done"
+    except Exception as ex:
+        job.status = "failed"
+        job.error = str(ex)
+    finally:
+        os.remove(path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "rows", "file", "error", "finished_at"])
+    return job
+
+
+def download_name(job: ExportJob) -> str:
+    return f"{EXPORTS[job.kind]['filename']}_{job.finished_at or job.created_at:%Y%m%d_%H%M%S}.{job.format}"
+
+
+def download_url(job: ExportJob) -> str:
+    """URL de la vue de téléchargement (authentifiée), jamais celle du fichier."""
+    return reverse("export-download", args=[job.pk]) if job.file else ""
+
+
+# -------------------------------
+# Point d’entrée (vues / actions admin)
+# -------------------------------
+
+def enqueue(kind: str, params: dict, *, user=None, fmt: str = "csv") -> ExportJob:
+    from fidele.tasks import run_export_job
+
+    job = ExportJob.objects.create(user=user, kind=kind, format=fmt, params=params)
+    transaction.on_commit(lambda: run_export_job.delay(job.pk))
+    return job
+
+
+def export_response(request, kind: str, params: dict, *, fmt: str = "csv", total: int | None = None):
+    """
+    Export CSV en flux si raisonnable, sinon (ou en XLSX) tâche de fond.
+    Retourne la réponse à renvoyer, ou None si l’export a été mis en file
+    (un message est alors ajouté pour l’utilisateur).
+    """
+    if fmt == "xlsx" and not xlsx_available():
+        messages.error(request, "Export XLSX indisponible (openpyxl non installé).")
+        return None
+
+    if fmt == "csv":
+        total = EXPORTS[kind]["queryset"](params).count() if total is None else total
+        if total <= STREAM_MAX_ROWS:
+            return stream_csv(kind, params)
+
+    job = enqueue(kind, params, user=request.user, fmt=fmt)
+    messages.info(
+        request,
+        f"Export #{job.pk} lancé en arrière-plan ; le fichier sera disponible dans « Exports » "
+        f"et une notification vous sera envoyée.",
+    )
+    return None
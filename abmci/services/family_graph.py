@@ -0,0 +1,324 @@
+# abmci/services/family_graph.py
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from fidele.models import Fidele, FideleHousehold
+
+# Arbre généalogique : générations parcourues de part et d’autre du fidèle
+TREE_GENERATIONS = 2
+TREE_MAX_GENERATIONS = 6
+
+# Champs dont un changement modifie les foyers (suivis par les signaux et les écritures en masse)
+LINK_FIELDS = ("pere_id", "mere_id", "marie_a_id", "is_deleted")
+
+# Foyer (règle commune à la requête récursive et au recalcul complet) :
+#   - conjoints (marie_a, dans les deux sens) ;
+#   - parent ↔ enfant tant que l’enfant n’est pas marié (un enfant marié fonde son propre foyer) ;
+#   - frères / sœurs déclarés, tous deux non mariés.
+# Les fidèles supprimés (is_deleted) ne relient personne.
+_MARRIED = "({t}.marie_a_id IS NOT NULL OR EXISTS (SELECT 1 FROM {fidele} sp_{t} WHERE sp_{t}.marie_a_id = {t}.id))"
+
+_HOUSEHOLD_SQL = """
+WITH RECURSIVE foyer(id) AS (
+    SELECT %(id)s::integer
+    UNION
+    SELECT n.id
+    FROM foyer c
+    JOIN {fidele} me ON me.id = c.id
+    CROSS JOIN LATERAL (
+        SELECT me.marie_a_id
+        UNION ALL
+        SELECT s.id FROM {fidele} s WHERE s.marie_a_id = me.id
+        UNION ALL
+        SELECT p.id FROM {fidele} p WHERE p.id IN (me.pere_id, me.mere_id) AND NOT {me_married}
+        UNION ALL
+        SELECT k.id FROM {fidele} k WHERE (k.pere_id = me.id OR k.mere_id = me.id) AND NOT {k_married}
+        UNION ALL
+        SELECT k.id FROM {frere} b JOIN {fidele} k ON k.id = b.{to_col}
+        WHERE b.{from_col} = me.id AND NOT {me_married} AND NOT {k_married}
+        UNION ALL
+        SELECT k.id FROM {soeur} b JOIN {fidele} k ON k.id = b.{to_col}
+        WHERE b.{from_col} = me.id AND NOT {me_married} AND NOT {k_married}
+    ) n(id)
+    JOIN {fidele} nf ON nf.id = n.id AND COALESCE(nf.is_deleted, 0) = 0
+)
+SELECT id FROM foyer
+"""
+
+# Ascendants et descendants sur N générations (+ conjoints de chacun, frères et sœurs déclarés)
+_TREE_SQL = """
+WITH RECURSIVE
+up(id, gen, path) AS (
+    SELECT %(id)s::integer, 0, ARRAY[%(id)s::integer]
+    UNION ALL
+    SELECT p.id, up.gen - 1, up.path || p.id
+    FROM up
+    JOIN {fidele} c ON c.id = up.id
+    JOIN {fidele} p ON p.id = c.pere_id OR p.id = c.mere_id
+    WHERE up.gen > -%(generations)s AND p.id <> ALL(up.path)
+),
+down(id, gen, path) AS (
+    SELECT %(id)s::integer, 0, ARRAY[%(id)s::integer]
+    UNION ALL
+    SELECT k.id, down.gen + 1, down.path || k.id
+    FROM down
+    JOIN {fidele} k ON k.pere_id = down.id OR k.mere_id = down.id
+    WHERE down.gen < %(generations)s AND k.id <> ALL(down.path)
+),
+lineage AS (
+    SELECT id, gen FROM up
+    UNION
+    SELECT id, gen FROM down
+)
+SELECT DISTINCT ON (t.id) t.id, t.gen, t.relation
+FROM (
+    SELECT id, gen,
+           CASE WHEN gen < 0 THEN 'ancestor' WHEN gen > 0 THEN 'descendant' ELSE 'self' END AS relation,
+           0 AS prio
+    FROM lineage
+    UNION ALL
+    SELECT f.marie_a_id, l.gen, 'spouse', 1
+    FROM lineage l JOIN {fidele} f ON f.id = l.id
+    WHERE f.marie_a_id IS NOT NULL
+    UNION ALL
+    SELECT s.id, l.gen, 'spouse', 1
+    FROM lineage l JOIN {fidele} s ON s.marie_a_id = l.id
+    UNION ALL
+    SELECT b.{to_col}, 0, 'sibling', 2 FROM {frere} b WHERE b.{from_col} = %(id)s
+    UNION ALL
+    SELECT b.{to_col}, 0, 'sibling', 2 FROM {soeur} b WHERE b.{from_col} = %(id)s
+) t
+JOIN {fidele} f ON f.id = t.id
+WHERE COALESCE(f.is_deleted, 0) = 0 OR t.id = %(id)s
+ORDER BY t.id, t.prio, abs(t.gen)
+"""
+
+
+def _require_postgres():
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Le graphe familial nécessite PostgreSQL (requêtes récursives).")
+
+
+def _tables() -> dict:
+    qn = connection.ops.quote_name
+    through = Fidele.frere.through
+    fidele = qn(Fidele._meta.db_table)
+    return {
+        "fidele": fidele,
+        "frere": qn(Fidele.frere.through._meta.db_table),
+        "soeur": qn(Fidele.soeur.through._meta.db_table),
+        "from_col": qn(through._meta.get_field("from_fidele").column),
+        "to_col": qn(through._meta.get_field("to_fidele").column),
+        "me_married": _MARRIED.format(t="me", fidele=fidele),
+        "k_married": _MARRIED.format(t="k", fidele=fidele),
+    }
+
+
+# -------------------------------
+# Lecture directe (requête récursive)
+# -------------------------------
+
+def household_ids(fidele_id: int) -> Set[int]:
+    """Identifiants du foyer complet de `fidele_id` (lui compris), en une requête récursive."""
+    _require_postgres()
+    with connection.cursor() as cursor:
+        cursor.execute(_HOUSEHOLD_SQL.format(**_tables()), {"id": fidele_id})
+        return {row[0] for row in cursor.fetchall()}
+
+
+def tree(fidele_id: int, generations: int = TREE_GENERATIONS) -> List[dict]:
+    """
+    Arbre de `fidele_id` : ascendants (generation < 0), descendants (> 0), conjoints
+    et frères / sœurs, sur `generations` générations. Une requête récursive + une pour les noms.
+    """
+    _require_postgres()
+    generations = max(1, min(int(generations), TREE_MAX_GENERATIONS))
+    with connection.cursor() as cursor:
+        cursor.execute(_TREE_SQL.format(**_tables()), {"id": fidele_id, "generations": generations})
+        nodes = cursor.fetchall()
+
+    names = {
+        r["id"]: r
+        for r in Fidele.objects.filter(id__in=[n[0] for n in nodes])
+        .values("id", "slug", "sexe", "birthdate", "eglise_id", "user__first_name", "user__last_name")
+    }
+    out = []
+    for pk, gen, relation in nodes:
+        r = names.get(pk)
+        if r is None:
+            continue
+        out.append({
+            "id": pk,
+            "generation": gen,
+            "relation": relation,
+            "slug": r["slug"],
+            "first_name": r["user__first_name"],
+            "last_name": r["user__last_name"],
+            "sexe": r["sexe"],
+            "birthdate": r["birthdate"],
+            "eglise_id": r["eglise_id"],
+        })
+    out.sort(key=lambda n: (n["generation"], n["relation"], n["last_name"] or "", n["first_name"] or ""))
+    return out
+
+
+# -------------------------------
+# Table précalculée des foyers
+# -------------------------------
+
+def _components() -> Dict[int, List[int]]:
+    """Foyers de tous les fidèles (même règle que _HOUSEHOLD_SQL), par union-find en mémoire."""
+    rows = list(Fidele.objects.values_list("id", "pere_id", "mere_id", "marie_a_id", "is_deleted"))
+    alive = {pk for pk, _, _, _, deleted in rows if not deleted}
+    married = {pk for pk, _, _, spouse, _ in rows if spouse} | {spouse for _, _, _, spouse, _ in rows if spouse}
+
+    parent = {pk: pk for pk in alive}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        if a in alive and b in alive:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+    for pk, pere_id, mere_id, spouse, _ in rows:
+        if spouse:
+            union(pk, spouse)
+        if pk not in married:
+            for p in (pere_id, mere_id):
+                if p:
+                    union(pk, p)
+    for rel in (Fidele.frere, Fidele.soeur):
+        for a, b in rel.through.objects.values_list("from_fidele_id", "to_fidele_id"):
+            if a not in married and b not in married:
+                union(a, b)
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for pk in alive:
+        groups[find(pk)].append(pk)
+    return groups
+
+
+def _household_rows(members: Iterable[int]) -> List[FideleHousehold]:
+    members = sorted(members)
+    key = members[0]
+    return [FideleHousehold(fidele_id=pk, household_key=key, size=len(members)) for pk in members]
+
+
+def rebuild(*, log=None) -> dict:
+    """Recalcul complet de la table des foyers (une transaction)."""
+    groups = _components()
+    rows = [row for members in groups.values() for row in _household_rows(members)]
+    with transaction.atomic():
+        FideleHousehold.objects.all().delete()
+        FideleHousehold.objects.bulk_create(rows, batch_size=2000)
+    result = {"members": len(rows), "households": len(groups),
+              "families": sum(1 for m in groups.values() if len(m) > 1)}
+    if log:
+        log(f"  {result['households']} foyer(s), dont {result['families']} de plusieurs personnes")
+    return result
+
+
+def refresh_for(fidele_ids: Iterable[int]) -> int:
+    """
+    Recalcul incrémental après un changement de liens (signaux) : foyers actuels des fidèles
+    donnés et anciens foyers dont ils faisaient partie (séparation, décès, suppression).
+    """
+    fidele_ids = {pk for pk in fidele_ids if pk}
+    if not fidele_ids:
+        return 0
+    old_keys = (FideleHousehold.objects.filter(fidele_id__in=fidele_ids)
+                .values_list("household_key", flat=True))
+    affected = fidele_ids | set(FideleHousehold.objects.filter(household_key__in=list(old_keys))
+                                .values_list("fidele_id", flat=True))
+    alive = set(Fidele.objects.filter(id__in=affected, is_deleted=0).values_list("id", flat=True))
+
+    seen: Set[int] = set()
+    rows: List[FideleHousehold] = []
+    for pk in sorted(alive):
+        if pk in seen:
+            continue
+        members = household_ids(pk)
+        seen |= members
+        rows.extend(_household_rows(members))
+
+    with transaction.atomic():
+        FideleHousehold.objects.filter(fidele_id__in=affected | seen).delete()
+        FideleHousehold.objects.bulk_create(rows)
+    return len(rows)
+
+
+def add_singletons(fidele_ids: Iterable[int]) -> int:
+    """Fidèles créés sans lien familial : foyer d’une personne, sans requête récursive."""
+    rows = [FideleHousehold(fidele_id=pk, household_key=pk, size=1) for pk in fidele_ids]
+    FideleHousehold.objects.bulk_create(rows, batch_size=2000, ignore_conflicts=True)
+    return len(rows)
+
+
+def household(fidele_id: int) -> List[Fidele]:
+    """Membres du foyer (table précalculée ; requête récursive si le fidèle n’y figure pas encore)."""
+    key = (FideleHousehold.objects.filter(fidele_id=fidele_id)
+           .values_list("household_key", flat=True).first())
+    qs = Fidele.objects.select_related("user")
+    if key is not None:
+        qs = qs.filter(household__household_key=key)
+    else:
+        qs = qs.filter(id__in=household_ids(fidele_id))
+    return list(qs.filter(is_deleted=0).order_by(F("birthdate").asc(nulls_last=True), "id"))
+
+
+def households(*, eglise_id: Optional[int] = None, fidele_ids: Optional[Iterable[int]] = None,
+               members_eglise_id: Optional[int] = None, min_size: int = 1,
+               offset: int = 0, limit: int = 200) -> dict:
+    """
+    Foyers complets (publipostage, visites) : ceux qui comptent un fidèle de `eglise_id`
+    et/ou un des `fidele_ids`. Une requête pour les clés, une pour les membres.
+    `members_eglise_id` limite les membres listés à une église (comptes non staff).
+    """
+    anchors = FideleHousehold.objects.filter(size__gte=min_size)
+    if eglise_id:
+        anchors = anchors.filter(fidele__eglise_id=eglise_id)
+    if fidele_ids is not None:
+        anchors = anchors.filter(fidele_id__in=list(fidele_ids))
+    keys_qs = anchors.order_by("household_key").values_list("household_key", flat=True).distinct()
+    count = keys_qs.count()
+    keys = list(keys_qs[offset:offset + limit])
+
+    members = (FideleHousehold.objects.filter(household_key__in=keys, fidele__is_deleted=0)
+               .order_by("household_key", F("fidele__birthdate").asc(nulls_last=True), "fidele_id")
+               .values("household_key", "size", "fidele_id", "fidele__slug", "fidele__phone",
+                       "fidele__eglise_id", "fidele__birthdate", "fidele__location__name",
+                       "fidele__user__first_name", "fidele__user__last_name", "fidele__user__email"))
+    if members_eglise_id:
+        members = members.filter(fidele__eglise_id=members_eglise_id)
+
+    grouped: Dict[int, dict] = {}
+    for m in members:
+        h = grouped.setdefault(m["household_key"], {
+            "household": m["household_key"], "size": m["size"], "contact": None, "members": [],
+        })
+        member = {
+            "id": m["fidele_id"],
+            "slug": m["fidele__slug"],
+            "first_name": m["fidele__user__first_name"],
+            "last_name": m["fidele__user__last_name"],
+            "email": m["fidele__user__email"] or None,
+            "phone": str(m["fidele__phone"]) if m["fidele__phone"] else None,
+            "eglise_id": m["fidele__eglise_id"],
+            "location": m["fidele__location__name"],
+        }
+        h["members"].append(member)
+        # Contact du foyer : le plus âgé joignable
+        if h["contact"] is None and (member["phone"] or member["email"]):
+            h["contact"] = member["id"]
+    return {"count": count, "results": [grouped[k] for k in keys if k in grouped]}
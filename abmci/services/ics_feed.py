@@ -0,0 +1,245 @@
+# abmci/services/ics_feed.py
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from event.models import Evenement
+
+# Rendu d’une église en cache : la clé contient l’horodatage de dernière modification,
+# donc aucune invalidation explicite n’est nécessaire (les anciennes clés expirent).
+FEED_TTL = 6 * 60 * 60
+# Les évènements passés restent quelques jours dans le flux (pas de disparition brutale)
+PAST_DAYS = 7
+
+MEMBER_SALT = "abmci.ics.member"
+
+_BYDAY = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+# -------------------------------
+# Dernière modification (par église)
+# -------------------------------
+
+def _mtime_key(eglise_id: int | None) -> str:
+    return f"ics:mtime:{eglise_id or 'all'}"
+
+
+def mark_modified(eglise_id: int | None) -> None:
+    """Appelé à chaque écriture d’un évènement (signaux)."""
+    cache.set(_mtime_key(eglise_id), int(timezone.now().timestamp()), None)
+
+
+def last_modified(eglise_id: int | None) -> int:
+    """Horodatage (s) de la dernière modification d’un évènement de l’église."""
+    key = _mtime_key(eglise_id)
+    ts = cache.get(key)
+    if ts is None:
+        latest = Evenement.objects.filter(eglise_id=eglise_id).aggregate(m=Max("updated_at"))["m"]
+        ts = int((latest or timezone.now()).timestamp())
+        cache.add(key, ts, None)
+    return int(ts)
+
+
+# -------------------------------
+# Format iCalendar (RFC 5545)
+# -------------------------------
+
+def _escape(text: str | None) -> str:
+    return ((text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """Pliage des lignes à 75 octets (continuation : CRLF + espace)."""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, current = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(current) + len(b) > (75 if not parts else 74):
+            parts.append(current.decode("utf-8"))
+            current = b""
+        current += b
+    parts.append(current.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def _utc(value: dt.datetime) -> str:
+    return value.astimezone(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def rrule_for(event: Evenement) -> Optional[str]:
+    """
+    Convertit recurrence_rule (“WEEKLY:SU,WE”, “MONTHLY:”, “DAILY:”…) en RRULE iCalendar,
+    bornée par end_recurrence (1 an par défaut, comme generate_events).
+    """
+    if not event.is_recurrent or not event.recurrence_rule:
+        return None
+    freq, _, days = event.recurrence_rule.partition(":")
+    freq = freq.strip().upper()
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY"):
+        freq = "DAILY"
+    until = event.end_recurrence or (event.date_debut + dt.timedelta(days=365))
+    parts = [f"FREQ={freq}"]
+    if freq == "WEEKLY":
+        byday = [d for d in _BYDAY if d in days.upper()]
+        if byday:
+            parts.append("BYDAY=" + ",".join(byday))
+    parts.append(f"UNTIL={_utc(until)}")
+    return ";".join(parts)
+
+
+def _vevent(ev: Evenement, stamp: str) -> List[str]:
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{ev.code}@abmci",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_utc(ev.date_debut)}",
+        f"DTEND:{_utc(ev.date_fin)}",
+        f"SUMMARY:{_escape(ev.titre)}",
+        f"LOCATION:{_escape(ev.lieu)}",
+        f"DESCRIPTION:{_escape(ev.description)}",
+    ]
+    if ev.type_id:
+        lines.append(f"CATEGORIES:{_escape(ev.type.name)}")
+    rule = rrule_for(ev)
+    if rule:
+        lines.append(f"RRULE:{rule}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def _calendar(name: str, vevents: Iterable[str]) -> str:
+    head = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//ABMCI//Events//FR",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+        "X-PUBLISHED-TTL:PT1H",
+    ]
+    return "\r\n".join(head + list(vevents) + ["END:VCALENDAR"]) + "\r\n"
+
+
+# -------------------------------
+# Sélection des évènements
+# -------------------------------
+
+def _feed_queryset():
+    since = timezone.now() - dt.timedelta(days=PAST_DAYS)
+    return (Evenement.objects.select_related("type")
+            .filter(Q(date_fin__gte=since)
+                    | Q(is_recurrent=True, end_recurrence__isnull=True)
+                    | Q(is_recurrent=True, end_recurrence__gte=since))
+            .order_by("date_debut", "id"))
+
+
+def _drop_materialised_occurrences(events: List[Evenement]) -> List[Evenement]:
+    """
+    Les occurrences générées depuis l’admin (copies) sont déjà couvertes par la RRULE
+    de la série : on ne les publie pas deux fois.
+    """
+    series = [e for e in events if rrule_for(e)]
+    if not series:
+        return events
+    covered = set()
+    for master in series:
+        try:
+            occurrences = master.generate_events()
+        except ValueError:  # règle mal formée : generate_events attend “FREQ:JOURS”
+            continue
+        for occ in occurrences:
+            covered.add((master.titre, occ.date_debut))
+    return [e for e in events if rrule_for(e) or (e.titre, e.date_debut) not in covered]
+
+
+def _render_vevents(events: List[Evenement]) -> str:
+    stamp = _utc(timezone.now())
+    lines: List[str] = []
+    for ev in _drop_materialised_occurrences(events):
+        lines.extend(_vevent(ev, stamp))
+    return "\r\n".join(_fold(line) for line in lines)
+
+
+def _church_vevents(eglise_id: int) -> Tuple[str, int]:
+    """Bloc VEVENT d’une église, mis en cache par (église, dernière modification, jour)."""
+    mtime = last_modified(eglise_id)
+    key = f"ics:feed:{eglise_id}:{mtime}:{timezone.localdate():%Y%m%d}"
+    block = cache.get(key)
+    if block is None:
+        block = _render_vevents(list(_feed_queryset().filter(eglise_id=eglise_id)))
+        cache.set(key, block, FEED_TTL)
+    return block, mtime
+
+
+def _effective_mtime(mtime: int) -> int:
+    # Le contenu change aussi au changement de jour (fenêtre glissante des évènements passés)
+    today = timezone.make_aware(dt.datetime.combine(timezone.localdate(), dt.time.min))
+    return max(mtime, int(today.timestamp()))
+
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.md5(":".join(str(p) for p in parts).encode("utf-8")).hexdigest() + '"'
+
+
+def event_calendar(event: Evenement) -> str:
+    """ICS d’un seul évènement (téléchargement depuis la fiche)."""
+    stamp = _utc(timezone.now())
+    return _calendar(event.titre, ["\r\n".join(_fold(line) for line in _vevent(event, stamp))])
+
+
+def church_feed(eglise) -> Tuple[str, str, int]:
+    """(contenu ICS, ETag, Last-Modified en secondes) pour une église."""
+    block, mtime = _church_vevents(eglise.pk)
+    body = _calendar(eglise.name, [block] if block else [])
+    return body, _etag("eglise", eglise.pk, mtime, timezone.localdate()), _effective_mtime(mtime)
+
+
+def member_feed(fidele) -> Tuple[str, str, int]:
+    """
+    Flux d’un fidèle : évènements de son église (bloc en cache)
+    + évènements d’autres églises auxquels il est inscrit.
+    """
+    blocks, mtimes = [], []
+    if fidele.eglise_id:
+        block, mtime = _church_vevents(fidele.eglise_id)
+        blocks.append(block)
+        mtimes.append(mtime)
+
+    extra = list(_feed_queryset()
+                 .filter(participationevenement__fidele_id=fidele.pk)
+                 .exclude(eglise_id=fidele.eglise_id)
+                 .distinct())
+    if extra:
+        blocks.append(_render_vevents(extra))
+        mtimes.extend(last_modified(e.eglise_id) for e in extra)
+
+    mtime = max(mtimes) if mtimes else int(timezone.now().timestamp())
+    body = _calendar("ABMCI — Mes évènements", [b for b in blocks if b])
+    etag = _etag("fidele", fidele.pk, fidele.eglise_id, mtime, sorted(e.pk for e in extra), timezone.localdate())
+    return body, etag, _effective_mtime(mtime)
+
+
+# -------------------------------
+# Jeton d’abonnement (les applis calendrier ne s’authentifient pas)
+# -------------------------------
+
+def member_token(fidele_id: int) -> str:
+    return signing.Signer(salt=MEMBER_SALT).sign(str(fidele_id))
+
+
+def fidele_id_from_token(token: str) -> Optional[int]:
+    try:
+        return int(signing.Signer(salt=MEMBER_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
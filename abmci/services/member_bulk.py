@@ -0,0 +1,202 @@
+# abmci/services/member_bulk.py
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.db import transaction
+from django.utils.text import slugify
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from abmci.services import event_stats, family_graph, member_stats
+from abmci.services.member_search import search_text_for
+from fidele.models import Fidele
+
+BATCH_SIZE = 500
+# Champs dont dépend Fidele.search_text (les noms sont sur User : voir signals.create_fidele)
+SEARCH_FIELDS = {"phone"}
+
+
+# -------------------------------
+# Effets de bord (équivalents des signaux post_save de Fidele)
+# -------------------------------
+
+def _collect_side_effects(objs: Sequence[Fidele], *, created: bool) -> dict:
+    """
+    Regroupe ce que les signaux feraient ligne par ligne : variations d’invités par église,
+    églises dont les statistiques changent, foyers à recalculer, églises à affecter.
+    L’état précédent est celui mémorisé au chargement (post_init).
+    """
+    invites: Counter = Counter()
+    eglise_ids, family_ids, singletons, assign_ids = set(), set(), set(), []
+
+    for f in objs:
+        new_state = (f.eglise_id, f.is_deleted)
+        old_state = None if created else getattr(f, "_invite_state", None)
+        if created or old_state is not None:
+            for eglise_id, delta in event_stats.fidele_invite_deltas(old_state, new_state).items():
+                invites[eglise_id] += delta
+        f._invite_state = new_state
+
+        eglise_ids |= {getattr(f, "_stats_eglise_id", None), f.eglise_id}
+        f._stats_eglise_id = f.eglise_id
+
+        links = tuple(f.__dict__.get(name) for name in family_graph.LINK_FIELDS)
+        previous = () if created else (getattr(f, "_family_links", None) or ())
+        if created and not any(links[:3]):
+            singletons.add(f.pk)
+        elif previous != links:
+            family_ids |= {f.pk, *previous[:3], *links[:3]}
+        f._family_links = links
+
+        if created and not f.eglise_id:
+            assign_ids.append(f.pk)
+
+    return {
+        "invites": {str(k): v for k, v in invites.items() if k and v},
+        "eglise_ids": sorted(e for e in eglise_ids if e),
+        "family_ids": sorted(pk for pk in family_ids if pk),
+        "singletons": sorted(singletons),
+        "assign_ids": assign_ids,
+    }
+
+
+def apply_side_effects(payload: dict) -> dict:
+    """Exécute en une fois les effets de bord d’une écriture en masse (tâche Celery)."""
+    from abmci.services.nearest_church import assign_nearest_eglise_if_missing
+
+    for eglise_id, delta in payload.get("invites", {}).items():
+        event_stats.shift_invites(int(eglise_id), delta)
+    member_stats.bump_version(*payload.get("eglise_ids", ()))
+
+    if payload.get("singletons"):
+        family_graph.add_singletons(payload["singletons"])
+    if payload.get("family_ids"):
+        family_graph.refresh_for(payload["family_ids"])
+
+    assigned = 0
+    if payload.get("assign_ids"):
+        for f in (Fidele.objects.filter(pk__in=payload["assign_ids"], eglise__isnull=True)
+                  .select_related("location")):
+            assigned += assign_nearest_eglise_if_missing(f, max_radius_km=50)
+    return {"assigned": assigned}
+
+
+def _merge(payloads: Iterable[dict]) -> dict:
+    invites: Counter = Counter()
+    merged = {"eglise_ids": set(), "family_ids": set(), "singletons": set(), "assign_ids": []}
+    for p in payloads:
+        invites.update(p["invites"])
+        for key in ("eglise_ids", "family_ids", "singletons"):
+            merged[key].update(p[key])
+        merged["assign_ids"].extend(p["assign_ids"])
+    return {
+        "invites": {k: v for k, v in invites.items() if v},
+        **{key: sorted(merged[key]) for key in ("eglise_ids", "family_ids", "singletons")},
+        "assign_ids": merged["assign_ids"],
+    }
+
+
+def _defer(payload: dict, run_now: bool) -> None:
+    if run_now:
+        apply_side_effects(payload)
+        return
+    from fidele.tasks import apply_member_side_effects_task
+
+    transaction.on_commit(lambda: apply_member_side_effects_task.delay(payload))
+
+
+def defer_side_effects(payloads: Iterable[dict], *, run_now: bool = False) -> None:
+    """Une seule tâche pour les effets de bord collectés sur plusieurs lots (voir `side_effects`)."""
+    payloads = list(payloads)
+    if payloads:
+        _defer(_merge(payloads), run_now)
+
+
+# -------------------------------
+# Écritures en masse
+# -------------------------------
+
+def _prepare(f: Fidele, *, search: bool = True) -> None:
+    # Équivalent de Fidele.save() (slug, texte de recherche)
+    f.slug = slugify(f.qlook_id)
+    if search:
+        f.search_text = search_text_for(f)
+
+
+def bulk_create_members(objs: Iterable[Fidele], *, user=None, reason: Optional[str] = None,
+                        batch_size: int = BATCH_SIZE, run_side_effects_now: bool = False,
+                        side_effects: Optional[list] = None) -> List[Fidele]:
+    """
+    Crée des fidèles par lots : slug et texte de recherche calculés ici, historique
+    (simple_history) écrit par bulk_create, effets de bord différés dans une seule tâche.
+    Les `user` des fidèles doivent déjà exister (noms utilisés pour la recherche).
+    `side_effects` (liste) : effets de bord collectés pour l’appelant, qui les lance
+    ensuite avec defer_side_effects (imports en plusieurs lots).
+    """
+    objs = list(objs)
+    for f in objs:
+        _prepare(f)
+    with transaction.atomic():
+        created = bulk_create_with_history(
+            objs, Fidele, batch_size=batch_size, default_user=user, default_change_reason=reason,
+        )
+        payload = _collect_side_effects(created, created=True)
+        if side_effects is not None:
+            side_effects.append(payload)
+        else:
+            _defer(payload, run_side_effects_now)
+    return created
+
+
+def _update(objs: List[Fidele], fields: List[str], *, user, reason, batch_size) -> dict:
+    search = bool(SEARCH_FIELDS & set(fields))
+    for f in objs:
+        _prepare(f, search=search)
+    fields = list(dict.fromkeys([*fields, "slug", *(["search_text"] if search else [])]))
+    bulk_update_with_history(
+        objs, Fidele, fields, batch_size=batch_size, default_user=user, default_change_reason=reason,
+    )
+    return _collect_side_effects(objs, created=False)
+
+
+def bulk_update_members(objs: Iterable[Fidele], fields: Iterable[str], *, user=None,
+                        reason: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                        run_side_effects_now: bool = False) -> int:
+    """
+    Met à jour `fields` sur des fidèles chargés puis modifiés en mémoire : un UPDATE par lot,
+    une ligne d’historique par fidèle (bulk_create), effets de bord dans une seule tâche.
+    """
+    objs = list(objs)
+    fields = list(dict.fromkeys(fields))
+    if not objs or not fields:
+        return 0
+    with transaction.atomic():
+        payload = _update(objs, fields, user=user, reason=reason, batch_size=batch_size)
+        _defer(payload, run_side_effects_now)
+    return len(objs)
+
+
+def bulk_set(queryset, values: Dict[str, object], *, user=None, reason: Optional[str] = None,
+             batch_size: int = BATCH_SIZE, run_side_effects_now: bool = False) -> int:
+    """
+    Affecte `values` à tous les fidèles de `queryset` (transfert d’église, changement de statut…)
+    par lots de `batch_size`, sans save() individuel ; une seule tâche d’effets de bord.
+    """
+    fields = list(values)
+    qs = queryset.select_related("user").order_by("pk")
+    payloads, total, last_pk = [], 0, 0
+    with transaction.atomic():
+        while True:
+            # Pagination par clé : le filtre peut porter sur un champ modifié (ex. ancienne église)
+            batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for f in batch:
+                for name, value in values.items():
+                    setattr(f, name, value)
+            payloads.append(_update(batch, fields, user=user, reason=reason, batch_size=batch_size))
+            total += len(batch)
+            last_pk = batch[-1].pk
+        defer_side_effects(payloads, run_now=run_side_effects_now)
+    return total
@@ -0,0 +1,401 @@
+# abmci/services/member_dedupe.py
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from abmci.services import engagement, family_graph
+from abmci.services.member_search import normalize
+from abmci.utils.phones import phone_key
+from fidele.models import DuplicateCandidate, Fidele, FideleHousehold
+
+# Au-delà, un bloc (nom très courant, numéro partagé par une structure…) ne discrimine plus rien :
+# il est ignoré, ce qui garde la génération de paires quasi linéaire.
+MAX_BLOCK_SIZE = 25
+MIN_SCORE = 0.6
+CHUNK_SIZE = 5000
+
+# Poids des critères ; le total est borné à 1
+WEIGHTS = {
+    "telephone": 0.4,
+    "email": 0.3,
+    "naissance": 0.2,
+    "nom": 0.4,          # × similarité des noms (0..1)
+    "phonetique": 0.1,
+    "eglise": 0.05,
+}
+# Critères contradictoires : deux personnes distinctes d’une même famille partagent souvent nom et téléphone
+PENALTIES = {
+    "naissance_differente": 0.3,
+    "sexe_different": 0.3,
+}
+
+# Champs copiés du doublon vers le fidèle conservé quand ils y sont vides
+MERGE_SKIP_FIELDS = {"id", "user", "qlook_id", "slug", "search_text", "created_at", "is_deleted", "sortie",
+                     "firebase_uid"}
+
+
+# -------------------------------
+# Clés phonétiques
+# -------------------------------
+
+_PHONETIC_RULES = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"gn"), "n"),
+    (re.compile(r"qu|ck|q"), "k"),
+    (re.compile(r"ou"), "u"),
+    (re.compile(r"[cs]h"), "s"),
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"c"), "k"),
+    (re.compile(r"g(?=[eiy])"), "j"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"w"), "u"),
+    (re.compile(r"y"), "i"),
+    (re.compile(r"h"), ""),
+]
+_VOWELS = re.compile(r"[aeiou]")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+def phonetic(word: str) -> str:
+    """
+    Code phonétique d’un mot (soundex adapté au français et aux noms ivoiriens) :
+    « Kouassi », « Kwasi » et « Couassy » donnent le même code.
+    """
+    word = normalize(word).replace(" ", "")
+    if not word:
+        return ""
+    for pattern, repl in _PHONETIC_RULES:
+        word = pattern.sub(repl, word)
+    word = _REPEATS.sub(r"\1", word)
+    if not word:
+        return ""
+    head, tail = word[0], _VOWELS.sub("", word[1:])
+    return _REPEATS.sub(r"\1", head + tail)[:6]
+
+
+def name_codes(first_name: str | None, last_name: str | None) -> Tuple[str, ...]:
+    """Codes phonétiques triés des mots du nom complet (insensible à l’inversion nom / prénom)."""
+    words = normalize(f"{first_name or ''} {last_name or ''}").split()
+    return tuple(sorted(c for c in (phonetic(w) for w in words if len(w) > 1) if c))
+
+
+# -------------------------------
+# Détection
+# -------------------------------
+
+@dataclass
+class _Member:
+    id: int
+    name: str
+    codes: Tuple[str, ...]
+    phone: Optional[str]
+    email: Optional[str]
+    birthdate: object
+    sexe: Optional[str]
+    eglise_id: Optional[int]
+    relatives: Set[int] = field(default_factory=set)
+
+
+@dataclass
+class Candidate:
+    fidele_a: int
+    fidele_b: int
+    score: float
+    reasons: List[str]
+
+
+def _members(eglise_id: Optional[int]) -> Iterator[_Member]:
+    qs = Fidele.objects.filter(is_deleted=0)
+    if eglise_id:
+        qs = qs.filter(eglise_id=eglise_id)
+    rows = qs.values_list("id", "user__first_name", "user__last_name", "user__email", "phone", "birthdate",
+                          "sexe", "eglise_id", "marie_a_id", "pere_id", "mere_id")
+    for pk, first, last, email, phone, birthdate, sexe, eglise, spouse, father, mother in \
+            rows.iterator(chunk_size=CHUNK_SIZE):
+        yield _Member(
+            id=pk,
+            name=" ".join(sorted(normalize(f"{first or ''} {last or ''}").split())),
+            codes=name_codes(first, last),
+            phone=phone_key(phone),
+            email=(email or "").strip().lower() or None,
+            birthdate=birthdate,
+            sexe=sexe or None,
+            eglise_id=eglise,
+            relatives={r for r in (spouse, father, mother) if r},
+        )
+
+
+def _blocking_keys(m: _Member) -> Iterator[str]:
+    if m.phone:
+        yield f"tel:{m.phone}"
+    if m.email:
+        yield f"email:{m.email}"
+    if m.codes:
+        yield "nom:" + " ".join(m.codes)
+    if m.birthdate:
+        for code in set(m.codes):
+            yield f"naiss:{m.birthdate.isoformat()}:{code}"
+
+
+def score_pair(a: _Member, b: _Member) -> Tuple[float, List[str]]:
+    score, reasons = 0.0, []
+    if a.phone and a.phone == b.phone:
+        score += WEIGHTS["telephone"]
+        reasons.append("telephone")
+    if a.email and a.email == b.email:
+        score += WEIGHTS["email"]
+        reasons.append("email")
+    if a.birthdate and b.birthdate:
+        if a.birthdate == b.birthdate:
+            score += WEIGHTS["naissance"]
+            reasons.append("naissance")
+        else:
+            score -= PENALTIES["naissance_differente"]
+    if a.sexe and b.sexe and a.sexe != b.sexe:
+        score -= PENALTIES["sexe_different"]
+    if a.name and b.name:
+        similarity = SequenceMatcher(None, a.name, b.name).ratio()
+        score += WEIGHTS["nom"] * similarity
+        if similarity >= 0.85:
+            reasons.append("nom")
+    if a.codes and a.codes == b.codes:
+        score += WEIGHTS["phonetique"]
+        reasons.append("phonetique")
+    if a.eglise_id and a.eglise_id == b.eglise_id:
+        score += WEIGHTS["eglise"]
+    return round(max(0.0, min(score, 1.0)), 3), reasons
+
+
+def find_candidates(*, eglise_id: Optional[int] = None, min_score: float = MIN_SCORE) -> List[Candidate]:
+    """
+    Paires probables parmi les fidèles (d’une église ou de toutes) : regroupement par clés
+    de blocage (téléphone E.164, e-mail, codes phonétiques du nom, date de naissance + nom),
+    puis score des seules paires d’un même bloc, sans comparaison de tous les fidèles deux à deux.
+    """
+    members: Dict[int, _Member] = {}
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for m in _members(eglise_id):
+        members[m.id] = m
+        for key in _blocking_keys(m):
+            blocks[key].append(m.id)
+
+    pairs: Set[Tuple[int, int]] = set()
+    for ids in blocks.values():
+        if 1 < len(ids) <= MAX_BLOCK_SIZE:
+            pairs.update(combinations(sorted(ids), 2))
+
+    out: List[Candidate] = []
+    for a_id, b_id in pairs:
+        a, b = members[a_id], members[b_id]
+        # Conjoints, parent / enfant : personnes liées, donc distinctes
+        if b_id in a.relatives or a_id in b.relatives:
+            continue
+        score, reasons = score_pair(a, b)
+        if score >= min_score:
+            out.append(Candidate(a_id, b_id, score, reasons))
+    out.sort(key=lambda c: (-c.score, c.fidele_a, c.fidele_b))
+    return out
+
+
+def refresh_candidates(*, eglise_id: Optional[int] = None, min_score: float = MIN_SCORE, log=None) -> dict:
+    """
+    Recalcule la table des doublons probables : paires trouvées insérées ou mises à jour
+    (une paire écartée le reste), paires en attente qui ne ressortent plus supprimées.
+    """
+    started = timezone.now()
+    found = find_candidates(eglise_id=eglise_id, min_score=min_score)
+    rows = [DuplicateCandidate(fidele_a_id=c.fidele_a, fidele_b_id=c.fidele_b, score=c.score,
+                               reasons=c.reasons) for c in found]
+    with transaction.atomic():
+        DuplicateCandidate.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True,
+            unique_fields=["fidele_a", "fidele_b"], update_fields=["score", "reasons", "updated_at"],
+        )
+        stale = DuplicateCandidate.objects.filter(status="pending", updated_at__lt=started)
+        if eglise_id:
+            stale = stale.filter(fidele_a__eglise_id=eglise_id, fidele_b__eglise_id=eglise_id)
+        removed, _ = stale.delete()
+    if log:
+        log(f"  {len(found)} paire(s) probable(s), {removed} paire(s) obsolète(s) supprimée(s)")
+    return {"candidates": len(found), "removed": removed}
+
+
+# -------------------------------
+# Fusion
+# -------------------------------
+
+def _unique_sets(model) -> List[Tuple[str, ...]]:
+    opts = model._meta
+    sets = [tuple(s) for s in opts.unique_together]
+    sets += [tuple(c.fields) for c in opts.constraints
+             if isinstance(c, models.UniqueConstraint) and c.fields and c.condition is None]
+    return sets
+
+
+def _relations(model, skip_models=()) -> Iterator[Tuple[type, models.Field]]:
+    """Clés étrangères pointant vers `model`, y compris tables M2M et historiques (relations cachées)."""
+    for rel in model._meta.get_fields(include_hidden=True):
+        if not (rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one)):
+            continue
+        related = rel.related_model
+        if related in skip_models or not related._meta.managed or related._meta.proxy:
+            continue
+        yield related, rel.field
+
+
+def _repoint(model, keep, dup, *, skip_models=(), skip_fields=()) -> Dict[str, int]:
+    """
+    Fait pointer vers `keep` toutes les lignes qui référencent `dup`, un UPDATE par relation.
+    Les lignes qui violeraient une contrainte d’unicité (déjà présentes pour `keep`) sont supprimées.
+    """
+    moved: Dict[str, int] = {}
+    for related, fk in _relations(model, skip_models):
+        if fk in skip_fields:
+            continue
+        manager = related._base_manager
+        name = fk.name
+        rows = manager.filter(**{name: dup.pk})
+        if fk.unique:
+            # OneToOne : la ligne de `keep` prévaut, celle du doublon partira avec lui
+            if manager.filter(**{name: keep.pk}).exists():
+                continue
+        else:
+            for fields in _unique_sets(related):
+                if name not in fields:
+                    continue
+                others = [f for f in fields if f != name]
+                clash = manager.filter(**{name: keep.pk}, **{f: OuterRef(f) for f in others})
+                rows.filter(Exists(clash)).delete()
+        count = rows.update(**{name: keep.pk})
+        if count:
+            moved[f"{related._meta.label}.{name}"] = count
+    return moved
+
+
+def _clear_self_links(keep: Fidele) -> None:
+    """Liens de `keep` vers lui-même créés par la fusion (doublon conjoint, frère…)."""
+    for f in Fidele._meta.concrete_fields:
+        if f.is_relation and f.related_model is Fidele:
+            Fidele.objects.filter(pk=keep.pk, **{f.attname: keep.pk}).update(**{f.attname: None})
+    for m2m in Fidele._meta.many_to_many:
+        if m2m.related_model is Fidele:
+            through = m2m.remote_field.through
+            through.objects.filter(**{m2m.m2m_field_name(): keep.pk,
+                                      m2m.m2m_reverse_field_name(): keep.pk}).delete()
+
+
+def _blank(value) -> bool:
+    return value is None or value == "" or (hasattr(value, "name") and not value)
+
+
+def _fill_blanks(keep: Fidele, dup: Fidele, keep_user: User, dup_user: User) -> List[str]:
+    """Complète les champs vides de `keep` (et de son compte) avec ceux du doublon."""
+    filled = []
+    for f in Fidele._meta.concrete_fields:
+        if f.name in MERGE_SKIP_FIELDS:
+            continue
+        value = getattr(dup, f.attname)
+        if f.is_relation and f.related_model is Fidele and value in (keep.pk, dup.pk):
+            continue
+        if _blank(getattr(keep, f.attname)) and not _blank(value):
+            setattr(keep, f.attname, value)
+            filled.append(f.name)
+    for name in ("first_name", "last_name", "email"):
+        if not getattr(keep_user, name) and getattr(dup_user, name):
+            setattr(keep_user, name, getattr(dup_user, name))
+            filled.append(f"user.{name}")
+    return filled
+
+
+class MergeRefused(ValueError):
+    """Fusion refusée : elle supprimerait un compte protégé."""
+
+
+def _refresh_engagement(fidele_id: int) -> None:
+    # Participations du doublon reprises par UPDATE (sans signal) et sa ligne d’assiduité
+    # supprimée en cascade : compteurs du fidèle conservé recalculés
+    try:
+        engagement.recompute([fidele_id])
+    except Exception as e:
+        # Rattrapé par le recalcul nocturne
+        print(f"[dedupe] engagement.recompute error: {e!r}")
+
+
+def merge(keep_id: int, dup_id: int, *, user=None) -> dict:
+    """
+    Fusionne le fidèle `dup_id` dans `keep_id` : toutes les références (participations,
+    prières, dons, notes, sacrements, liens familiaux, historique…) vers le doublon et vers
+    son compte passent au fidèle conservé par UPDATE groupés, les champs vides sont complétés,
+    puis le doublon et son compte sont supprimés. Une seule transaction.
+    MergeRefused si le compte du doublon est staff / superutilisateur ou celui de `user`.
+    """
+    if keep_id == dup_id:
+        raise ValueError("Un fidèle ne peut pas être fusionné avec lui-même.")
+
+    with transaction.atomic():
+        locked = {f.pk: f for f in Fidele.objects.select_for_update().select_related("user")
+                  .filter(pk__in=[keep_id, dup_id]).order_by("pk")}
+        if len(locked) != 2:
+            raise Fidele.DoesNotExist("Fidèle introuvable.")
+        keep, dup = locked[keep_id], locked[dup_id]
+        keep_user, dup_user = keep.user, dup.user
+        # Le compte du doublon est supprimé : jamais un compte d’administration ni celui du demandeur
+        if dup_user.is_staff or dup_user.is_superuser or (user is not None and dup_user.pk == user.pk):
+            raise MergeRefused(
+                f"Le compte du fidèle {dup.pk} ne peut pas être supprimé (administrateur ou demandeur) : "
+                f"conservez ce fidèle plutôt que le {keep.pk}."
+            )
+
+        affected = {keep.pk, dup.pk}
+        keys = FideleHousehold.objects.filter(fidele_id__in=affected).values_list("household_key", flat=True)
+        affected |= set(FideleHousehold.objects.filter(household_key__in=list(keys))
+                        .values_list("fidele_id", flat=True))
+
+        moved = _repoint(Fidele, keep, dup, skip_models=(DuplicateCandidate, FideleHousehold))
+        moved.update(_repoint(User, keep_user, dup_user, skip_fields=(Fidele._meta.get_field("user"),)))
+        history = Fidele.history.model.objects.filter(id=dup.pk).update(id=keep.pk)
+        if history:
+            moved[f"{Fidele.history.model._meta.label}.id"] = history
+        _clear_self_links(keep)
+
+        keep.refresh_from_db()
+        filled = _fill_blanks(keep, dup, keep_user, dup_user)
+        if not keep.firebase_uid and dup.firebase_uid:
+            keep.firebase_uid = dup.firebase_uid
+            filled.append("firebase_uid")
+
+        if user is not None:
+            keep._history_user = dup._history_user = user
+        dup._change_reason = f"Fusion dans le fidèle {keep.pk}"
+        dup.delete()
+        dup_user.delete()
+
+        keep._change_reason = f"Fusion du fidèle {dup_id}"
+        keep_user.save()
+        keep.save()
+        transaction.on_commit(lambda: family_graph.refresh_for(affected))
+        transaction.on_commit(lambda: _refresh_engagement(keep_id))
+
+    return {"kept": keep_id, "merged": dup_id, "moved": moved, "filled": filled}
+
+
+def scoped_candidates(user):
+    """Paires visibles par `user` : toutes pour le staff, sinon celles dont les deux fidèles sont de son église."""
+    qs = DuplicateCandidate.objects.select_related("fidele_a__user", "fidele_b__user")
+    if user.is_staff:
+        return qs
+    eglise_id = getattr(getattr(user, "fidele", None), "eglise_id", None)
+    if not eglise_id:
+        return qs.none()
+    return qs.filter(fidele_a__eglise_id=eglise_id, fidele_b__eglise_id=eglise_id)
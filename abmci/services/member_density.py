@@ -0,0 +1,173 @@
+# abmci/services/member_density.py
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from django.contrib.gis.geos import Polygon
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from fidele.models import Eglise, Fidele, FideleLastPosition, MemberDensityCell
+
+# Zooms précalculés ; une requête est servie par le plus grand zoom stocké ≤ zoom demandé
+ZOOMS: Tuple[int, ...] = (5, 7, 9, 11, 13)
+# Cellules par côté de tuile : au zoom 11, une cellule fait ~2,4 km
+CELLS_PER_TILE = 8
+# Au-delà, un fidèle est compté comme « éloigné » (pistes d’implantation)
+FAR_DISTANCE_M = 10_000.0
+# Dernières positions plus anciennes ignorées
+MAX_POSITION_AGE_DAYS = 180
+# Cellules de moins de MIN_CELL_MEMBERS fidèles non exposées (confidentialité)
+MIN_CELL_MEMBERS = 3
+KNN_CANDIDATES = 5
+
+_MERCATOR_HALF = 20037508.342789244
+_MERCATOR_MAX_LAT = 85.05112878
+
+# Fidèles géolocalisés + distance à l’église la plus proche (KNN `<->`, re-classement géographique).
+# Calculé une fois par exécution, puis agrégé pour chaque zoom.
+_MEMBERS_SQL = """
+CREATE TEMP TABLE tmp_density_members ON COMMIT DROP AS
+SELECT ST_X(m.g) AS mx, ST_Y(m.g) AS my, d.dist
+FROM (
+    SELECT lp.point, ST_Transform(lp.point, 3857) AS g
+    FROM {last} lp
+    JOIN {fidele} f ON f.id = lp.fidele_id
+    WHERE COALESCE(f.is_deleted, 0) = 0
+      AND lp.captured_at >= %(cutoff)s
+      AND ST_Y(lp.point) BETWEEN -%(max_lat)s AND %(max_lat)s
+) m
+LEFT JOIN LATERAL (
+    SELECT ST_Distance(c.location::geography, m.point::geography) AS dist
+    FROM (
+        SELECT eg.location
+        FROM {eglise} eg
+        WHERE eg.location IS NOT NULL
+        ORDER BY eg.location <-> m.point
+        LIMIT %(candidates)s
+    ) c
+    ORDER BY 1
+    LIMIT 1
+) d ON true
+"""
+
+_CELLS_SQL = """
+INSERT INTO {cell} (zoom, cell_x, cell_y, center, members,
+                    dist_avg_m, dist_median_m, dist_max_m, far_members, computed_at)
+SELECT %(zoom)s, t.cx, t.cy,
+       ST_Transform(ST_SetSRID(ST_MakePoint(
+           -%(half)s + (t.cx + 0.5) * %(cell_m)s,
+           %(half)s - (t.cy + 0.5) * %(cell_m)s), 3857), 4326),
+       count(*),
+       avg(t.dist),
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY t.dist),
+       max(t.dist),
+       count(*) FILTER (WHERE t.dist IS NULL OR t.dist > %(far)s),
+       %(now)s
+FROM (
+    SELECT floor((mx + %(half)s) / %(cell_m)s)::int AS cx,
+           floor((%(half)s - my) / %(cell_m)s)::int AS cy,
+           dist
+    FROM tmp_density_members
+) t
+GROUP BY t.cx, t.cy
+"""
+
+
+def cell_size_m(zoom: int) -> float:
+    return 2 * _MERCATOR_HALF / (2 ** zoom) / CELLS_PER_TILE
+
+
+def compute(zooms: Sequence[int] = ZOOMS, *, max_age_days: int = MAX_POSITION_AGE_DAYS,
+            far_distance_m: float = FAR_DISTANCE_M, log=None) -> dict:
+    """
+    Recalcule la grille de densité pour chaque zoom (une transaction : les lecteurs voient
+    l’ancienne grille jusqu’au COMMIT). Ne lit que FideleLastPosition, jamais l’historique brut.
+    """
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Le calcul de densité nécessite PostgreSQL/PostGIS.")
+
+    qn = connection.ops.quote_name
+    members_sql = _MEMBERS_SQL.format(
+        last=qn(FideleLastPosition._meta.db_table),
+        fidele=qn(Fidele._meta.db_table),
+        eglise=qn(Eglise._meta.db_table),
+    )
+    cells_sql = _CELLS_SQL.format(cell=qn(MemberDensityCell._meta.db_table))
+    now = timezone.now()
+    started = time.perf_counter()
+    counts = {}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(members_sql, {
+            "cutoff": now - timedelta(days=max_age_days),
+            "max_lat": _MERCATOR_MAX_LAT,
+            "candidates": KNN_CANDIDATES,
+        })
+        MemberDensityCell.objects.filter(zoom__in=zooms).delete()
+        for zoom in zooms:
+            cursor.execute(cells_sql, {
+                "zoom": zoom, "half": _MERCATOR_HALF, "cell_m": cell_size_m(zoom),
+                "far": far_distance_m, "now": now,
+            })
+            counts[zoom] = cursor.rowcount
+            if log:
+                log(f"  zoom {zoom} : {cursor.rowcount} cellule(s)")
+
+    return {"cells": counts, "seconds": round(time.perf_counter() - started, 2)}
+
+
+# -------------------------------
+# Lecture (tableau de bord)
+# -------------------------------
+
+def stored_zoom(zoom: int) -> int:
+    """Plus grand zoom précalculé ≤ `zoom` (le plus petit sinon)."""
+    lower = [z for z in ZOOMS if z <= zoom]
+    return max(lower) if lower else min(ZOOMS)
+
+
+def last_computed_at(zoom: int):
+    return MemberDensityCell.objects.filter(zoom=zoom).aggregate(m=Max("computed_at"))["m"]
+
+
+def cells(zoom: int, bbox: Optional[Tuple[float, float, float, float]] = None) -> List[dict]:
+    """Cellules précalculées du zoom, éventuellement limitées à bbox (ouest, sud, est, nord)."""
+    qs = MemberDensityCell.objects.filter(zoom=zoom)
+    if bbox:
+        qs = qs.filter(center__within=Polygon.from_bbox(bbox))
+    return [
+        {
+            "lat": c.center.y,
+            "lon": c.center.x,
+            "members": c.members,
+            "far_members": c.far_members,
+            "dist_avg_m": c.dist_avg_m,
+            "dist_median_m": c.dist_median_m,
+            "dist_max_m": c.dist_max_m,
+        }
+        for c in qs.order_by("cell_y", "cell_x")
+    ]
+
+
+def summary(rows: List[dict]) -> dict:
+    """Statistiques de distance agrégées depuis les cellules (moyenne pondérée par effectif)."""
+    members = sum(r["members"] for r in rows)
+    with_dist = [r for r in rows if r["dist_avg_m"] is not None]
+    weight = sum(r["members"] for r in with_dist)
+    far = sum(r["far_members"] for r in rows)
+    return {
+        "members": members,
+        "cells": len(rows),
+        "dist_avg_m": (sum(r["dist_avg_m"] * r["members"] for r in with_dist) / weight) if weight else None,
+        "dist_max_m": max((r["dist_max_m"] for r in with_dist), default=None),
+        "far_members": far,
+        "far_share": (far / members) if members else 0.0,
+    }
+
+
+def public_cells(rows: List[dict]) -> List[dict]:
+    return [r for r in rows if r["members"] >= MIN_CELL_MEMBERS]
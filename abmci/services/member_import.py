@@ -0,0 +1,364 @@
+# abmci/services/member_import.py
+from __future__ import annotations
+
+import codecs
+import csv
+import re
+import time
+import unicodedata
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
+from phonenumber_field.phonenumber import PhoneNumber
+from phonenumbers import NumberParseException
+
+from abmci.services import member_bulk
+from fidele.models import BAPTEME_CHOICES, Fidele, ImportJob, MARITAL_CHOICES, UserProfileCompletion, qlook
+
+# Lignes validées puis insérées par transaction
+CHUNK_SIZE = 1000
+# Erreurs détaillées conservées sur le job (le compteur reste exact au-delà)
+MAX_REPORTED_ERRORS = 1000
+PHONE_REGION = "CI"
+
+# Colonne canonique → en-têtes acceptés (comparés sans accents, casse ni ponctuation)
+COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "last_name": ("nom", "last_name", "nom_de_famille"),
+    "first_name": ("prenom", "prenoms", "first_name"),
+    "email": ("email", "mail", "e_mail", "adresse_mail"),
+    "phone": ("telephone", "tel", "phone", "contact", "mobile"),
+    "birthdate": ("date_naissance", "date_de_naissance", "naissance", "birthdate"),
+    "sexe": ("sexe", "genre", "sex"),
+    "situation_matrimoniale": ("situation_matrimoniale", "situation", "etat_civil"),
+    "date_entree": ("date_entree", "date_d_entree", "entree"),
+    "date_bapteme": ("date_bapteme", "date_de_bapteme", "bapteme"),
+    "type_bapteme": ("type_bapteme", "type_de_bapteme"),
+    "profession": ("profession", "metier"),
+    "entreprise": ("entreprise", "employeur"),
+    "nationalite": ("nationalite",),
+}
+REQUIRED_ONE_OF = ("last_name", "first_name")
+
+_SEXES = {"h": "Homme", "m": "Homme", "homme": "Homme", "masculin": "Homme",
+          "f": "Femme", "femme": "Femme", "feminin": "Femme"}
+_MARITAL = {k.strip().lower(): k for k, _ in MARITAL_CHOICES}
+_MARITAL.update({"marie": "MARIE", "mariee": "MARIE", "celibataire": "CELIBATAIRE", "veuf": "VEUF ",
+                 "veuve": "VEUF "})
+_BAPTEME = {k.lower(): k for k, _ in BAPTEME_CHOICES}
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def _key(text) -> str:
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub("_", text).strip("_")
+
+
+_HEADER_MAP = {alias: column for column, aliases in COLUMNS.items() for alias in aliases}
+
+
+# -------------------------------
+# Lecture en flux
+# -------------------------------
+
+def _map_header(header) -> List[Optional[str]]:
+    return [_HEADER_MAP.get(_key(h)) for h in header]
+
+
+def _iter_csv(fh) -> Iterator[list]:
+    text = codecs.getreader("utf-8-sig")(fh, errors="replace")
+    first = text.readline()
+    # Séparateur le plus fréquent de l’en-tête (exports Excel français : « ; »)
+    delimiter = max((";", ",", "\t"), key=first.count)
+    yield next(csv.reader([first], delimiter=delimiter))
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def _iter_xlsx(fh) -> Iterator[list]:
+    from openpyxl import load_workbook  # dépendance optionnelle
+
+    wb = load_workbook(fh, read_only=True, data_only=True)  # lecture en flux
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_records(fh, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """(n° de ligne du fichier, {colonne canonique: valeur brute}) ; lignes vides ignorées."""
+    rows = _iter_xlsx(fh) if fmt == "xlsx" else _iter_csv(fh)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _map_header(header)
+    if not any(c in columns for c in REQUIRED_ONE_OF):
+        raise ValueError("En-tête sans colonne « nom » ni « prénom ».")
+    for line, row in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in row):
+            continue
+        yield line, {c: v for c, v in zip(columns, row) if c}
+
+
+# -------------------------------
+# Validation
+# -------------------------------
+
+def _text(value, max_length: int) -> str:
+    return str(value).strip()[:max_length] if value not in (None, "") else ""
+
+
+def _date(value) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError("date invalide (attendu AAAA-MM-JJ ou JJ/MM/AAAA)")
+
+
+def _choice(value, mapping: dict, label: str) -> Optional[str]:
+    if value in (None, ""):
+        return None
+    found = mapping.get(_key(value).replace("_", " ")) or mapping.get(_key(value).replace("_", ""))
+    if found is None:
+        raise ValueError(f"{label} inconnu : {value}")
+    return found
+
+
+def _phone(value) -> Optional[PhoneNumber]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, float):
+        value = f"{value:.0f}"  # cellule numérique Excel
+    try:
+        phone = PhoneNumber.from_string(str(value).strip(), region=PHONE_REGION)
+    except NumberParseException:
+        phone = None
+    if phone is None or not phone.is_valid():
+        raise ValueError("numéro de téléphone invalide")
+    return phone
+
+
+def clean_record(raw: dict) -> Tuple[dict, dict]:
+    """(valeurs nettoyées, erreurs par colonne) pour une ligne."""
+    data, errors = {}, {}
+    data["last_name"] = _text(raw.get("last_name"), 150)
+    data["first_name"] = _text(raw.get("first_name"), 150)
+    if not (data["last_name"] or data["first_name"]):
+        errors["nom"] = "nom ou prénom requis"
+
+    email = _text(raw.get("email"), 254).lower()
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors["email"] = "adresse invalide"
+    data["email"] = email
+
+    checks = (
+        ("phone", _phone),
+        ("birthdate", _date),
+        ("date_entree", _date),
+        ("date_bapteme", _date),
+        ("sexe", lambda v: _choice(v, _SEXES, "sexe")),
+        ("situation_matrimoniale", lambda v: _choice(v, _MARITAL, "situation")),
+        ("type_bapteme", lambda v: _choice(v, _BAPTEME, "type de baptême")),
+    )
+    for column, parse in checks:
+        try:
+            data[column] = parse(raw.get(column))
+        except ValueError as exc:
+            errors[column] = str(exc)
+    for column, max_length in (("profession", 270), ("entreprise", 270), ("nationalite", 70)):
+        data[column] = _text(raw.get(column), max_length) or None
+    return data, errors
+
+
+# -------------------------------
+# Insertion par lots
+# -------------------------------
+
+def _unique_usernames(chunk: List[dict]) -> None:
+    """Identifiant = e-mail, sinon prenom.nom ; collisions (base ou fichier) suffixées."""
+    for rec in chunk:
+        base = rec["email"] or slugify(f"{rec['first_name']}.{rec['last_name']}").replace("-", ".") or "fidele"
+        rec["username"] = base[:140]
+    taken = set(User.objects.filter(username__in=[r["username"] for r in chunk])
+                .values_list("username", flat=True))
+    for rec in chunk:
+        while rec["username"] in taken:
+            rec["username"] = f"{rec['username'][:140]}.{get_random_string(5).lower()}"
+        taken.add(rec["username"])
+
+
+def _unique_qlook_ids(count: int) -> List[str]:
+    """Identifiants qlook sans collision (l’espace aléatoire de qlook() est petit pour un import massif)."""
+    ids: set = set()
+    while len(ids) < count:
+        candidates = {qlook() for _ in range(count - len(ids))} - ids
+        candidates -= set(Fidele.objects.filter(qlook_id__in=candidates).values_list("qlook_id", flat=True))
+        ids |= candidates
+    return list(ids)
+
+
+def _insert(chunk: List[dict], *, eglise_id, user) -> int:
+    _unique_usernames(chunk)
+    password = make_password(None)  # mot de passe inutilisable : réinitialisation par e-mail
+    today = timezone.localdate()
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=r["username"], email=r["email"], first_name=r["first_name"],
+                 last_name=r["last_name"], password=password)
+            for r in chunk
+        ])
+        fideles = [
+            Fidele(
+                user=u, qlook_id=q, eglise_id=eglise_id,
+                phone=r["phone"], birthdate=r["birthdate"], sexe=r["sexe"],
+                situation_matrimoniale=r["situation_matrimoniale"],
+                date_entree=r["date_entree"] or today, date_bapteme=r["date_bapteme"],
+                type_bapteme=r["type_bapteme"], profession=r["profession"],
+                entreprise=r["entreprise"], nationalite=r["nationalite"],
+            )
+            for u, q, r in zip(users, _unique_qlook_ids(len(chunk)), chunk)
+        ]
+        # Effets de bord du lot programmés au commit de sa transaction : un import interrompu
+        # plus loin les applique quand même aux fidèles déjà enregistrés
+        member_bulk.bulk_create_members(fideles, user=user, reason="import")
+        UserProfileCompletion.objects.bulk_create([UserProfileCompletion(user=u) for u in users])
+    return len(users)
+
+
+def run_import(fh, fmt: str, *, eglise_id=None, user=None, dry_run: bool = False,
+               chunk_size: int = CHUNK_SIZE, on_chunk=None) -> dict:
+    """
+    Lit le fichier en flux, valide et insère par lots de `chunk_size` (une transaction par lot ;
+    une ligne invalide n’empêche pas les autres). Sans signal par ligne : les effets de bord
+    (statistiques, invités, foyers, église la plus proche) partent dans une tâche par lot.
+    """
+    started = time.perf_counter()
+    result = {"rows": 0, "created": 0, "failed": 0, "errors": []}
+    seen_emails = set()
+
+    def report(line, errors):
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"row": line, "errors": errors})
+
+    def insert(rows) -> int:
+        # Lot refusé par la base : coupé en deux jusqu’à isoler les lignes fautives
+        try:
+            return _insert([rec for _, rec in rows], eglise_id=eglise_id, user=user)
+        except Exception as exc:
+            if len(rows) == 1:
+                report(rows[0][0], {"ligne": f"non enregistrée : {exc}"})
+                return 0
+            middle = len(rows) // 2
+            return insert(rows[:middle]) + insert(rows[middle:])
+
+    def flush(chunk):
+        if not chunk:
+            return
+        # Doublons avec la base : une requête par lot, sur l’e-mail (identifiant de connexion).
+        # Le téléphone n’est pas unique (conjoints, enfants partagent souvent un numéro).
+        emails = {r["email"] for _, r in chunk if r["email"]}
+        existing_emails = set(
+            User.objects.annotate(email_lower=Lower("email")).filter(email_lower__in=emails)
+            .values_list("email_lower", flat=True)
+        ) if emails else set()
+
+        valid = []
+        for line, rec in chunk:
+            if rec["email"] in existing_emails:
+                report(line, {"email": "déjà utilisée par un compte existant"})
+            else:
+                valid.append((line, rec))
+        if valid and not dry_run:
+            result["created"] += insert(valid)
+        elif valid:
+            result["created"] += len(valid)
+        if on_chunk:
+            on_chunk(result)
+
+    chunk: List[Tuple[int, dict]] = []
+    for line, raw in iter_records(fh, fmt):
+        result["rows"] += 1
+        rec, errors = clean_record(raw)
+        # Doublons à l’intérieur du fichier
+        if not errors and rec["email"]:
+            if rec["email"] in seen_emails:
+                errors["email"] = "en double dans le fichier"
+            seen_emails.add(rec["email"])
+        if errors:
+            report(line, errors)
+            continue
+        chunk.append((line, rec))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    result["rows_per_minute"] = int(result["rows"] / max(result["seconds"], 1e-6) * 60)
+    return result
+
+
+# -------------------------------
+# Job (endpoint → tâche Celery)
+# -------------------------------
+
+def format_for(filename: str) -> str:
+    return "xlsx" if filename.lower().endswith((".xlsx", ".xlsm")) else "csv"
+
+
+def enqueue(upload, *, user=None, eglise_id=None, dry_run: bool = False) -> ImportJob:
+    from fidele.tasks import run_import_job
+
+    job = ImportJob.objects.create(user=user, eglise_id=eglise_id, format=format_for(upload.name),
+                                   file=upload, dry_run=dry_run)
+    transaction.on_commit(lambda: run_import_job.delay(job.pk))
+    return job
+
+
+def run_job(job: ImportJob) -> ImportJob:
+    """Traite un ImportJob (appelé par la tâche Celery) ; progression enregistrée à chaque lot."""
+    job.status = "running"
+    job.save(update_fields=["status"])
+
+    def progress(result):
+        ImportJob.objects.filter(pk=job.pk).update(rows=result["rows"], created=result["created"],
+                                                   failed=result["failed"])
+
+    try:
+        with job.file.open("rb") as fh:
+            result = run_import(fh, job.format, eglise_id=job.eglise_id, user=job.user,
+                                dry_run=job.dry_run, on_chunk=progress)
+        job.rows, job.created, job.failed = result["rows"], result["created"], result["failed"]
+        job.errors = result["errors"]
+        job.status = "done"
+    except Exception as ex:
+        job.status = "failed"
+        job.error = str(ex)
+    # Fichier d’origine non conservé : le rapport (compteurs, erreurs par ligne) suffit
+    job.file.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "rows", "created", "failed", "errors", "error", "file", "finished_at"])
+    return job
@@ -0,0 +1,109 @@
+# abmci/services/member_search.py
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# En dessous de 3 caractères les trigrammes ne filtrent rien : recherche par préfixe (index btree)
+TRIGRAM_MIN_LENGTH = 3
+MIN_QUERY_LENGTH = 2
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 50
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_NON_DIGIT = re.compile(r"\D+")
+
+
+def normalize(text: str | None) -> str:
+    """Minuscules, sans accents ni ponctuation, espaces simples (même règle à l’écriture et à la lecture)."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def _phone_digits(phone) -> List[str]:
+    """Chiffres du numéro international et du numéro national (recherche « 0701… » ou « 2250701… »)."""
+    if not phone:
+        return []
+    out = [_NON_DIGIT.sub("", str(phone))]
+    national = getattr(phone, "national_number", None)
+    if national:
+        out.append(str(national))
+    return [d for d in dict.fromkeys(out) if d]
+
+
+def search_text_for(fidele, user=None) -> str:
+    """Texte indexé d’un fidèle : nom, prénom, identifiant qlook et chiffres du téléphone."""
+    user = user or fidele.user
+    parts = [
+        normalize(user.last_name),
+        normalize(user.first_name),
+        normalize(fidele.qlook_id),
+        *_phone_digits(fidele.phone),
+    ]
+    return " ".join(p for p in parts if p)
+
+
+def normalize_query(q: str | None) -> str:
+    q = (q or "").strip()
+    digits = _NON_DIGIT.sub("", q)
+    # Saisie d’un numéro (« +225 07 01 … ») : on ne garde que les chiffres
+    if digits and len(digits) >= len(_NON_ALNUM.sub("", q.lower())) * 0.6:
+        return digits
+    return normalize(q)
+
+
+def filter_queryset(queryset, q: str | None):
+    """
+    Filtre `queryset` (fidèles) sur la recherche : LIKE '%terme%' servi par l’index trigramme
+    de `search_text` pour chaque mot, préfixe pour les saisies courtes.
+    """
+    term = normalize_query(q)
+    if not term:
+        return queryset
+    if len(term) < TRIGRAM_MIN_LENGTH:
+        return queryset.filter(search_text__startswith=term)
+    for word in term.split():
+        queryset = queryset.filter(search_text__contains=word)
+    return queryset
+
+
+def typeahead(queryset, q: str | None, limit: int = TYPEAHEAD_LIMIT) -> List[dict]:
+    """Top-N des fidèles de `queryset` (déjà limité à l’église) pour la saisie `q`."""
+    term = normalize_query(q)
+    if len(term) < MIN_QUERY_LENGTH:
+        return []
+    limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+    qs = filter_queryset(queryset, term)
+    if len(term) >= TRIGRAM_MIN_LENGTH:
+        qs = qs.annotate(score=TrigramWordSimilarity(term, "search_text")).order_by("-score", "search_text")
+    else:
+        qs = qs.order_by("search_text")
+    rows = qs.values("id", "slug", "qlook_id", "phone", "eglise_id", "user__first_name", "user__last_name")
+    return [
+        {
+            "id": r["id"],
+            "slug": r["slug"],
+            "qlook_id": r["qlook_id"],
+            "first_name": r["user__first_name"],
+            "last_name": r["user__last_name"],
+            "phone": str(r["phone"]) if r["phone"] else None,
+            "eglise_id": r["eglise_id"],
+        }
+        for r in rows[:limit]
+    ]
+
+
+def ensure_extension(using: str = DEFAULT_DB_ALIAS) -> None:
+    """pg_trgm requis par l’index GIN de search_text (appelé avant les migrations)."""
+    conn = connections[using]
+    if conn.vendor != "postgresql":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
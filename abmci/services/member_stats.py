@@ -0,0 +1,135 @@
+# abmci/services/member_stats.py
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from fidele.models import Fidele
+
+# Sécurité : même sans invalidation (UPDATE en masse oublié), les chiffres se rafraîchissent
+STATS_TTL = 10 * 60
+VERSION_TTL = 30 * 24 * 60 * 60
+
+NEW_MEMBER_DAYS = 21
+# (libellé, âge min inclus, âge max exclu) — années de 365 jours, comme l’ancien calcul
+AGE_BUCKETS = (
+    ("0-17", 0, 18),
+    ("18-25", 18, 26),
+    ("26-35", 26, 36),
+    ("36-50", 36, 51),
+    ("50+", 51, None),
+)
+# Valeurs historiques ('M'/'F') et valeurs des choix actuels
+MALE_VALUES = ("M", "Homme")
+FEMALE_VALUES = ("F", "Femme")
+
+
+# -------------------------------
+# Invalidation par version
+# -------------------------------
+
+def _scope(eglise_id: int | None) -> str:
+    return str(eglise_id) if eglise_id else "all"
+
+
+def _version_key(eglise_id: int | None) -> str:
+    return f"fidelestats:v:{_scope(eglise_id)}"
+
+
+def _get_version(eglise_id: int | None) -> int:
+    key = _version_key(eglise_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, VERSION_TTL)
+        version = cache.get(key) or 1
+    return int(version)
+
+
+def bump_version(*eglise_ids: int | None) -> None:
+    """Invalide les statistiques des églises données et de la vue “toutes églises”."""
+    for scope_id in {*eglise_ids, None}:
+        key = _version_key(scope_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, VERSION_TTL)
+
+
+# -------------------------------
+# Agrégat unique
+# -------------------------------
+
+def _years_ago(today: date, years: int) -> date:
+    return today - timedelta(days=365 * years)
+
+
+def aggregates(today: date, with_problems: bool = False) -> dict:
+    """Expressions d’agrégat, pour aggregate() ou values(…).annotate() (instantanés par église)."""
+    # distinct=True : la jointure sur les problèmes (optionnelle) ne doit pas gonfler les effectifs
+    def n(q: Optional[Q] = None):
+        return Count("id", filter=q, distinct=with_problems)
+
+    aggs = {
+        "total": n(),
+        "hommes": n(Q(sexe__in=MALE_VALUES)),
+        "femmes": n(Q(sexe__in=FEMALE_VALUES)),
+        "nouveaux": n(Q(date_entree__gte=today - timedelta(days=NEW_MEMBER_DAYS))),
+        "baptises": n(Q(date_bapteme__isnull=False)),
+        "visiteurs": n(Q(membre=0)),
+        "membres_actifs": n(Q(membre=1)),
+        "fiss": n(Q(membre=2)),
+        "sympathisants": n(Q(membre__isnull=True)),
+    }
+    for label, lo, hi in AGE_BUCKETS:
+        q = Q(birthdate__lt=_years_ago(today, lo)) if lo else Q(birthdate__isnull=False)
+        if hi is not None:
+            q &= Q(birthdate__gte=_years_ago(today, hi))
+        aggs[f"age_{label}"] = n(q)
+    if with_problems:
+        aggs["problemes"] = Count("problemes")
+    return aggs
+
+
+def _cache_key(eglise_id: int | None, filters: dict, with_problems: bool, today: date) -> str:
+    digest = hashlib.sha1(
+        json.dumps(filters, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    return (f"fidelestats:{_scope(eglise_id)}:{_get_version(eglise_id)}:{today:%Y%m%d}:"
+            f"{digest}:{int(with_problems)}")
+
+
+def member_stats(queryset, *, eglise_id: int | None, filters: dict, with_problems: bool = False) -> dict:
+    """
+    Toutes les statistiques de la liste des fidèles en une requête (agrégats conditionnels).
+
+    `queryset` : fidèles déjà filtrés ; `eglise_id` / `filters` : ce qui détermine ce filtrage
+    (clé de cache). Invalidé à chaque écriture sur un fidèle de l’église (signaux).
+    """
+    today = timezone.localdate()
+    key = _cache_key(eglise_id, filters, with_problems, today)
+    stats = cache.get(key)
+    if stats is None:
+        stats = queryset.order_by().aggregate(**aggregates(today, with_problems))
+        stats["age_distribution"] = [(label, stats.pop(f"age_{label}")) for label, _, _ in AGE_BUCKETS]
+        cache.set(key, stats, STATS_TTL)
+    return stats
+
+
+def total_members() -> int:
+    """Nombre total de fidèles (toutes églises), en cache."""
+    return member_stats(Fidele.objects.all(), eglise_id=None, filters={})["total"]
+
+
+def status_distribution(stats: dict) -> Iterable[tuple]:
+    return [
+        ("Visiteurs", stats["visiteurs"]),
+        ("Membres actifs", stats["membres_actifs"]),
+        ("FISS", stats["fiss"]),
+        ("Sympathisants", stats["sympathisants"]),
+    ]
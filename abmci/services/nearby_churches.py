@@ -0,0 +1,93 @@
+# abmci/services/nearby_churches.py
+from __future__ import annotations
+
+import math
+from typing import List
+
+from django.contrib.gis.db.models.functions import GeometryDistance
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.utils import timezone
+
+from abmci.services import church_index
+from abmci.utils import geohash
+from fidele.models import Eglise
+
+# Cellule geohash de précision 5 (~4,9 km × 4,9 km) : les utilisateurs proches partagent le cache
+GEOHASH_PRECISION = 5
+CANDIDATES_TTL = 10 * 60
+# Candidats supplémentaires au-delà de `limit` (re-classement depuis la position exacte)
+LIMIT_SLACK = 50
+
+_M_PER_DEG_LAT = 111_320.0
+
+
+def _cell_margin_m(cell: str) -> float:
+    """Demi-diagonale de la cellule : distance max entre son centre et un point qu’elle contient."""
+    lat_lo, lon_lo, lat_hi, lon_hi = geohash.bounds(cell)
+    return church_index.haversine_m(lon_lo, lat_lo, lon_hi, lat_hi) / 2
+
+
+def _degrees_for(meters: float, lat: float) -> float:
+    """Rayon en degrés couvrant `meters` autour de `lat` (majorant, pour ST_DWithin sur geometry)."""
+    lat_max = min(89.0, abs(lat) + meters / _M_PER_DEG_LAT)
+    return min(180.0, meters / (_M_PER_DEG_LAT * math.cos(math.radians(lat_max))))
+
+
+def _row(e: dict) -> dict:
+    loc = e["location"]
+    return {
+        "id": e["id"],
+        "name": e["name"],
+        "ville": e["ville"],
+        "pasteur": e["pasteur"],
+        "location": {"type": "Point", "coordinates": [loc.x, loc.y]},  # (lon, lat)
+        "lat": loc.y,
+        "lon": loc.x,
+        "verse_du_jour": e["verse_du_jour"],
+        "verse_reference": e["verse_reference"],
+        "verse_date": e["verse_date"].isoformat() if e["verse_date"] else None,
+    }
+
+
+def _candidates(cell: str, radius_m: float, show_all: bool, limit: int) -> List[dict]:
+    """
+    Églises candidates pour une cellule, en cache :
+    préfiltre ST_DWithin (index GiST) sur rayon + marge de cellule, puis tri KNN `<->`.
+    """
+    key = (f"eglises:proches:{church_index.current_version()}:{timezone.localdate():%Y%m%d}:"
+           f"{cell}:{radius_m:.0f}:{int(show_all)}:{limit}")
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    clat, clon = geohash.center(cell)
+    center = Point(clon, clat, srid=4326)
+    qs = Eglise.objects.filter(location__isnull=False)
+    if not show_all:
+        qs = qs.filter(location__dwithin=(center, _degrees_for(radius_m + _cell_margin_m(cell), clat)))
+    qs = (qs.order_by(GeometryDistance("location", center))
+          .values("id", "name", "ville", "pasteur", "location",
+                  "verse_du_jour", "verse_reference", "verse_date")[:limit + LIMIT_SLACK])
+
+    rows = [_row(e) for e in qs]
+    cache.set(key, rows, CANDIDATES_TTL)
+    return rows
+
+
+def nearby(lat: float, lon: float, *, radius_km: float, show_all: bool, limit: int) -> List[dict]:
+    """
+    Églises proches de (lat, lon), au format EgliseListSerializer, triées par distance exacte.
+    Les candidats viennent du cache de la cellule ; seule la distance est calculée par requête.
+    """
+    radius_m = radius_km * 1000.0
+    cell = geohash.encode(lat, lon, GEOHASH_PRECISION)
+
+    out = []
+    for row in _candidates(cell, radius_m, show_all, limit):
+        d = church_index.haversine_m(lon, lat, row["lon"], row["lat"])
+        if not show_all and d > radius_m:
+            continue
+        out.append({**row, "distance": d, "in_range": d <= radius_m})
+    out.sort(key=lambda r: r["distance"])
+    return out[:limit]
@@ -4,16 +4,18 @@ from typing import Optional
 
 from django.utils import timezone
 from django.contrib.gis.geos import Point
-from django.contrib.gis.db.models.functions import Distance  # ✅ mètres
 
-from fidele.models import Fidele, Eglise, FidelePosition
+from abmci.services import church_index, event_stats, member_stats
+from fidele.models import Fidele, Eglise, FideleLastPosition, FidelePosition
 
 
 # -------------------------------
 # Sélection d'un Point WGS84
 # -------------------------------
 
-def _point_from_position(pos: FidelePosition) -> Optional[Point]:
+def _point_from_position(pos: FidelePosition | FideleLastPosition) -> Optional[Point]:
+    if pos.point is not None:
+        return pos.point
     try:
         return Point(float(pos.longitude), float(pos.latitude), srid=4326)
     except Exception:
@@ -25,9 +27,9 @@ def _latest_valid_position(
     *,
     max_age_hours: int | None = 48,
     max_accuracy_m: float | None = 500.0,
-) -> Optional[FidelePosition]:
-    qs = FidelePosition.objects.filter(fidele=f).order_by("-captured_at")
-    pos = qs.first()
+) -> Optional[FideleLastPosition]:
+    # Dernière position dénormalisée : lecture par clé primaire
+    pos = FideleLastPosition.objects.filter(pk=f.pk).first()
     if not pos:
         return None
 
@@ -103,17 +105,16 @@ def find_nearest_eglise_for_fidele(
     if not pt:
         return None
 
-    qs = (
-        Eglise.objects.filter(location__isnull=False)
-        .annotate(distance=Distance("location", pt))  # ✅ distance en mètres
-        .order_by("distance")
-    )
+    found = church_index.nearest(pt, max_radius_km=max_radius_km)
+    return Eglise.objects.filter(pk=found[0]).first() if found else None
 
-    if max_radius_km is None:
-        return qs.first()
 
-    max_m = float(max_radius_km) * 1000.0
-    return qs.filter(distance__lte=max_m).first()
+def nearest_eglise_id(pt: Point | None, *, max_radius_km: float | None = None) -> Optional[int]:
+    """Id de l’église la plus proche d’un point (index en mémoire), sans requête en régime établi."""
+    if pt is None:
+        return None
+    found = church_index.nearest(pt, max_radius_km=max_radius_km)
+    return found[0] if found else None
 
 
 def assign_nearest_eglise_if_missing(
@@ -126,14 +127,46 @@ def assign_nearest_eglise_if_missing(
     if f.eglise_id:
         return False
 
-    nearest = find_nearest_eglise_for_fidele(
-        f,
-        max_radius_km=max_radius_km,
-        max_age_hours=max_age_hours,
-        max_accuracy_m=max_accuracy_m,
-    )
-    if not nearest:
+    pt = _point_for_fidele(f, max_age_hours=max_age_hours, max_accuracy_m=max_accuracy_m)
+    eglise_id = nearest_eglise_id(pt, max_radius_km=max_radius_km)
+    if not eglise_id:
+        return False
+
+    return _assign(f.pk, eglise_id)
+
+
+def _assign(fidele_id: int, eglise_id: int) -> bool:
+    """
+    UPDATE conditionnel (pas de post_save) : compteurs d’invités et statistiques
+    de l’église mis à jour ici.
+    """
+    if not Fidele.objects.filter(pk=fidele_id, eglise__isnull=True).update(eglise_id=eglise_id):
+        return False
+    if Fidele.objects.filter(pk=fidele_id, is_deleted=0).exists():
+        event_stats.shift_invites(eglise_id, 1)
+    member_stats.bump_version(eglise_id)
+    return True
+
+
+def assign_nearest_eglise_from_position(
+    pos: FidelePosition,
+    *,
+    max_radius_km: float | None = None,
+    max_accuracy_m: float | None = 500.0,
+) -> bool:
+    """
+    Nouvelle position d’un fidèle sans église : affectation à la plus proche.
+    Une seule requête (UPDATE conditionnel) ; la recherche se fait dans l’index.
+    """
+    if max_accuracy_m is not None and pos.accuracy is not None:
+        try:
+            if float(pos.accuracy) > float(max_accuracy_m):
+                return False
+        except Exception:
+            pass
+
+    eglise_id = nearest_eglise_id(_point_from_position(pos), max_radius_km=max_radius_km)
+    if not eglise_id:
         return False
 
-    type(f).objects.filter(pk=f.pk, eglise__isnull=True).update(eglise=nearest)
-    return True
\ No newline at end of file
+    return _assign(pos.fidele_id, eglise_id)
@@ -0,0 +1,207 @@
+# abmci/services/positions.py
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from abmci.services.nearest_church import assign_nearest_eglise_from_position
+from fidele.models import Fidele, FideleLastPosition, FidelePosition
+
+# Nombre max de relevés GPS par requête d’ingestion
+MAX_BATCH = 1000
+
+# Rétention : relevés bruts pendant RAW_DAYS, puis un par (fidèle, heure)
+RAW_DAYS = 7
+DOWNSAMPLE_BUCKET = "hour"
+DOWNSAMPLE_CHUNK = 5000  # fidèles par DELETE (verrous courts)
+
+
+# -------------------------------
+# Dernière position (dénormalisée)
+# -------------------------------
+
+def _last_fields(pos: FidelePosition) -> dict:
+    return {
+        "point": pos.point or pos.build_point(),
+        "latitude": pos.latitude,
+        "longitude": pos.longitude,
+        "accuracy": pos.accuracy,
+        "captured_at": pos.captured_at,
+        "source": pos.source,
+        "updated_at": timezone.now(),
+    }
+
+
+_UPSERT_LAST_SQL = """
+INSERT INTO {last} AS last
+    (fidele_id, point, latitude, longitude, accuracy, captured_at, source, updated_at)
+VALUES (%(fidele_id)s, ST_GeomFromEWKT(%(point)s), %(latitude)s, %(longitude)s, %(accuracy)s,
+        %(captured_at)s, %(source)s, %(updated_at)s)
+ON CONFLICT (fidele_id) DO UPDATE SET
+    point = EXCLUDED.point,
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    accuracy = EXCLUDED.accuracy,
+    captured_at = EXCLUDED.captured_at,
+    source = EXCLUDED.source,
+    updated_at = EXCLUDED.updated_at
+WHERE last.captured_at < EXCLUDED.captured_at
+"""
+
+
+def update_last_position(pos: FidelePosition) -> None:
+    """
+    Remplace la dernière position du fidèle si `pos` est plus récente : un seul
+    INSERT … ON CONFLICT DO UPDATE conditionnel (deux lots simultanés ne se perdent pas).
+    """
+    fields = _last_fields(pos)
+    sql = _UPSERT_LAST_SQL.format(last=connection.ops.quote_name(FideleLastPosition._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {**fields, "fidele_id": pos.fidele_id, "point": fields["point"].ewkt})
+
+
+def latest_position(fidele_id: int) -> Optional[FideleLastPosition]:
+    """Lecture par clé primaire."""
+    return FideleLastPosition.objects.filter(pk=fidele_id).first()
+
+
+# -------------------------------
+# Ingestion par lots
+# -------------------------------
+
+def ingest(fidele_id: int, fixes: Iterable[dict]) -> List[FidelePosition]:
+    """
+    Enregistre un lot de relevés validés (PositionInputSerializer) pour un fidèle :
+    un INSERT groupé, puis mise à jour de la dernière position et affectation d’église
+    (une fois par lot, pas par relevé).
+    """
+    now = timezone.now()
+    rows = []
+    for fx in fixes:
+        pos = FidelePosition(
+            fidele_id=fidele_id,
+            latitude=fx["latitude"],
+            longitude=fx["longitude"],
+            accuracy=fx.get("accuracy"),
+            captured_at=fx.get("captured_at") or now,
+            source=fx.get("source") or "mobile_gps",
+            note=fx.get("note") or None,
+        )
+        pos.point = pos.build_point()
+        rows.append(pos)
+    if not rows:
+        return []
+
+    with transaction.atomic():
+        FidelePosition.objects.bulk_create(rows, batch_size=MAX_BATCH)
+        newest = max(rows, key=lambda p: p.captured_at)
+        update_last_position(newest)
+
+    # bulk_create n’émet pas post_save : affectation d’église depuis le relevé le plus récent
+    # (les relevés sont déjà enregistrés : une erreur ici ne doit pas faire échouer le lot)
+    try:
+        assign_nearest_eglise_from_position(newest, max_radius_km=50)
+    except Exception as e:
+        print(f"[positions] assign_nearest_eglise_from_position error: {e!r}")
+    return rows
+
+
+# -------------------------------
+# Rétention / sous-échantillonnage
+# -------------------------------
+
+_DOWNSAMPLE_SQL = """
+DELETE FROM {position} p
+USING (
+    SELECT id,
+           row_number() OVER (
+               PARTITION BY fidele_id, date_trunc(%(bucket)s, captured_at)
+               ORDER BY accuracy ASC NULLS LAST, captured_at DESC
+           ) AS rn
+    FROM {position}
+    WHERE captured_at < %(cutoff)s
+      AND fidele_id > %(after)s AND fidele_id <= %(upto)s
+) ranked
+WHERE p.id = ranked.id AND ranked.rn > 1
+"""
+
+
+def downsample(*, raw_days: int = RAW_DAYS, bucket: str = DOWNSAMPLE_BUCKET,
+               purge_after_days: int | None = None, chunk: int = DOWNSAMPLE_CHUNK,
+               log=None) -> dict:
+    """
+    Garde, au-delà de `raw_days`, un seul relevé par (fidèle, `bucket`) — le plus précis.
+    Optionnellement supprime tout relevé plus vieux que `purge_after_days`.
+    Traitement par tranches d’ids de fidèles pour limiter la durée des verrous.
+    """
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Le sous-échantillonnage nécessite PostgreSQL.")
+    if bucket not in ("minute", "hour", "day"):
+        raise ValueError("bucket doit valoir minute, hour ou day.")
+
+    cutoff = timezone.now() - timedelta(days=raw_days)
+    sql = _DOWNSAMPLE_SQL.format(position=connection.ops.quote_name(FidelePosition._meta.db_table))
+    started = time.perf_counter()
+    deleted = 0
+
+    ids = Fidele.objects.order_by("pk").values_list("pk", flat=True)
+    after = 0
+    while True:
+        edge = list(ids.filter(pk__gt=after)[chunk - 1:chunk])
+        upto = edge[0] if edge else ids.filter(pk__gt=after).order_by("-pk").first()
+        if upto is None:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, {"bucket": bucket, "cutoff": cutoff, "after": after, "upto": upto})
+            deleted += cursor.rowcount
+        after = upto
+        if log:
+            log(f"  fidèles ≤ {upto} : {deleted} relevé(s) supprimé(s)")
+
+    purged = 0
+    if purge_after_days:
+        purge_cutoff = timezone.now() - timedelta(days=purge_after_days)
+        purged, _ = FidelePosition.objects.filter(captured_at__lt=purge_cutoff).delete()
+
+    return {"downsampled": deleted, "purged": purged, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def backfill_points() -> int:
+    """Renseigne la géométrie des relevés antérieurs à la colonne `point` (un UPDATE)."""
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {qn(FidelePosition._meta.db_table)} "
+            f"SET point = ST_SetSRID(ST_MakePoint(longitude::float8, latitude::float8), 4326) "
+            f"WHERE point IS NULL"
+        )
+        return cursor.rowcount
+
+
+def rebuild_last_positions(batch_size: int = 5000) -> int:
+    """(Re)construit FideleLastPosition depuis l’historique (DISTINCT ON, PostgreSQL)."""
+    latest = (FidelePosition.objects.order_by("fidele_id", "-captured_at").distinct("fidele_id"))
+    rows = []
+    count = 0
+    for pos in latest.iterator(chunk_size=batch_size):
+        rows.append(FideleLastPosition(fidele_id=pos.fidele_id, **_last_fields(pos)))
+        if len(rows) >= batch_size:
+            count += _upsert_last(rows)
+            rows = []
+    if rows:
+        count += _upsert_last(rows)
+    return count
+
+
+def _upsert_last(rows: List[FideleLastPosition]) -> int:
+    FideleLastPosition.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["fidele"],
+        update_fields=["point", "latitude", "longitude", "accuracy", "captured_at", "source", "updated_at"],
+    )
+    return len(rows)
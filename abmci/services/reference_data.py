@@ -0,0 +1,87 @@
+# abmci/services/reference_data.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from fidele.models import Department, Eglise, Familles, Fonction, MembreType
+
+# Tables de référence (quelques dizaines de lignes, modifiées depuis l’admin) :
+# nom → (modèle, champs chargés). Les autres champs restent différés (ex. versets des églises,
+# mis à jour chaque matin par bulk_update) : jamais servis périmés depuis le cache.
+REFERENCE_TABLES: Dict[str, Tuple[type, Tuple[str, ...]]] = {
+    "department": (Department, ("id", "name")),
+    "familles": (Familles, ("id", "name", "mission_id")),
+    "fonction": (Fonction, ("id", "name")),
+    "membre_type": (MembreType, ("id", "name")),
+    "eglise": (Eglise, ("id", "name", "ville")),
+}
+MODEL_TABLES = {model: name for name, (model, _) in REFERENCE_TABLES.items()}
+
+# Cache partagé : lignes par (table, version) ; la version est incrémentée par les signaux
+DATA_TTL = 24 * 60 * 60
+VERSION_TTL = 30 * 24 * 60 * 60
+# Cache local (par processus) : la version partagée n’est relue qu’au plus toutes les N secondes
+LOCAL_CHECK_SECONDS = 5
+
+_lock = threading.Lock()
+_local: Dict[str, Tuple[int, float, list]] = {}
+
+
+def _version_key(name: str) -> str:
+    return f"refdata:v:{name}"
+
+
+def _get_version(name: str) -> int:
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, VERSION_TTL)
+        version = cache.get(key) or 1
+    return int(version)
+
+
+def bump_version(name: str) -> None:
+    """Invalide la table pour tous les processus (et immédiatement pour celui-ci)."""
+    key = _version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, VERSION_TTL)
+    with _lock:
+        _local.pop(name, None)
+
+
+def _load(name: str) -> list:
+    model, fields = REFERENCE_TABLES[name]
+    return list(model._default_manager.only(*fields).order_by("name", "pk"))
+
+
+def get(name: str) -> List:
+    """Lignes de la table de référence `name`, triées par nom (process → cache partagé → base)."""
+    now = time.monotonic()
+    entry = _local.get(name)
+    if entry and now - entry[1] < LOCAL_CHECK_SECONDS:
+        return entry[2]
+
+    version = _get_version(name)
+    if entry and entry[0] == version:
+        rows = entry[2]
+    else:
+        key = f"refdata:{name}:{version}"
+        rows = cache.get(key)
+        if rows is None:
+            rows = _load(name)
+            cache.set(key, rows, DATA_TTL)
+    with _lock:
+        _local[name] = (version, now, rows)
+    return rows
+
+
+def lazy(name: str) -> SimpleLazyObject:
+    """Liste évaluée au premier accès seulement (gabarits qui ne l’affichent pas : aucun coût)."""
+    return SimpleLazyObject(lambda: get(name))
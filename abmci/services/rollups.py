@@ -0,0 +1,156 @@
+# abmci/services/rollups.py
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from abmci.services.member_stats import AGE_BUCKETS, aggregates
+from event.models import ParticipationEvenement
+from fidele.models import Donation, EgliseDailyStats, Fidele
+
+# Premier passage sans historique : jours reconstruits
+INITIAL_DAYS = 90
+# Champs additionnés pour la vue « toutes églises »
+SUM_FIELDS = (
+    "members", "visiteurs", "membres_actifs", "fiss", "sympathisants", "hommes", "femmes", "baptises",
+    "nouveaux", "participations", "scans", "donations_count", "donations_amount",
+)
+_MEMBER_FIELDS = ("visiteurs", "membres_actifs", "fiss", "sympathisants", "hommes", "femmes", "baptises")
+
+
+def _day_bounds(day: date):
+    tz = timezone.get_current_timezone()
+    lo = timezone.make_aware(datetime.combine(day, time.min), tz)
+    return lo, lo + timedelta(days=1)
+
+
+def _snapshot(day: date) -> List[EgliseDailyStats]:
+    """Lignes du jour pour toutes les églises : 4 requêtes groupées par église."""
+    lo, hi = _day_bounds(day)
+    out: Dict[Optional[int], EgliseDailyStats] = {}
+
+    def row(eglise_id):
+        if eglise_id not in out:
+            out[eglise_id] = EgliseDailyStats(eglise_id=eglise_id, day=day, age_distribution={})
+        return out[eglise_id]
+
+    # Effectifs : fidèles inscrits au plus tard ce jour-là (permet de reconstruire l’historique)
+    members = (Fidele.objects.filter(is_deleted=0, created_at__lt=hi)
+               .order_by().values("eglise_id").annotate(**aggregates(day)))
+    for m in members:
+        r = row(m["eglise_id"])
+        r.members = m["total"]
+        for field in _MEMBER_FIELDS:
+            setattr(r, field, m[field])
+        r.age_distribution = {label: m[f"age_{label}"] for label, _, _ in AGE_BUCKETS}
+
+    arrivals = (Fidele.objects.filter(is_deleted=0, date_entree=day)
+                .order_by().values("eglise_id").annotate(n=Count("id")))
+    for a in arrivals:
+        row(a["eglise_id"]).nouveaux = a["n"]
+
+    attendance = (ParticipationEvenement.objects.filter(date__gte=lo, date__lt=hi)
+                  .order_by().values("evenement__eglise_id")
+                  .annotate(n=Count("id"), scanned=Count("id", filter=Q(qr_code_scanned=True))))
+    for a in attendance:
+        r = row(a["evenement__eglise_id"])
+        r.participations, r.scans = a["n"], a["scanned"]
+
+    donations = (Donation.objects.filter(status="success", paid_at__gte=lo, paid_at__lt=hi)
+                 .order_by().values("user__fidele__eglise_id")
+                 .annotate(n=Count("id"), amount=Sum("amount")))
+    for d in donations:
+        r = row(d["user__fidele__eglise_id"])
+        r.donations_count, r.donations_amount = d["n"], d["amount"] or 0
+
+    return list(out.values())
+
+
+def refresh_day(day: date) -> int:
+    """Recalcule (remplace) les instantanés d’une journée."""
+    rows = _snapshot(day)
+    with transaction.atomic():
+        EgliseDailyStats.objects.filter(day=day).delete()
+        EgliseDailyStats.objects.bulk_create(rows)
+    return len(rows)
+
+
+def refresh(*, since: Optional[date] = None, until: Optional[date] = None, log=None) -> dict:
+    """
+    Rafraîchissement incrémental : du dernier jour enregistré (recalculé, il pouvait être partiel)
+    jusqu’à aujourd’hui. Sans historique : INITIAL_DAYS jours.
+    """
+    until = until or timezone.localdate()
+    if since is None:
+        last = EgliseDailyStats.objects.order_by("-day").values_list("day", flat=True).first()
+        since = last or (until - timedelta(days=INITIAL_DAYS - 1))
+
+    days, rows = 0, 0
+    day = since
+    while day <= until:
+        n = refresh_day(day)
+        rows += n
+        days += 1
+        if log:
+            log(f"  {day:%Y-%m-%d} : {n} église(s)")
+        day += timedelta(days=1)
+    return {"days": days, "rows": rows}
+
+
+# -------------------------------
+# Lecture (tableaux de bord)
+# -------------------------------
+
+def _scoped(eglise_id: Optional[int]):
+    qs = EgliseDailyStats.objects.all()
+    return qs.filter(eglise_id=eglise_id) if eglise_id else qs
+
+
+def latest(eglise_id: Optional[int] = None) -> Optional[dict]:
+    """Dernier instantané (église, ou somme de toutes les églises)."""
+    day = _scoped(eglise_id).order_by("-day").values_list("day", flat=True).first()
+    if day is None:
+        return None
+    rows = list(_scoped(eglise_id).filter(day=day))
+    snap = {"day": day, **{f: sum(getattr(r, f) for r in rows) for f in SUM_FIELDS}}
+    ages = defaultdict(int)
+    for r in rows:
+        for label, n in (r.age_distribution or {}).items():
+            ages[label] += n
+    snap["age_distribution"] = [(label, ages.get(label, 0)) for label, _, _ in AGE_BUCKETS]
+    return snap
+
+
+def trend(eglise_id: Optional[int] = None, *, days: int = 30, fields=("members", "participations")) -> dict:
+    """Séries quotidiennes {"labels": [...], champ: [...]} sur les `days` derniers jours (une requête)."""
+    start = timezone.localdate() - timedelta(days=days - 1)
+    qs = (_scoped(eglise_id).filter(day__gte=start).order_by("day")
+          .values("day").annotate(**{f"{f}_sum": Sum(f) for f in fields}))
+    series = {"labels": [], **{f: [] for f in fields}}
+    for r in qs:
+        series["labels"].append(r["day"].isoformat())
+        for f in fields:
+            series[f].append(r[f"{f}_sum"] or 0)
+    return series
+
+
+def monthly(eglise_id: Optional[int] = None, *, months: int = 12,
+            fields=("donations_count", "donations_amount")) -> dict:
+    """Totaux mensuels des champs d’activité (dons, présences…) sur les `months` derniers mois."""
+    today = timezone.localdate()
+    year, month = divmod(today.year * 12 + today.month - 1 - (months - 1), 12)
+    start = date(year, month + 1, 1)
+    qs = (_scoped(eglise_id).filter(day__gte=start).annotate(month=TruncMonth("day"))
+          .order_by("month").values("month").annotate(**{f"{f}_sum": Sum(f) for f in fields}))
+    series = {"labels": [], **{f: [] for f in fields}}
+    for r in qs:
+        series["labels"].append(f"{r['month']:%Y-%m}")
+        for f in fields:
+            series[f].append(r[f"{f}_sum"] or 0)
+    return series
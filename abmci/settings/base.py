@@ -5,6 +5,7 @@ import os
 import re
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 import firebase_admin
 from firebase_admin import credentials
 
@@ -43,6 +44,7 @@ ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "").split(",") if os.environ.get
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.gis",
+    "django.contrib.postgres",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
@@ -159,12 +161,14 @@ REST_AUTH = {
 
     "USER_DETAILS_SERIALIZER": "api.serializers.CustomUserDetailsSerializer",
     'REGISTER_SERIALIZER': 'api.serializers.CustomRegisterSerializer',
+    "JWT_TOKEN_CLAIMS_SERIALIZER": "api.tokens.FideleTokenObtainPairSerializer",
 
 }
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=env_int("JWT_ACCESS_MIN", 60)),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=env_int("JWT_REFRESH_DAYS", 7)),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_OBTAIN_SERIALIZER": "api.tokens.FideleTokenObtainPairSerializer",
 }
 
 CORS_ALLOW_CREDENTIALS = True
@@ -184,6 +188,9 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Fichiers sensibles (exports, imports de fidèles) : hors MEDIA_ROOT, jamais servis en statique,
+# téléchargés via une vue authentifiée. Partagé par le web et le worker Celery.
+PRIVATE_MEDIA_ROOT = Path(os.getenv("PRIVATE_MEDIA_ROOT") or BASE_DIR / "private_media")
 
 SITE_ORIGIN = "https://administration.abmci.com"
 
@@ -260,12 +267,58 @@ LOGGING = {
 }
 
 
+# Cache partagé entre workers (Redis si configuré, sinon mémoire locale du process)
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL", os.getenv("REDIS_URL", ""))
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+            "KEY_PREFIX": "abmci",
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "abmci"}
+    }
+
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://abmciredis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("REDIS_URL", "redis://abmciredis:6379/0")
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    "downsample-positions": {
+        "task": "fidele.tasks.downsample_positions_task",
+        "schedule": crontab(hour=3, minute=15),
+    },
+    "member-density": {
+        "task": "fidele.tasks.compute_member_density_task",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    # Journée en cours rafraîchie chaque heure ; la veille est finalisée au premier passage du jour
+    "church-rollups": {
+        "task": "fidele.tasks.refresh_church_rollups_task",
+        "schedule": crontab(minute=5),
+    },
+    "households": {
+        "task": "fidele.tasks.rebuild_households_task",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "duplicates": {
+        "task": "fidele.tasks.find_duplicates_task",
+        "schedule": crontab(hour=3, minute=45, day_of_week=0),
+    },
+    "celebrations": {
+        "task": "fidele.tasks.send_celebrations_task",
+        "schedule": crontab(hour=7, minute=0),
+    },
+    "engagement": {
+        "task": "fidele.tasks.recompute_engagement_task",
+        "schedule": crontab(hour=1, minute=45),
+    },
+}
 
 PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY')
 # settings.py
@@ -45,6 +45,7 @@ urlpatterns = [
                   path('fidele/', include('fidele.urls')),
                   path('evenements/', include('event.urls')),
                   path('eden/', include('eden.urls')),
+                  path('select2/', include('django_select2.urls')),
                   path('', HomePageView.as_view(), name='home'),
                   path('signup/', SignupView.as_view(template_name='registration/signup.html'), name='account_signup'),
                   path('login/', LoginView.as_view(template_name='registration/login.html'), name='account_login'),
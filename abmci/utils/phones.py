@@ -0,0 +1,33 @@
+"""Normalisation des numéros de téléphone (E.164) partagée par la connexion Firebase et le dédoublonnage."""
+from __future__ import annotations
+
+import phonenumbers
+
+DEFAULT_REGION = "CI"
+
+
+def normalize_phone(phone, region: str | None = None) -> str | None:
+    """
+    Numéro au format E.164 (« +2250701020304 »). Sans `region`, seuls les numéros
+    internationaux sont compris ; un numéro illisible est renvoyé tel quel.
+    """
+    if not phone:
+        return None
+    try:
+        p = phonenumbers.parse(str(phone), region)
+        return phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.E164)
+    except Exception:
+        return str(phone)
+
+
+def phone_key(phone, region: str = DEFAULT_REGION) -> str | None:
+    """Clé de comparaison : E.164 des numéros valides (numéros nationaux lus dans `region`), sinon None."""
+    if not phone:
+        return None
+    try:
+        p = phonenumbers.parse(str(phone), region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(p):
+        return None
+    return phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.E164)
@@ -0,0 +1,28 @@
+"""Stockage privé (hors MEDIA_ROOT) des fichiers sensibles : exports et imports de fidèles."""
+from __future__ import annotations
+
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+
+def private_storage() -> FileSystemStorage:
+    """Sans base_url : aucune URL publique, le fichier n’est servi que par une vue contrôlée."""
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT, base_url=None)
+
+
+def _random_name(prefix: str, filename: str) -> str:
+    # Nom imprévisible (le nom d’origine peut contenir le nom de l’église, une date…)
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    return f"{prefix}/{timezone.now():%Y/%m}/{uuid.uuid4().hex}{ext}"
+
+
+def export_upload_to(instance, filename: str) -> str:
+    return _random_name("exports", filename)
+
+
+def import_upload_to(instance, filename: str) -> str:
+    return _random_name("imports", filename)
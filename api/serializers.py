@@ -11,6 +11,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.gis.db.models.functions import Distance as DistanceFunc
 
+from abmci.services.nearest_church import nearest_eglise_id
 from abmci.utils.church_positions import calculate_distance
 from abmci.utils.notifications import send_fcm_multicast
 from event.models import ParticipationEvenement, TypeEvent, Evenement
@@ -137,15 +138,8 @@ class CustomRegisterSerializer(RegisterSerializer):
         """
         Retourne l'église la plus proche dans le rayon NEARBY_RADIUS_KM, sinon None.
         """
-        if point is None:
-            return None
-
-        return (Eglise.objects
-                .exclude(location__isnull=True)
-                .filter(location__distance_lte=(point, D(km=self.NEARBY_RADIUS_KM)))
-                .annotate(distance=DistanceFunc('location', point))
-                .order_by('distance')
-                .first())
+        eglise_id = nearest_eglise_id(point, max_radius_km=self.NEARBY_RADIUS_KM)
+        return Eglise.objects.filter(pk=eglise_id).first() if eglise_id else None
 
     @transaction.atomic
     def save(self, request):
@@ -215,7 +209,7 @@ class FideleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Fidele
-        fields = '__all__'
+        exclude = ['search_text']
         depth = 1
 
     def get_age(self, obj):
@@ -236,7 +230,7 @@ class FideleCreateUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Fidele
-        exclude = ['user', 'qlook_id', 'slug', 'created_at']
+        exclude = ['user', 'qlook_id', 'slug', 'created_at', 'search_text']
 
     def create(self, validated_data):
         user_data = {
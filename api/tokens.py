@@ -0,0 +1,19 @@
+# api/tokens.py
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from fidele.models import Fidele
+
+
+class FideleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Ajoute le claim `fidele_id` aux JWT (copié dans l’access token au refresh),
+    pour que les chemins chauds (scan QR) n’aient pas à résoudre user → fidèle.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        fidele_id = Fidele.objects.filter(user_id=user.pk).values_list("id", flat=True).first()
+        if fidele_id:
+            token["fidele_id"] = fidele_id
+        return token
@@ -8,7 +8,11 @@ from api.views import VerifyEmailView, UserDetailView, FideleDetailView, FideleL
     UpcomingEventsHomeView, PrayerCategoryViewSet, PrayerRequestViewSet, PrayerCommentViewSet, DeviceViewSet, \
     NotificationViewSet, BibleVersionViewSet, BibleVerseViewSet, BibleTagViewSet, BannerListView, CategoryListView, \
     CreateIntentView, PaystackWebhookView, DonationVerifyAPIView, EgliseListView, EgliseDetailView, \
-    EgliseProcheListView, eglises_avec_verset_du_jour, paystack_return_view, PasswordResetConfirmRedirectView
+    EgliseProcheListView, eglises_avec_verset_du_jour, paystack_return_view, PasswordResetConfirmRedirectView, \
+    MemberBadgeView, BadgeKeyView, BulkCheckinSyncView, CalendarSubscriptionView, EgliseTileView, \
+    PositionBatchView, MemberSearchView, FideleViewSet, FamilyTreeView, HouseholdListView, MemberImportView, \
+    MemberImportDetailView, DuplicateListView, DuplicateMergeView, DuplicateDismissView, \
+    CelebrationListView, FollowUpListView
 from event.views import FirebaseLoginView
 
 router = DefaultRouter()
@@ -20,6 +24,7 @@ router.register("versions", BibleVersionViewSet, basename="bible-version")
 router.register("verses", BibleVerseViewSet, basename="bible-verse")
 router.register(r'bible/tags', BibleTagViewSet, basename='bible-tag')
 router.register(r"notifications", NotificationViewSet, basename="notifications")
+router.register(r"members", FideleViewSet, basename="member")
 
 
 urlpatterns = [
@@ -33,6 +38,7 @@ urlpatterns = [
     path('eglises/', EgliseListView.as_view(), name='eglise-list'),
     path('eglises/<int:pk>/', EgliseDetailView.as_view(), name='eglise-detail'),
     path('eglises/proches/', EgliseProcheListView.as_view(), name='eglise-proches'),
+    path('eglises/tiles/<int:z>/<int:x>/<int:y>.mvt', EgliseTileView.as_view(), name='eglise-tiles'),
     path('api/eglises/avec-verset/', eglises_avec_verset_du_jour, name='eglise-avec-verset'),
 
     path('donations/categories/', CategoryListView.as_view()),
@@ -53,10 +59,25 @@ urlpatterns = [
 
     path('participations/', ParticipationListCreateView.as_view(), name='participation-list-create'),
     path('scan-qr/<str:event_code>/', ScanQRCodeAPIView.as_view(), name='scan-qr-code'),
+    path('badge/', MemberBadgeView.as_view(), name='member-badge'),
+    path('checkins/key/', BadgeKeyView.as_view(), name='checkin-badge-key'),
+    path('checkins/sync/<str:event_code>/', BulkCheckinSyncView.as_view(), name='checkin-sync'),
+    path('positions/batch/', PositionBatchView.as_view(), name='positions-batch'),
+    path('fideles/search/', MemberSearchView.as_view(), name='fidele-search'),
+    path('fideles/<int:pk>/family/', FamilyTreeView.as_view(), name='fidele-family'),
+    path('households/', HouseholdListView.as_view(), name='households'),
+    path('celebrations/', CelebrationListView.as_view(), name='celebrations'),
+    path('engagement/follow-up/', FollowUpListView.as_view(), name='engagement-follow-up'),
+    path('fideles/import/', MemberImportView.as_view(), name='fidele-import'),
+    path('fideles/import/<int:pk>/', MemberImportDetailView.as_view(), name='fidele-import-detail'),
+    path('fideles/duplicates/', DuplicateListView.as_view(), name='fidele-duplicates'),
+    path('fideles/duplicates/<int:pk>/merge/', DuplicateMergeView.as_view(), name='fidele-duplicate-merge'),
+    path('fideles/duplicates/<int:pk>/dismiss/', DuplicateDismissView.as_view(), name='fidele-duplicate-dismiss'),
 
     path('eglise/verse-du-jour/', VerseDuJourView.as_view(), name='verse-du-jour'),
     path("events/upcoming/", UpcomingEventsView.as_view(), name="events-upcoming"),
     path("events/home/", UpcomingEventsHomeView.as_view(), name="events-home"),
+    path("calendar/subscriptions/", CalendarSubscriptionView.as_view(), name="calendar-subscriptions"),
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
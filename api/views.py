@@ -6,7 +6,7 @@ import hmac
 import json
 import os
 import uuid
-from datetime import timedelta
+from datetime import date, timedelta
 from urllib.parse import urlencode
 
 import requests
@@ -20,11 +20,13 @@ from django.db import IntegrityError, transaction, models
 from django.db.models import Q, Prefetch
 from django.http import JsonResponse, HttpRequest, HttpResponseRedirect, HttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
 from django.template.defaulttags import comment
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
 from django.utils.html import escape
+from django.utils.cache import get_conditional_response
 from django.utils.http import http_date
 from django.utils.timezone import now
 from django.views import View
@@ -33,6 +35,7 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics, permissions, status, viewsets, mixins, pagination, filters
 from rest_framework.decorators import action, api_view
 from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
@@ -41,19 +44,23 @@ from allauth.account.models import EmailAddress
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework.views import APIView
+from rest_framework.authentication import BasicAuthentication
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from django.contrib.gis.db.models.functions import Distance
 
+from abmci.services import badges, celebrations, checkin, church_tiles, engagement, exports, family_graph, \
+    ics_feed, member_dedupe, member_import, member_search, nearby_churches, positions
 from abmci.services.notifications import notify_new_comment
 from abmci.services.paystack import ps_verify
 from api.serializers import UserSerializer, FideleSerializer, FideleCreateUpdateSerializer, \
     UserProfileCompletionSerializer, ParticipationEvenementSerializer, VerseDuJourSerializer, EvenementListSerializer, \
     PrayerCommentSerializer, PrayerCategorySerializer, PrayerRequestSerializer, NotificationSerializer, \
     DeviceSerializer, BibleVersionSerializer, BibleVerseSerializer, BibleTagCreateSerializer, BannerSerializer, \
-    CreateIntentSerializer, DonationCategorySerializer, EgliseSerializer, EgliseListSerializer
+    CreateIntentSerializer, DonationCategorySerializer, EgliseSerializer, EgliseListSerializer, PositionInputSerializer
 from event.models import ParticipationEvenement, Evenement
 from fidele.models import Fidele, UserProfileCompletion, Eglise, PrayerComment, PrayerRequest, PrayerLike, \
     PrayerCategory, Notification, Device, BibleVersion, BibleVerse, BibleTag, Banner, Donation, DonationCategory, \
-    AccountDeletionRequest
+    AccountDeletionRequest, ImportJob
 
 # from .models import Fidele, UserProfileCompletion
 # from .serializers import (
@@ -162,23 +169,10 @@ class PasswordResetConfirmRedirectView(View):
         return HttpResponse(html)
 def _verify_signed_qr(payload_b64: str) -> str | None:
     """
-    FACULTATIF : si vous décidez d’encoder dans le QR un payload signé plutôt que le simple code.
-    Le QR contiendrait par ex. base64url({"code":"EVT123","exp":1699999999,"sig":<hmac>})
+    Variante signée du QR d’évènement (cf. abmci.services.badges.verify_event_qr).
     Retourne event_code si signature OK et non expiré, sinon None.
     """
-    try:
-        raw = base64.urlsafe_b64decode(payload_b64 + '=' * (-len(payload_b64) % 4))
-        data = json.loads(raw.decode('utf-8'))
-        msg = f"{data['code']}.{data['exp']}".encode('utf-8')
-        sig = base64.urlsafe_b64decode(data['sig'] + '=' * (-len(data['sig']) % 4))
-        expected = hmac.new(settings.SECRET_KEY.encode('utf-8'), msg, hashlib.sha256).digest()
-        if not hmac.compare_digest(sig, expected):
-            return None
-        if timezone.now().timestamp() > float(data['exp']):
-            return None
-        return data['code']
-    except Exception:
-        return None
+    return badges.verify_event_qr(payload_b64)
 
 
 class ScanQRCodeAPIView(APIView):
@@ -188,65 +182,76 @@ class ScanQRCodeAPIView(APIView):
     - QR actif : [start - 15min, end + 6h]
     - idempotent : renvoie 200 si déjà présent
     - throttle scope : qr-scan
+
+    Chemin rapide (rafales d’entrée au culte) :
+    - fenêtre de validité de l’évènement en cache par code
+    - fidèle résolu depuis le claim JWT `fidele_id` (JWT sans lecture de l’utilisateur en base) ;
+      compte actif / fiche non supprimée vérifiés sur un drapeau en cache
+    - un seul INSERT … ON CONFLICT DO NOTHING, pas de sérialiseur
     """
+    authentication_classes = [JWTStatelessUserAuthentication, BasicAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     throttle_scope = 'qr-scan'
 
     # Fenêtres (ajustez si besoin)
-    ALLOW_BEFORE_MIN = 15
-    ALLOW_AFTER_MIN = 6 * 60
+    ALLOW_BEFORE_MIN = checkin.ALLOW_BEFORE_MIN
+    ALLOW_AFTER_MIN = checkin.ALLOW_AFTER_MIN
 
     def post(self, request, event_code=None):
-        # Variante SIGNÉE (décommentez pour l’utiliser côté app mobile et ici)
-        # if 'qr' in request.data:
-        #     decoded_code = _verify_signed_qr(request.data['qr'])
-        #     if not decoded_code:
-        #         return Response({"detail": "QR invalide ou expiré."}, status=400)
-        #     event_code = decoded_code
+        # Variante SIGNÉE : body={"qr": "<payload_b64>"}
+        if 'qr' in request.data:
+            decoded_code = _verify_signed_qr(request.data['qr'])
+            if not decoded_code:
+                return Response({"detail": "QR invalide ou expiré."}, status=status.HTTP_400_BAD_REQUEST)
+            event_code = decoded_code
 
-        evenement = get_object_or_404(Evenement, code=event_code)
-        fidele = get_object_or_404(Fidele, user=request.user)
+        window = checkin.get_event_window(event_code)
+        if window is None:
+            return Response({"detail": "Évènement introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
-        now = timezone.now()
-        start = evenement.date_debut
-        end = evenement.date_fin
+        fidele_id = checkin.fidele_id_for_request(request)
+        if fidele_id is None:
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
+        now = timezone.now()
+        state = checkin.window_status(window, now)
         # Un QR dont la date n’est pas encore arrivée ne peut pas être scanné
-        if now < (start - timedelta(minutes=self.ALLOW_BEFORE_MIN)):
+        if state == "not_started":
             return Response(
                 {"detail": "Le QR code n’est pas encore actif."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         # Optionnel : interdiction après fin + marge
-        if now > (end + timedelta(minutes=self.ALLOW_AFTER_MIN)):
+        if state == "expired":
             return Response(
                 {"detail": "Le QR code a expiré."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         try:
-            with transaction.atomic():
-                participation, created = ParticipationEvenement.objects.get_or_create(
-                    fidele=fidele,
-                    evenement=evenement,
-                    defaults={'qr_code_scanned': True}
-                )
-
-                if created:
-                    # ➜ Ici, abonnez l’utilisateur aux notifications de l’évènement si besoin
-                    self._schedule_pre_event_notifications(evenement, fidele)
-                    serializer = ParticipationEvenementSerializer(participation, context={'request': request})
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-                # Idempotent : déjà enregistré → 200
-                return Response({"detail": "Présence déjà enregistrée."}, status=status.HTTP_200_OK)
-
+            participation_id = checkin.insert_participation(window["id"], fidele_id, now)
         except IntegrityError:
-            # Contrainte unique_together : déjà enregistré
+            # Fidèle supprimé depuis l’émission du token
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+        if participation_id is None:
+            # Idempotent : déjà enregistré → 200
             return Response({"detail": "Présence déjà enregistrée."}, status=status.HTTP_200_OK)
 
-    def _schedule_pre_event_notifications(self, evenement: Evenement, fidele: Fidele):
+        checkin.after_checkins(window, 1, [(fidele_id, now)])
+        # ➜ Ici, abonnez l’utilisateur aux notifications de l’évènement si besoin
+        self._schedule_pre_event_notifications(window["id"], fidele_id)
+        return Response({
+            "id": participation_id,
+            "fidele": fidele_id,
+            "evenement": window["id"],
+            "commentaire": None,
+            "date": now,
+            "qr_code_scanned": True,
+        }, status=status.HTTP_201_CREATED)
+
+    def _schedule_pre_event_notifications(self, evenement_id: int, fidele_id: int):
         """
         Hook pour planifier des notifications (24h / 3h / 30min avant).
         Implémentez avec Celery/Beat, django-q, APScheduler, etc.
@@ -255,11 +260,483 @@ class ScanQRCodeAPIView(APIView):
             for delta in [timedelta(hours=24), timedelta(hours=3), timedelta(minutes=30)]:
                 eta = evenement.date_debut - delta
                 if eta > timezone.now():
-                    notify_one.apply_async(kwargs={'fidele_id': fidele.id, 'event_id': evenement.id}, eta=eta)
+                    notify_one.apply_async(kwargs={'fidele_id': fidele_id, 'event_id': evenement_id}, eta=eta)
         """
         pass
 
 
+class CanSyncCheckins(permissions.BasePermission):
+    """Bénévoles d’accueil autorisés à scanner hors ligne (permission event.can_sync_checkins)."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.has_perm("event.can_sync_checkins"))
+
+
+class CanSearchMembers(permissions.BasePermission):
+    """Annuaire des fidèles : réservé aux comptes ayant la permission fidele.view_fidele."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.has_perm("fidele.view_fidele"))
+
+
+class MemberSearchView(APIView):
+    """
+    GET /api/fideles/search/?q=kou&limit=10[&eglise_id=…]
+    Saisie semi-automatique : top-N des fidèles de l’église (nom, prénom, téléphone, qlook_id),
+    insensible aux accents, servi par l’index trigramme de Fidele.search_text.
+    L’église est celle de l’utilisateur ; eglise_id n’est accepté que pour le staff.
+    """
+    permission_classes = [CanSearchMembers]
+
+    def get(self, request):
+        eglise_id = getattr(getattr(request.user, "fidele", None), "eglise_id", None)
+        if request.user.is_staff and request.query_params.get("eglise_id"):
+            eglise_id = request.query_params.get("eglise_id")
+        if not eglise_id:
+            return Response({"detail": "Aucune église associée."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get("limit", member_search.TYPEAHEAD_LIMIT))
+        except ValueError:
+            limit = member_search.TYPEAHEAD_LIMIT
+
+        qs = Fidele.objects.filter(eglise_id=eglise_id, is_deleted=0)
+        results = member_search.typeahead(qs, request.query_params.get("q"), limit=limit)
+        return Response({"results": results})
+
+
+def _int_param(request, name, default, lo, hi):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(lo, min(value, hi))
+
+
+class FamilyTreeView(APIView):
+    """
+    GET /api/fideles/<pk>/family/?generations=2
+    Arbre du fidèle (ascendants, descendants, conjoints, frères et sœurs) et son foyer.
+    Hors staff : fidèles de l’église de l’utilisateur uniquement.
+    """
+    permission_classes = [CanSearchMembers]
+
+    def get(self, request, pk):
+        qs = Fidele.objects.filter(is_deleted=0)
+        if not request.user.is_staff:
+            qs = qs.filter(eglise_id=getattr(getattr(request.user, "fidele", None), "eglise_id", None))
+        if not qs.filter(pk=pk).exists():
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+        generations = _int_param(request, "generations", family_graph.TREE_GENERATIONS,
+                                 1, family_graph.TREE_MAX_GENERATIONS)
+        return Response({
+            "id": pk,
+            "tree": family_graph.tree(pk, generations),
+            "household": [f.pk for f in family_graph.household(pk)],
+        })
+
+
+class HouseholdListView(APIView):
+    """
+    GET /api/households/?eglise_id=…&ids=1,2,3&min_size=2&page=1&page_size=200
+    Foyers complets pour publipostage ou visites : une entrée par foyer (membres, contact).
+    Hors staff : foyers et membres limités à l’église de l’utilisateur.
+    """
+    permission_classes = [CanSearchMembers]
+    max_page_size = 500
+
+    def get(self, request):
+        params = request.query_params
+        eglise_id = params.get("eglise_id") or None
+        members_eglise_id = None
+        if not request.user.is_staff:
+            eglise_id = members_eglise_id = getattr(getattr(request.user, "fidele", None), "eglise_id", None)
+            if not eglise_id:
+                return Response({"detail": "Aucune église associée."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = None
+        if params.get("ids"):
+            try:
+                ids = [int(x) for x in params["ids"].split(",") if x.strip()]
+            except ValueError:
+                return Response({"detail": "ids : entiers séparés par des virgules."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        page = _int_param(request, "page", 1, 1, 10 ** 6)
+        page_size = _int_param(request, "page_size", 200, 1, self.max_page_size)
+        data = family_graph.households(
+            eglise_id=eglise_id, fidele_ids=ids, members_eglise_id=members_eglise_id,
+            min_size=_int_param(request, "min_size", 1, 1, 1000),
+            offset=(page - 1) * page_size, limit=page_size,
+        )
+        data["page"] = page
+        return Response(data)
+
+
+class CelebrationListView(APIView):
+    """
+    GET /api/celebrations/?date=2025-03-14[&eglise_id=…]
+    Anniversaires de naissance, de baptême et de mariage du jour, par église.
+    Hors staff : église de l’utilisateur uniquement.
+    """
+    permission_classes = [CanSearchMembers]
+
+    def get(self, request):
+        try:
+            day = date.fromisoformat(request.query_params["date"]) if request.query_params.get("date") else None
+        except ValueError:
+            return Response({"detail": "date : format AAAA-MM-JJ attendu."}, status=status.HTTP_400_BAD_REQUEST)
+
+        eglise_id = _int_param(request, "eglise_id", 0, 0, 2 ** 31 - 1) or None
+        if not request.user.is_staff:
+            eglise_id = getattr(getattr(request.user, "fidele", None), "eglise_id", None)
+            if not eglise_id:
+                return Response({"detail": "Aucune église associée."}, status=status.HTTP_400_BAD_REQUEST)
+
+        groups = celebrations.celebrations_for(day, eglise_id=eglise_id)
+        return Response({
+            "date": (day or timezone.localdate()).isoformat(),
+            "eglises": [
+                {"eglise_id": eid, "celebrations": [{k: v for k, v in e.items() if k != "user_ids"} for e in entries]}
+                for eid, entries in sorted(groups.items(), key=lambda item: item[0] or 0)
+            ],
+        })
+
+
+class FollowUpListView(APIView):
+    """
+    GET /api/engagement/follow-up/?limit=50&after=<fidele_id>[&eglise_id=…]
+    Fidèles à relancer (décrochage), absents depuis le plus longtemps d’abord ; `next` = curseur
+    de la page suivante. Hors staff : église de l’utilisateur uniquement.
+    """
+    permission_classes = [CanSearchMembers]
+
+    def get(self, request):
+        eglise_id = _int_param(request, "eglise_id", 0, 0, 2 ** 31 - 1) or None
+        if not request.user.is_staff:
+            eglise_id = getattr(getattr(request.user, "fidele", None), "eglise_id", None)
+        if not eglise_id:
+            return Response({"detail": "Aucune église associée."}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = _int_param(request, "limit", engagement.FOLLOW_UP_LIMIT, 1, engagement.FOLLOW_UP_MAX_LIMIT)
+        rows = engagement.follow_up(eglise_id, limit=limit + 1,
+                                    after_id=_int_param(request, "after", 0, 0, 2 ** 31 - 1) or None)
+        page = rows[:limit]
+        return Response({
+            "next": page[-1].fidele_id if len(rows) > limit else None,
+            "results": [
+                {
+                    "fidele_id": e.fidele_id,
+                    "nom": f"{e.fidele.user.first_name} {e.fidele.user.last_name}".strip(),
+                    "phone": str(e.fidele.phone) if e.fidele.phone else None,
+                    "last_attended_at": e.last_attended_at,
+                    "attended_4w": e.attended_4w,
+                    "attended_12w": e.attended_12w,
+                }
+                for e in page
+            ],
+        })
+
+
+class CanImportMembers(permissions.BasePermission):
+    """Import de fidèles : permission fidele.add_fidele."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.has_perm("fidele.add_fidele"))
+
+
+def _import_job_data(job: ImportJob) -> dict:
+    return {
+        "id": job.pk,
+        "status": job.status,
+        "format": job.format,
+        "eglise_id": job.eglise_id,
+        "dry_run": job.dry_run,
+        "rows": job.rows,
+        "created": job.created,
+        "failed": job.failed,
+        "errors": job.errors,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class MemberImportView(APIView):
+    """
+    POST /api/fideles/import/   (multipart : file=.csv|.xlsx, eglise_id, dry_run=1)
+    Import massif de fidèles en tâche de fond ; suivi via GET /api/fideles/import/<id>/.
+    Hors staff : import dans l’église de l’utilisateur uniquement.
+    """
+    permission_classes = [CanImportMembers]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"detail": "Fichier requis (champ « file »)."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = member_import.format_for(upload.name)
+        if fmt == "xlsx" and not exports.xlsx_available():
+            return Response({"detail": "Import XLSX indisponible (openpyxl non installé)."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        eglise_id = request.data.get("eglise_id") or None
+        if not request.user.is_staff:
+            eglise_id = getattr(getattr(request.user, "fidele", None), "eglise_id", None)
+            if not eglise_id:
+                return Response({"detail": "Aucune église associée."}, status=status.HTTP_400_BAD_REQUEST)
+        elif eglise_id and not Eglise.objects.filter(pk=eglise_id).exists():
+            return Response({"detail": "Église introuvable."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get("dry_run", "")).lower() in ("1", "true", "on", "yes")
+        job = member_import.enqueue(upload, user=request.user, eglise_id=eglise_id, dry_run=dry_run)
+        return Response(_import_job_data(job), status=status.HTTP_202_ACCEPTED)
+
+
+class MemberImportDetailView(APIView):
+    """GET /api/fideles/import/<id>/ : avancement et erreurs ligne par ligne d’un import."""
+    permission_classes = [CanImportMembers]
+
+    def get(self, request, pk):
+        jobs = ImportJob.objects.all() if request.user.is_staff else ImportJob.objects.filter(user=request.user)
+        job = jobs.filter(pk=pk).first()
+        if job is None:
+            return Response({"detail": "Import introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_import_job_data(job))
+
+
+class CanMergeMembers(permissions.BasePermission):
+    """Doublons : permissions fidele.change_fidele et fidele.delete_fidele (la fusion supprime le doublon)."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated
+                    and user.has_perms(["fidele.change_fidele", "fidele.delete_fidele"]))
+
+
+def _duplicate_member_data(f: Fidele) -> dict:
+    return {
+        "id": f.pk,
+        "nom": f"{f.user.first_name} {f.user.last_name}".strip(),
+        "email": f.user.email,
+        "phone": str(f.phone) if f.phone else None,
+        "birthdate": f.birthdate,
+        "eglise_id": f.eglise_id,
+        "created_at": f.created_at,
+    }
+
+
+class DuplicateListView(APIView):
+    """
+    GET /api/fideles/duplicates/?status=pending&min_score=0.7&page=1&page_size=50
+    Doublons probables, du plus sûr au moins sûr. Hors staff : paires de l’église de l’utilisateur.
+    """
+    permission_classes = [CanMergeMembers]
+    max_page_size = 200
+
+    def get(self, request):
+        qs = member_dedupe.scoped_candidates(request.user).filter(
+            status=request.query_params.get("status") or "pending",
+        )
+        try:
+            min_score = float(request.query_params.get("min_score", 0))
+        except ValueError:
+            min_score = 0
+        if min_score:
+            qs = qs.filter(score__gte=min_score)
+
+        page = _int_param(request, "page", 1, 1, 10 ** 6)
+        page_size = _int_param(request, "page_size", 50, 1, self.max_page_size)
+        rows = qs.order_by("-score", "id")[(page - 1) * page_size:page * page_size]
+        return Response({
+            "page": page,
+            "results": [
+                {
+                    "id": c.pk,
+                    "score": c.score,
+                    "reasons": c.reasons,
+                    "status": c.status,
+                    "fidele_a": _duplicate_member_data(c.fidele_a),
+                    "fidele_b": _duplicate_member_data(c.fidele_b),
+                }
+                for c in rows
+            ],
+        })
+
+
+class DuplicateMergeView(APIView):
+    """
+    POST /api/fideles/duplicates/<id>/merge/   {"keep": <id du fidèle conservé>}
+    Fusionne la paire (par défaut, le plus ancien fidèle est conservé).
+    """
+    permission_classes = [CanMergeMembers]
+
+    def post(self, request, pk):
+        candidate = member_dedupe.scoped_candidates(request.user).filter(pk=pk).first()
+        if candidate is None:
+            return Response({"detail": "Paire introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        pair = {candidate.fidele_a_id, candidate.fidele_b_id}
+        try:
+            keep_id = int(request.data.get("keep") or candidate.fidele_a_id)
+        except (TypeError, ValueError):
+            keep_id = None
+        if keep_id not in pair:
+            return Response({"detail": "« keep » doit être l’un des deux fidèles de la paire."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        (dup_id,) = pair - {keep_id}
+        try:
+            result = member_dedupe.merge(keep_id, dup_id, user=request.user)
+        except Fidele.DoesNotExist:
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        except member_dedupe.MergeRefused as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+
+class DuplicateDismissView(APIView):
+    """POST /api/fideles/duplicates/<id>/dismiss/ : la paire n’est pas un doublon (plus proposée)."""
+    permission_classes = [CanMergeMembers]
+
+    def post(self, request, pk):
+        updated = member_dedupe.scoped_candidates(request.user).filter(pk=pk).update(status="dismissed")
+        if not updated:
+            return Response({"detail": "Paire introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"id": pk, "status": "dismissed"})
+
+
+class MemberBadgeView(APIView):
+    """
+    GET /api/badge/
+    Badge signé du fidèle connecté, à afficher en QR (vérifiable hors ligne par l’appli de scan).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        fidele = (Fidele.objects.filter(user=request.user)
+                  .values("id", "eglise_id").first())
+        if fidele is None:
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "badge": badges.sign_badge(fidele["id"], fidele["eglise_id"]),
+            "ttl_days": badges.BADGE_TTL_DAYS,
+        })
+
+
+class BadgeKeyView(APIView):
+    """
+    GET /api/checkins/key/
+    Clé publique de vérification des badges (Ed25519), téléchargée par l’appli de scan avant
+    de passer hors ligne. La clé de signature reste sur le serveur.
+    """
+    permission_classes = [CanSyncCheckins]
+
+    def get(self, request):
+        response = Response({"alg": "EdDSA", "crv": "Ed25519", "key": badges.public_key_b64()})
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class BulkCheckinSyncView(APIView):
+    """
+    POST /api/checkins/sync/<event_code>/
+    body = {"checkins": [{"badge": "<payload>", "scanned_at": "<ISO8601>", "client_id": "..."}, …]}
+
+    Synchro des scans faits hors ligne : jusqu’à MAX_SYNC_ROWS lignes par requête,
+    dédoublonnées contre ParticipationEvenement par un INSERT ensembliste.
+    Réponse : un statut par ligne (created, already_present, duplicate_in_batch,
+    invalid_badge, invalid_timestamp, outside_window, unknown_fidele) + un récapitulatif.
+    """
+    permission_classes = [CanSyncCheckins]
+    parser_classes = [JSONParser]
+
+    def post(self, request, event_code=None):
+        window = checkin.get_event_window(event_code)
+        if window is None:
+            return Response({"detail": "Évènement introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+        rows = request.data.get("checkins") if isinstance(request.data, dict) else None
+        if not isinstance(rows, list):
+            return Response({"detail": "Champ 'checkins' (liste) requis."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > checkin.MAX_SYNC_ROWS:
+            return Response(
+                {"detail": f"Au plus {checkin.MAX_SYNC_ROWS} lignes par requête."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = checkin.sync_checkins(window, rows)
+        summary = {}
+        for r in results:
+            summary[r["status"]] = summary.get(r["status"], 0) + 1
+        return Response({"evenement": window["id"], "summary": summary, "results": results})
+
+
+class PositionBatchView(APIView):
+    """
+    POST /api/positions/batch/
+    body = {"positions": [{"latitude", "longitude", "accuracy", "captured_at", "source", "note"}, …]}
+    (ou directement la liste)
+
+    Ingestion groupée des relevés GPS du fidèle connecté : un INSERT pour tout le lot,
+    dernière position dénormalisée mise à jour une seule fois.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        fidele_id = checkin.fidele_id_for_request(request)
+        if fidele_id is None:
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+        data = request.data.get("positions") if isinstance(request.data, dict) else request.data
+        if not isinstance(data, list) or not data:
+            return Response({"detail": "Liste 'positions' requise."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > positions.MAX_BATCH:
+            return Response(
+                {"detail": f"Au plus {positions.MAX_BATCH} relevés par requête."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = PositionInputSerializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        rows = positions.ingest(fidele_id, serializer.validated_data)
+        newest = max(rows, key=lambda p: p.captured_at)
+        return Response({
+            "created": len(rows),
+            "latest": {
+                "latitude": newest.latitude,
+                "longitude": newest.longitude,
+                "accuracy": newest.accuracy,
+                "captured_at": newest.captured_at,
+            },
+        }, status=status.HTTP_201_CREATED)
+
+
+class CalendarSubscriptionView(APIView):
+    """
+    GET /api/calendar/subscriptions/
+    URLs d’abonnement iCalendar (église du fidèle + flux personnel) à ajouter dans une appli calendrier.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        fidele = Fidele.objects.filter(user=request.user).values("id", "eglise_id").first()
+        if fidele is None:
+            return Response({"detail": "Fidèle introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+        def _urls(name, **kwargs):
+            url = request.build_absolute_uri(reverse(name, kwargs=kwargs))
+            return {"https": url, "webcal": "webcal://" + url.split("://", 1)[-1]}
+
+        data = {"membre": _urls("event-calendar-ics-membre", token=ics_feed.member_token(fidele["id"]))}
+        if fidele["eglise_id"]:
+            data["eglise"] = _urls("event-calendar-ics-eglise", pk=fidele["eglise_id"])
+        return Response(data)
+
+
 class ParticipationListCreateView(generics.ListCreateAPIView):
     """
     GET /api/participations/  : liste des participations de l’utilisateur
@@ -312,7 +789,7 @@ class UpcomingEventsView(generics.ListAPIView):
         until = now + timezone.timedelta(days=days)
 
         qs = (
-            Evenement.objects.select_related("eglise", "type")
+            Evenement.objects.select_related("eglise", "type", "stats")
             .filter(
                 eglise_id=fidele.eglise_id,
                 date_fin__gte=now,  # pas encore fini
@@ -835,14 +1312,40 @@ class StandardResultsSetPagination(pagination.PageNumberPagination):
     max_page_size = 100
 
 
+class FideleCursorPagination(pagination.CursorPagination):
+    """
+    Pagination par curseur (?pagination=cursor) pour parcourir toute une église :
+    coût constant par page (index (eglise, created_at, id)), pas de COUNT.
+    L’ordre est fixe ; le paramètre `ordering` est ignoré dans ce mode.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class MemberSearchFilter(filters.SearchFilter):
+    """`?search=` servi par l’index trigramme de Fidele.search_text (noms, téléphone, qlook_id)."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return member_search.filter_queryset(queryset, " ".join(terms))
+
+
 class FideleViewSet(viewsets.ModelViewSet):
     queryset = Fidele.objects.filter(is_deleted=0).select_related(
-        'user', 'eglise', 'type_membre'
-    ).prefetch_related('fonction')
+        'user', 'eglise', 'type_membre', 'fonction'
+    )
     serializer_class = FideleSerializer
-    permission_classes = [IsAuthenticated]
+    # Lecture : permission fidele.view_fidele ; écriture : permissions du modèle
+    permission_classes = [CanSearchMembers, permissions.DjangoModelPermissions]
     pagination_class = StandardResultsSetPagination
-    # filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, MemberSearchFilter, filters.OrderingFilter]
 
     filterset_fields = {
         'eglise': ['exact'],
@@ -854,14 +1357,12 @@ class FideleViewSet(viewsets.ModelViewSet):
         'created_at': ['gte', 'lte', 'exact'],
     }
 
+    # Indicatif (schéma OpenAPI) : la recherche porte sur Fidele.search_text
     search_fields = [
         'user__first_name',
         'user__last_name',
-        'user__email',
         'phone',
         'qlook_id',
-        'profession',
-        'entreprise',
     ]
 
     ordering_fields = [
@@ -872,6 +1373,24 @@ class FideleViewSet(viewsets.ModelViewSet):
     ]
     ordering = ['user__last_name']
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        if user.is_staff:
+            return qs
+        # Hors staff : uniquement les fidèles de sa propre église
+        eglise_id = getattr(getattr(user, 'fidele', None), 'eglise_id', None)
+        return qs.filter(eglise_id=eglise_id) if eglise_id else qs.none()
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request is not None and self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = FideleCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
 
 class AccountDeletePerformWebhook(View):
     """API minimale: POST authentifié (via session/cookie ou DRF/JWT si tu utilises DRF).
@@ -1003,7 +1522,6 @@ class EgliseDetailView(generics.RetrieveAPIView):
         return ctx
 
 
-@method_decorator(cache_page(60 * 2), name="dispatch")
 class EgliseProcheListView(generics.ListAPIView):
     """
     Églises proches d'une position (public) :
@@ -1012,59 +1530,78 @@ class EgliseProcheListView(generics.ListAPIView):
     - radius en km (par défaut 10)
     - all=1 pour ignorer le filtre de distance (renvoie toutes les églises avec distance, triées)
     - limit: nombre max d’items (défaut 500, plafond 2000)
+
+    Les positions sont quantifiées en cellules geohash : les candidats (préfiltre ST_DWithin +
+    tri KNN) sont partagés en cache par les utilisateurs voisins, seule la distance exacte
+    est recalculée pour chaque requête.
     """
     permission_classes = [AllowAny]
     authentication_classes = []
     serializer_class = EgliseListSerializer
 
+    def _params(self):
+        qp = self.request.query_params
+        radius = float(qp.get('radius', 10.0))  # km
+        # plafond côté API (évite les abus)
+        radius = max(0.1, min(radius, 5000.0))
+        show_all = str(qp.get('all', '0')).lower() in ('1', 'true', 'yes')
+        limit = int(qp.get('limit', 500))
+        limit = max(1, min(limit, 2000))
+        return radius, show_all, limit
+
+    def _user_position(self):
+        try:
+            lat = float(self.request.query_params['lat'])
+            lon = float(self.request.query_params['lon'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        return lat, lon
 
     def get_queryset(self):
-        qs = Eglise.objects.filter(location__isnull=False)
-        lat = self.request.query_params.get('lat')
-        lon = self.request.query_params.get('lon')
+        # Sans position : tout, tri alphabétique, avec limite
+        _, _, limit = self._params()
+        return Eglise.objects.filter(location__isnull=False).order_by('name')[:limit]
 
-        radius = float(self.request.query_params.get('radius', 10.0))  # km
-        # plafond côté API (évite les abus)
-        radius = max(0.1, min(radius, 5000.0))
+    def list(self, request, *args, **kwargs):
+        position = self._user_position()
+        if position is None:
+            return super().list(request, *args, **kwargs)
 
-        show_all = str(self.request.query_params.get('all', '0')).lower() in ('1', 'true', 'yes')
+        radius, show_all, limit = self._params()
+        rows = nearby_churches.nearby(*position, radius_km=radius, show_all=show_all, limit=limit)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(rows)
 
-        limit = int(self.request.query_params.get('limit', 500))
-        limit = max(1, min(limit, 2000))
 
-        if lat and lon:
-            try:
-                user_pt = Point(float(lon), float(lat), srid=4326)
-                # Distance sphérique en mètres et tri par distance
-                qs = qs.annotate(
-                    distance=Distance('location', user_pt),
-                ).order_by('distance')
-
-                if not show_all:
-                    # filtrage par rayon seulement si all=0
-                    qs = qs.filter(distance__lte=radius * 1000.0)
-
-                # limite “hard” pour les performances
-                qs = qs[:limit]
-
-                # On stocke des infos pour le serializer
-                self.request._user_point = user_pt
-                self.request._radius_m = radius * 1000.0
-            except (ValueError, TypeError):
-                # lat/lon invalides -> pas d’annotation distance
-                qs = qs[:limit]
-        else:
-            # pas de position -> renvoyer tout, tri alphabétique, avec limite
-            qs = qs.order_by('name')[:limit]
+class EgliseTileView(View):
+    """
+    GET /api/eglises/tiles/<z>/<x>/<y>.mvt
+    Tuiles vectorielles (Mapbox Vector Tile, couche « eglises ») générées par ST_AsMVT.
+    Jusqu’au zoom church_tiles.CLUSTER_MAX_ZOOM les églises sont regroupées (attribut point_count).
+    Chaque tuile est mise en cache jusqu’à la prochaine modification de géométrie d’une église.
+    """
 
-        return qs
+    def get(self, request, z, x, y):
+        if not church_tiles.valid_tile(z, x, y):
+            return JsonResponse({"detail": "Tuile invalide."}, status=400)
+
+        version = church_tiles.tile_version()
+        etag = f'"eglises-{version}-{z}-{x}-{y}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+        resp = HttpResponse(church_tiles.get_tile(z, x, y, version), content_type="application/vnd.mapbox-vector-tile")
+        resp["ETag"] = etag
+        resp["Cache-Control"] = "public, max-age=300"
+        resp["Access-Control-Allow-Origin"] = "*"
+        return resp
 
-    def get_serializer_context(self):
-        ctx = super().get_serializer_context()
-        # passer infos au serializer pour calculer in_range
-        ctx['user_point'] = getattr(self.request, '_user_point', None)
-        ctx['radius_m'] = getattr(self.request, '_radius_m', None)
-        return ctx
 
 @api_view(['GET'])
 def eglises_avec_verset_du_jour(request):
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import ExtractDay, ExtractMonth
 
 from fidele.models import Fidele, User
 
@@ -28,5 +29,11 @@ class Mariage(models.Model):
     photos = models.FileField(upload_to='mariages/photos/', blank=True)
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Anniversaires de mariage du jour (abmci.services.celebrations)
+            models.Index(ExtractMonth("date_mariage"), ExtractDay("date_mariage"), name="mariage_md_idx"),
+        ]
+
 
 
@@ -1,10 +1,8 @@
-import csv
-
 from django.contrib import admin
-from django.http import HttpResponse
 from django.utils.html import format_html
 from simple_history.admin import SimpleHistoryAdmin
 from django.utils.translation import gettext_lazy as _
+from abmci.services import exports
 from event.models import Evenement, ParticipationEvenement, TypeEvent
 
 
@@ -66,35 +64,20 @@ def action_generer_occurrences(modeladmin, request, queryset):
     modeladmin.message_user(request, f"{created} occurrence(s) créée(s).")
 
 
+def _export_participants(modeladmin, request, queryset, fmt):
+    """Export en flux (ou en tâche de fond si volumineux) des participations des événements sélectionnés."""
+    evenement_ids = list(queryset.values_list("pk", flat=True))
+    return exports.export_response(request, "participants", {"evenement_ids": evenement_ids}, fmt=fmt)
+
+
 @admin.action(description="Exporter participants (CSV) des événements sélectionnés")
 def action_export_participants_csv(modeladmin, request, queryset):
-    """Export CSV de toutes les participations des événements sélectionnés."""
-    response = HttpResponse(content_type="text/csv; charset=utf-8")
-    response["Content-Disposition"] = 'attachment; filename="participants_events.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["event_code", "event_title", "fidele_id", "fidele_nom", "fidele_prenom",
-                     "phone", "date_participation", "qr_code_scanned"])
-
-    parts = (ParticipationEvenement.objects
-             .filter(evenement__in=queryset)
-             .select_related("evenement", "fidele", "fidele__user")
-             .order_by("evenement__code", "-date"))
-
-    for p in parts:
-        user = getattr(p.fidele, "user", None)
-        prenom = getattr(user, "first_name", "") if user else ""
-        nom = getattr(user, "last_name", "") if user else ""
-        phone = getattr(p.fidele, "phone", "") or ""
-        writer.writerow([
-            p.evenement.code,
-            p.evenement.titre,
-            p.fidele_id,
-            nom, prenom,
-            phone,
-            p.date.strftime("%Y-%m-%d %H:%M:%S"),
-            "1" if p.qr_code_scanned else "0",
-        ])
-    return response
+    return _export_participants(modeladmin, request, queryset, "csv")
+
+
+@admin.action(description="Exporter participants (XLSX, en arrière-plan) des événements sélectionnés")
+def action_export_participants_xlsx(modeladmin, request, queryset):
+    return _export_participants(modeladmin, request, queryset, "xlsx")
 
 
 # --------- ModelAdmins ---------
@@ -122,10 +105,11 @@ class EvenementAdmin(admin.ModelAdmin):
         "titre", "code", "lieu", "description",
         "eglise__name", "type__name",
     )
+    list_select_related = ("eglise", "type", "stats")
     date_hierarchy = "date_debut"
     readonly_fields = ("code", "qr_preview", "taux_participation_display")
     inlines = [ParticipationInline]
-    actions = [action_generer_occurrences, action_export_participants_csv]
+    actions = [action_generer_occurrences, action_export_participants_csv, action_export_participants_xlsx]
     autocomplete_fields = ("eglise", "type")
 
     fieldsets = (
@@ -0,0 +1,89 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from abmci.services import checkin
+from abmci.services.event_stats import ensure_stats
+from event.models import Evenement, ParticipationEvenement
+from fidele.models import Fidele
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge du chemin rapide de scan QR (cache fenêtre + INSERT ON CONFLICT). "
+        "Simule une rafale d’entrées sur un évènement et affiche le débit soutenu (scans/s)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event-code", required=True, help="Code de l’évènement cible")
+        parser.add_argument("--fideles", type=int, default=2000,
+            help="Nombre de fidèles (existants) qui scannent (par défaut 2000)")
+        parser.add_argument("--workers", type=int, default=8,
+            help="Nombre de scanners concurrents (utiliser 1 sur SQLite)")
+        parser.add_argument("--repeat", type=int, default=1,
+            help="Nombre de scans par fidèle (>1 simule les doubles scans)")
+        parser.add_argument("--cleanup", action="store_true",
+            help="Supprime les présences créées par le test et recalcule les stats")
+
+    def handle(self, *args, **opts):
+        code = opts["event_code"]
+        window = checkin.get_event_window(code)
+        if window is None:
+            raise CommandError(f"Évènement introuvable: {code}")
+
+        event_id = window["id"]
+        already = set(ParticipationEvenement.objects.filter(evenement_id=event_id)
+                      .values_list("fidele_id", flat=True))
+        fidele_ids = list(Fidele.objects.exclude(pk__in=already)
+                          .order_by("pk").values_list("pk", flat=True)[:opts["fideles"]])
+        if not fidele_ids:
+            raise CommandError("Aucun fidèle disponible pour le test.")
+
+        scans = fidele_ids * max(1, opts["repeat"])
+        self.stdout.write(f"Scans: {len(scans)} ({len(fidele_ids)} fidèle(s)), workers: {opts['workers']}")
+
+        def _scan(fidele_id):
+            t0 = time.perf_counter()
+            w = checkin.get_event_window(code)
+            scanned_at = timezone.now()
+            created = checkin.insert_participation(w["id"], fidele_id, scanned_at) is not None
+            if created:
+                checkin.after_checkins(w, 1, [(fidele_id, scanned_at)])
+            return created, time.perf_counter() - t0
+
+        def _run(chunk):
+            try:
+                return [_scan(fid) for fid in chunk]
+            finally:
+                connection.close()
+
+        workers = max(1, opts["workers"])
+        chunks = [scans[i::workers] for i in range(workers)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [r for chunk in pool.map(_run, chunks) for r in chunk]
+        elapsed = time.perf_counter() - started
+
+        created = sum(1 for ok, _ in results if ok)
+        latencies = sorted(lat for _, lat in results)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(results)} scans en {elapsed:.2f}s → {len(results) / elapsed:.0f} scans/s "
+                f"(créés: {created}, doublons: {len(results) - created}, "
+                f"p50: {statistics.median(latencies) * 1000:.1f}ms, p95: {p95 * 1000:.1f}ms)"
+            )
+        )
+
+        if opts["cleanup"]:
+            deleted, _ = ParticipationEvenement.objects.filter(
+                evenement_id=event_id, fidele_id__in=fidele_ids
+            ).delete()
+            ensure_stats(Evenement.objects.get(pk=event_id))
+            self.stdout.write(f"Nettoyage: {deleted} présence(s) supprimée(s)")
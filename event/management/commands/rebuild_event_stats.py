@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from abmci.services.event_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques pré-calculées (participants, scans, invités) de tous les évènements."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+            help="Taille des lots d’écriture (par défaut 1000)")
+
+    def handle(self, *args, **opts):
+        count = rebuild_stats(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Statistiques recalculées: {count} évènement(s)"))
@@ -58,11 +58,13 @@ class Evenement(models.Model):
     is_recurrent = models.BooleanField(default=False)
     recurrence_rule = models.TextField(null=True, blank=True)  # Pour stocker la règle de récurrence
     end_recurrence = models.DateTimeField(null=True, blank=True)  # Date de fin de récurrence
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)  # Last-Modified des flux ICS
 
     class Meta:
         indexes = [
             models.Index(fields=["eglise", "date_debut"]),
             models.Index(fields=["date_fin"]),
+            models.Index(fields=["eglise", "updated_at"]),
         ]
 
     # recurrence = RecurrenceField(null=True, blank=True)
@@ -180,9 +182,25 @@ class Evenement(models.Model):
             return Fidele.objects.filter(eglise=self.eglise, is_deleted=0)
         return Fidele.objects.none()
 
+    def get_stats(self) -> "EvenementStats":
+        """
+        Statistiques pré-calculées (maintenues par signaux).
+        Utiliser select_related("stats") sur les listes pour éviter une requête par ligne.
+        """
+        try:
+            return self.stats
+        except EvenementStats.DoesNotExist:
+            from abmci.services.event_stats import ensure_stats
+            self.stats = ensure_stats(self)
+            return self.stats
+
     @property
     def nombre_participants(self):
-        return ParticipationEvenement.objects.filter(evenement=self).count()
+        return self.get_stats().participants
+
+    @property
+    def nombre_scannes(self):
+        return self.get_stats().scannes
 
     @property
     def liste_participants(self):
@@ -190,16 +208,34 @@ class Evenement(models.Model):
 
     @property
     def taux_participation(self):
-        from fidele.models import Fidele
-        total_participants = Fidele.objects.count()  # Modifier selon votre modèle Fidele
-        if total_participants > 0:
-            return round((self.nombre_participants / total_participants) * 100, 2)
-        return 0
+        # Rapporté aux fidèles de l’église de l’évènement (et non à tous les fidèles)
+        return self.get_stats().taux_participation
+
     @property
     def nombre_invite(self):
-        from fidele.models import Fidele
-        invites = Fidele.objects.count()
-        return invites
+        return self.get_stats().invites
+
+
+class EvenementStats(models.Model):
+    """
+    Compteurs par évènement, maintenus incrémentalement :
+    - participants / scannes : à chaque participation (création/suppression)
+    - invites : fidèles actifs de l’église, ajusté à chaque création/transfert/suppression de fidèle
+    """
+    evenement = models.OneToOneField(Evenement, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    participants = models.IntegerField(default=0)
+    scannes = models.IntegerField(default=0)
+    invites = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.evenement_id}: {self.participants}/{self.invites}'
+
+    @property
+    def taux_participation(self):
+        if self.invites > 0:
+            return round((self.participants / self.invites) * 100, 2)
+        return 0
 
 
 class ParticipationEvenement(models.Model):
@@ -216,6 +252,9 @@ class ParticipationEvenement(models.Model):
     class Meta:
         # Ajoutez une contrainte unique pour garantir qu'un participant ne peut pas être enregistré deux fois
         unique_together = ('fidele', 'evenement',)
+        permissions = (
+            ("can_sync_checkins", "Peut synchroniser des présences scannées hors ligne"),
+        )
 
     def clean(self):
         # Validez que la même personne ne peut pas être enregistrée deux fois
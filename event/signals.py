@@ -0,0 +1,150 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver
+
+from abmci.services import engagement, event_stats
+from abmci.services.calendar_feed import bump_version
+from abmci.services.checkin import fidele_id_for_user, invalidate_event, invalidate_member
+from abmci.services.ics_feed import mark_modified
+from event.models import Evenement, ParticipationEvenement
+from fidele.models import Fidele
+
+
+@receiver(post_init, sender=Evenement)
+def remember_event_cache_scope(sender, instance: Evenement, **kwargs):
+    instance._cached_scope = (instance.__dict__.get("eglise_id"), instance.__dict__.get("code"))
+
+
+@receiver([post_save, post_delete], sender=Evenement)
+def invalidate_calendar_on_event_change(sender, instance: Evenement, **kwargs):
+    # Ancienne et nouvelle valeur : un évènement déplacé d’église (ou recodé) disparaît des deux
+    previous_eglise_id, previous_code = getattr(instance, "_cached_scope", (None, None))
+    instance._cached_scope = (instance.eglise_id, instance.code)
+    for eglise_id in {previous_eglise_id, instance.eglise_id}:
+        # Le calendrier est mis en cache par (église, mois) : on invalide l’église concernée
+        bump_version(eglise_id)
+        # Flux ICS : la dernière modification de l’église sert de clé de cache / ETag
+        mark_modified(eglise_id)
+    # Fenêtre de validité du QR (scan rapide) mise en cache par code
+    for code in {previous_code, instance.code} - {None}:
+        invalidate_event(code)
+
+
+@receiver([post_save, post_delete], sender=ParticipationEvenement)
+def invalidate_calendar_on_participation_change(sender, instance: ParticipationEvenement, **kwargs):
+    # Le nombre de participants est affiché dans le calendrier
+    eglise_id = (
+        Evenement.objects.filter(pk=instance.evenement_id).values_list("eglise_id", flat=True).first()
+    )
+    bump_version(eglise_id)
+
+
+# -------------------------------
+# Scan rapide : fidèle autorisé (compte actif, fiche non supprimée) mis en cache
+# -------------------------------
+
+@receiver([post_save, post_delete], sender=Fidele)
+def invalidate_member_on_fidele_change(sender, instance: Fidele, **kwargs):
+    invalidate_member(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidate_member_on_user_change(sender, instance: User, created: bool, update_fields=None, **kwargs):
+    # Seul is_active compte (les connexions n’enregistrent que last_login)
+    if created or (update_fields is not None and "is_active" not in update_fields):
+        return
+    fidele_id = fidele_id_for_user(instance.pk)
+    if fidele_id:
+        invalidate_member(fidele_id)
+
+
+# -------------------------------
+# Statistiques d’évènement (EvenementStats)
+# -------------------------------
+
+@receiver(post_init, sender=Evenement)
+def remember_event_stats_scope(sender, instance: Evenement, **kwargs):
+    instance._stats_eglise_id = instance.__dict__.get("eglise_id")
+
+
+@receiver(post_save, sender=Evenement)
+def init_event_stats(sender, instance: Evenement, created: bool, **kwargs):
+    # Création : ligne de stats calculée ; changement d’église : invités seulement
+    # (les compteurs de présence sont maintenus par F() au fil des scans)
+    previous = getattr(instance, "_stats_eglise_id", None)
+    instance._stats_eglise_id = instance.eglise_id
+    if created:
+        event_stats.ensure_stats(instance)
+    elif previous != instance.eglise_id:
+        event_stats.refresh_invites(instance)
+
+
+@receiver(post_save, sender=ParticipationEvenement)
+def count_participation(sender, instance: ParticipationEvenement, created: bool, **kwargs):
+    if created:
+        event_stats.record_participations(instance.evenement_id, 1, 1 if instance.qr_code_scanned else 0)
+    else:
+        event_stats.refresh_scanned(instance.evenement_id)
+
+
+@receiver(post_delete, sender=ParticipationEvenement)
+def uncount_participation(sender, instance: ParticipationEvenement, **kwargs):
+    event_stats.record_participations(instance.evenement_id, -1, -1 if instance.qr_code_scanned else 0)
+
+
+# -------------------------------
+# Assiduité (abmci.services.engagement)
+# -------------------------------
+
+@receiver(post_save, sender=ParticipationEvenement)
+def record_engagement(sender, instance: ParticipationEvenement, created: bool, **kwargs):
+    # Présences saisies par l’ORM (admin, API) ; les scans passent par checkin.after_checkins
+    if created:
+        engagement.record_attendances([(instance.fidele_id, instance.date)])
+
+
+@receiver(post_delete, sender=ParticipationEvenement)
+def recompute_engagement(sender, instance: ParticipationEvenement, **kwargs):
+    fidele_id = instance.fidele_id
+
+    def run():
+        try:
+            engagement.recompute([fidele_id])
+        except Exception as e:
+            # Rattrapé par le recalcul nocturne
+            print(f"[signals] engagement.recompute error: {e!r}")
+
+    transaction.on_commit(run)
+
+
+def _invite_state(instance: Fidele):
+    # Lecture via __dict__ : ne déclenche pas de requête si le champ est différé (.only())
+    d = instance.__dict__
+    if "eglise_id" not in d or "is_deleted" not in d:
+        return None
+    return d["eglise_id"], d["is_deleted"]
+
+
+@receiver(post_init, sender=Fidele)
+def remember_fidele_invite_state(sender, instance: Fidele, **kwargs):
+    instance._invite_state = _invite_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Fidele)
+def update_invites_on_fidele_save(sender, instance: Fidele, created: bool, **kwargs):
+    old = None if created else getattr(instance, "_invite_state", None)
+    new = _invite_state(instance)
+    if not created and old is None:
+        # État initial inconnu (champs différés) : on ne devine pas
+        return
+    for eglise_id, delta in event_stats.fidele_invite_deltas(old, new).items():
+        event_stats.shift_invites(eglise_id, delta)
+    instance._invite_state = new
+
+
+@receiver(post_delete, sender=Fidele)
+def update_invites_on_fidele_delete(sender, instance: Fidele, **kwargs):
+    old = getattr(instance, "_invite_state", None) or _invite_state(instance)
+    for eglise_id, delta in event_stats.fidele_invite_deltas(old, None).items():
+        event_stats.shift_invites(eglise_id, delta)
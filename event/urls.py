@@ -1,10 +1,14 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path
-from event.views import EventListView, EventCalendarView, EventDetailView
+from event.views import EventListView, EventCalendarView, EventDetailView, EventCalendarFeedView, \
+    EgliseCalendarIcsView, MemberCalendarIcsView
 
 urlpatterns = [
                   path('calendrier', EventCalendarView.as_view(), name='event-calend'),
+                  path('calendrier/feed', EventCalendarFeedView.as_view(), name='event-calendar-feed'),
+                  path('calendrier/eglise/<int:pk>.ics', EgliseCalendarIcsView.as_view(), name='event-calendar-ics-eglise'),
+                  path('calendrier/membre/<str:token>.ics', MemberCalendarIcsView.as_view(), name='event-calendar-ics-membre'),
                   path('event-list', EventListView.as_view(), name='event-list'),
                   path('event/<int:pk>', EventDetailView.as_view(), name='event-detail'),
                   # path('event?download_qr_code=true', download_qr_code_pdf.views, name='event-downl'),
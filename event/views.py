@@ -6,12 +6,15 @@ from datetime import timedelta, datetime
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.core.serializers.json import DjangoJSONEncoder
-from django.http import HttpResponse, Http404
-from django.shortcuts import render, redirect
+from django.http import HttpResponse, Http404, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views import View
 from django.views.generic import ListView, DetailView, TemplateView
 from django.views.generic.edit import CreateView
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 import qrcode
 from PIL import Image
 from io import BytesIO
@@ -20,15 +23,18 @@ from reportlab.lib.colors import HexColor, black
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 
+from abmci.services import ics_feed
+from abmci.services.calendar_feed import calendar_feed, parse_bound
+from abmci.utils.phones import normalize_phone
 from event.models import Evenement, ParticipationEvenement
+from fidele.models import Eglise, Fidele
 from reportlab.pdfgen import canvas
 from django.db import transaction
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
-from rest_framework_simplejwt.tokens import RefreshToken
+from api.tokens import FideleTokenObtainPairSerializer
 from firebase_admin import auth as fb_auth, _auth_utils
-import phonenumbers
 
 def generate_qr_code(data):
     qr = qrcode.QRCode(
@@ -46,15 +52,6 @@ def generate_qr_code(data):
     return buffer.getvalue()
 
 
-def normalize_phone(phone: str | None) -> str | None:
-    if not phone:
-        return None
-    try:
-        p = phonenumbers.parse(phone, None)
-        return phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.E164)
-    except Exception:
-        return phone
-
 class FirebaseLoginView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -130,7 +127,7 @@ class FirebaseLoginView(APIView):
             return Response({"detail": "E-mail non vérifié."}, status=403)
 
         # Émettre un JWT pour consommer ton API
-        refresh = RefreshToken.for_user(user)
+        refresh = FideleTokenObtainPairSerializer.get_token(user)
         return Response({
             "access": str(refresh.access_token),
             "refresh": str(refresh),
@@ -146,52 +143,79 @@ class EventCalendarView(TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
-        # Récupération des événements (adapte les filtres selon tes besoins)
-        qs = (
-            Evenement.objects.select_related("type")
-            .order_by("date_debut")
-        )
-
-        # Sérialisation FullCalendar
-        events = []
-        for ev in qs:
-            events.append({
-                "id": ev.id,
-                "title": ev.titre,
-                "start": ev.date_debut.isoformat(),
-                "end": ev.date_fin.isoformat() if ev.date_fin else None,
-                "url": reverse("event-detail", args=[ev.pk]),
-                "backgroundColor": self._color_for_type(ev.type.name if ev.type else None),
-                "borderColor": self._color_for_type(ev.type.name if ev.type else None),
-                "extendedProps": {
-                    "lieu": ev.lieu or "",
-                    "description": ev.description or "",
-                    "banner": ev.banner.url if ev.banner else "",
-                    "qr_code": ev.qr_code.url if ev.qr_code else "",
-                    "participants": getattr(ev, "nombre_participants", 0),
-                },
-            })
-
-        ctx["events_json"] = json.dumps(events, cls=DjangoJSONEncoder)
+        # Les évènements sont chargés par FullCalendar (flux JSON borné start/end)
+        feed_url = reverse("event-calendar-feed")
+        eglise_id = self.request.GET.get("eglise")
+        if eglise_id:
+            feed_url = f"{feed_url}?eglise={eglise_id}"
+        ctx["events_feed_url"] = feed_url
         return ctx
 
-    @staticmethod
-    def _color_for_type(type_name: str | None) -> str:
-        """Mappe un type d’évènement vers une couleur FullCalendar."""
-        if not type_name:
-            return "#6576ff"  # défaut (DashLite primary)
-        key = type_name.strip().lower()
-        palette = {
-            "meeting": "#6576ff",
-            "conférence": "#f56b6b",
-            "conference": "#f56b6b",
-            "atelier": "#45cb85",
-            "workshop": "#45cb85",
-            "formation": "#ffaa00",
-            "training": "#ffaa00",
-            "culte": "#9b51e0",
-        }
-        return palette.get(key, "#6576ff")
+
+class EventCalendarFeedView(View):
+    """
+    GET /evenements/calendrier/feed?start=...&end=...&eglise=<id>
+    Flux JSON FullCalendar : borné par start/end, filtré par église,
+    comptage des participants annoté, mis en cache par (église, mois).
+    """
+
+    def get(self, request, *args, **kwargs):
+        start = parse_bound(request.GET.get("start"))
+        end = parse_bound(request.GET.get("end"))
+        if start is None or end is None:
+            return JsonResponse({"detail": "Paramètres start/end invalides."}, status=400)
+
+        eglise_id = request.GET.get("eglise")
+        try:
+            eglise_id = int(eglise_id) if eglise_id else None
+        except (TypeError, ValueError):
+            return JsonResponse({"detail": "Paramètre eglise invalide."}, status=400)
+
+        events = calendar_feed(start, end, eglise_id=eglise_id)
+        resp = JsonResponse(events, safe=False, encoder=DjangoJSONEncoder)
+        resp["Cache-Control"] = "private, max-age=60"
+        return resp
+
+
+def _ics_response(request, body: str, etag: str, last_modified: int, filename: str,
+                  private: bool = False) -> HttpResponse:
+    """Réponse ICS avec GET conditionnel (If-None-Match / If-Modified-Since → 304)."""
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    resp = not_modified or HttpResponse(body, content_type="text/calendar; charset=utf-8")
+    resp["ETag"] = etag
+    resp["Last-Modified"] = http_date(last_modified)
+    resp["Cache-Control"] = f"{'private' if private else 'public'}, max-age=900"
+    if not not_modified:
+        resp["Content-Disposition"] = f'inline; filename="{filename}.ics"'
+    return resp
+
+
+class EgliseCalendarIcsView(View):
+    """
+    GET /evenements/calendrier/eglise/<pk>.ics
+    Flux iCalendar d’abonnement (à venir + séries récurrentes en RRULE) d’une église.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        eglise = get_object_or_404(Eglise.objects.only("pk", "name"), pk=pk)
+        body, etag, last_modified = ics_feed.church_feed(eglise)
+        return _ics_response(request, body, etag, last_modified, f"eglise-{eglise.pk}")
+
+
+class MemberCalendarIcsView(View):
+    """
+    GET /evenements/calendrier/membre/<token>.ics
+    Flux personnel d’un fidèle ; le jeton signé remplace l’authentification
+    (les applis calendrier ne savent pas envoyer de JWT).
+    """
+
+    def get(self, request, token, *args, **kwargs):
+        fidele_id = ics_feed.fidele_id_from_token(token)
+        if fidele_id is None:
+            raise Http404("Flux introuvable.")
+        fidele = get_object_or_404(Fidele.objects.only("pk", "eglise_id"), pk=fidele_id)
+        body, etag, last_modified = ics_feed.member_feed(fidele)
+        return _ics_response(request, body, etag, last_modified, f"membre-{fidele.pk}", private=True)
 
 
 class EventListView(LoginRequiredMixin, ListView):
@@ -200,7 +224,7 @@ class EventListView(LoginRequiredMixin, ListView):
     context_object_name = 'ivent'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related("stats")
         queryset = queryset.filter(date_debut__gt=timezone.now() - timedelta(days=7))
         return queryset
 
@@ -229,6 +253,7 @@ class EventListView(LoginRequiredMixin, ListView):
 
 class EventDetailView(LoginRequiredMixin, DetailView):
     model = Evenement
+    queryset = Evenement.objects.select_related("stats")
     template_name = "event/event-detail.html"
     context_object_name = "event_detail"
 
@@ -282,8 +307,9 @@ class EventDetailView(LoginRequiredMixin, DetailView):
         event: Evenement = ctx["event_detail"]
 
         participants_qs = ParticipationEvenement.objects.filter(evenement=event).select_related("fidele__user")
-        nb_participants = participants_qs.count()
-        taux = event.taux_participation
+        stats = event.get_stats()
+        nb_participants = stats.participants
+        taux = stats.taux_participation
         now = timezone.now()
 
         ctx.update({
@@ -302,24 +328,7 @@ class EventDetailView(LoginRequiredMixin, DetailView):
         return ctx
 
     def ics_response(self, event: Evenement) -> HttpResponse:
-        # Petit ICS minimaliste
-        dt_start = timezone.localtime(event.date_debut).strftime('%Y%m%dT%H%M%S')
-        dt_end = timezone.localtime(event.date_fin).strftime('%Y%m%dT%H%M%S')
-        ics = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//ABMCI//Event//FR
-BEGIN:VEVENT
-UID:{event.code}@abmci
-DTSTAMP:{timezone.now().strftime('%Y%m%dT%H%M%S')}
-DTSTART:{dt_start}
-DTEND:{dt_end}
-SUMMARY:{event.titre}
-LOCATION:{event.lieu}
-DESCRIPTION:{event.description}
-END:VEVENT
-END:VCALENDAR
-"""
-        resp = HttpResponse(ics, content_type="text/calendar; charset=utf-8")
+        resp = HttpResponse(ics_feed.event_calendar(event), content_type="text/calendar; charset=utf-8")
         resp['Content-Disposition'] = f'attachment; filename="{event.code}.ics"'
         return resp
 
@@ -12,8 +12,10 @@ from django.contrib.gis import admin as gis_admin
 from fidele.models import Department, MembreType, Fidele, Location, TypeLocation, Fonction, OuvrierPermanence, \
     Permanence, Eglise, Familles, SujetPriere, ProblemeParticulier, UserProfileCompletion, PrayerLike, PrayerComment, \
     PrayerRequest, PrayerCategory, BibleVersion, BibleVerse, Banner, DonationCategory, Donation, VerseOfDay, \
-    FidelePosition
+    FidelePosition, ExportJob, ImportJob, DuplicateCandidate
 from django.contrib.gis.db import models
+from django.db import transaction
+from abmci.services import exports
 
 # Register your models here.
 admin.site.site_header = 'BACK-END ABMCI'
@@ -257,6 +259,21 @@ class DonationCategoryAdmin(admin.ModelAdmin):
     donation_count.short_description = "Nombre de dons"
 
 
+def _export_params(model_admin, request, queryset) -> dict:
+    """
+    Paramètres d’export d’une action : ids cochés (une page au plus) ; pour « tout sélectionner »,
+    les critères de la liste (filtres, recherche) plutôt que des dizaines de milliers d’ids.
+    """
+    if request.POST.get("select_across") != "1":
+        return {"ids": list(queryset.values_list("pk", flat=True))}
+    changelist = model_admin.get_changelist_instance(request)
+    return {
+        "lookups": {key: list(values) for key, values in changelist.get_filters_params().items()},
+        "search": changelist.query,
+        "search_fields": list(model_admin.get_search_fields(request)),
+    }
+
+
 @admin.register(Donation)
 class DonationAdmin(admin.ModelAdmin):
     list_display = (
@@ -287,7 +304,8 @@ class DonationAdmin(admin.ModelAdmin):
         "category__name",
     )
     list_select_related = ("user", "category")
-    actions = ("resend_payment_link", "mark_as_successful", "mark_as_failed")
+    actions = ("resend_payment_link", "mark_as_successful", "mark_as_failed",
+               "export_donations_csv", "export_donations_xlsx")
     readonly_fields = ("reference", "created_at", "authorization_url")
     autocomplete_fields = ("user", "category")
     ordering = ("-created_at",)
@@ -382,6 +400,15 @@ class DonationAdmin(admin.ModelAdmin):
         updated = updatable.update(status="failed")
         self.message_user(request, f"{updated} don(s) marqué(s) comme échoué(s).", level=messages.WARNING)
 
+    @admin.action(description="Exporter les dons sélectionnés (CSV)")
+    def export_donations_csv(self, request, queryset):
+        params = _export_params(self, request, queryset)
+        return exports.export_response(request, "donations", params, total=len(params.get("ids", [])) or None)
+
+    @admin.action(description="Exporter les dons sélectionnés (XLSX, arrière-plan)")
+    def export_donations_xlsx(self, request, queryset):
+        return exports.export_response(request, "donations", _export_params(self, request, queryset), fmt="xlsx")
+
     # ---------- Optimisations ----------
 
     def get_queryset(self, request):
@@ -432,29 +459,89 @@ class VerseOfDayAdmin(admin.ModelAdmin):
 class FidelePositionAdmin(admin.ModelAdmin):
     # ... configuration existante ...
 
-    actions = ['export_positions_csv']
+    actions = ['export_positions_csv', 'export_positions_xlsx']
 
     def export_positions_csv(self, request, queryset):
-        """Action pour exporter les positions sélectionnées en CSV"""
-        import csv
-        from django.http import HttpResponse
+        """Action pour exporter les positions sélectionnées en CSV (flux, ou tâche de fond si volumineux)"""
+        params = _export_params(self, request, queryset)
+        return exports.export_response(request, "positions", params, total=len(params.get("ids", [])) or None)
+
+    export_positions_csv.short_description = "Exporter les positions sélectionnées en CSV"
+
+    def export_positions_xlsx(self, request, queryset):
+        return exports.export_response(request, "positions", _export_params(self, request, queryset), fmt="xlsx")
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="positions.csv"'
+    export_positions_xlsx.short_description = "Exporter les positions sélectionnées en XLSX (arrière-plan)"
 
-        writer = csv.writer(response)
-        writer.writerow(['Fidèle', 'Latitude', 'Longitude', 'Précision', 'Date', 'Source'])
 
-        for position in queryset:
-            writer.writerow([
-                str(position.fidele),
-                position.latitude,
-                position.longitude,
-                position.accuracy or '',
-                position.captured_at,
-                position.source
-            ])
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "format", "status", "rows", "user", "created_at", "finished_at", "download_link")
+    list_filter = ("status", "kind", "format")
+    list_select_related = ("user",)
+    # `file` n’est pas affiché : stockage privé sans URL, lien de téléchargement par download_link
+    readonly_fields = ("user", "kind", "format", "params", "status", "download_link", "rows", "error",
+                       "created_at", "finished_at")
+    exclude = ("file",)
+    ordering = ("-created_at",)
+
+    def has_add_permission(self, request):
+        return False
 
-        return response
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Chacun ne voit que ses exports (sauf superutilisateur)
+        return qs if request.user.is_superuser else qs.filter(user=request.user)
 
-    export_positions_csv.short_description = "Exporter les positions sélectionnées en CSV"
\ No newline at end of file
+    @admin.display(description="Fichier")
+    def download_link(self, obj: ExportJob) -> str:
+        if not obj.file:
+            return "-"
+        return format_html('<a href="{}">Télécharger</a>', exports.download_url(obj))
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """Onboarding d’une église : dépôt d’un CSV/XLSX, import en arrière-plan (abmci.services.member_import)."""
+    list_display = ("id", "eglise", "format", "dry_run", "status", "rows", "created", "failed", "user", "created_at")
+    list_filter = ("status", "format", "dry_run")
+    list_select_related = ("user", "eglise")
+    fields = ("file", "eglise", "dry_run", "format", "status", "rows", "created", "failed", "errors", "error",
+              "user", "created_at", "finished_at")
+    readonly_fields = ("format", "status", "rows", "created", "failed", "errors", "error", "user",
+                       "created_at", "finished_at")
+    ordering = ("-created_at",)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs if request.user.is_superuser else qs.filter(user=request.user)
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None
+
+    def save_model(self, request, obj, form, change):
+        from fidele.tasks import run_import_job
+        from abmci.services.member_import import format_for
+
+        obj.user = request.user
+        obj.format = format_for(obj.file.name)
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(lambda: run_import_job.delay(obj.pk))
+
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    """Doublons probables (abmci.services.member_dedupe) ; la fusion se fait par l’API ou merge_members."""
+    list_display = ("id", "fidele_a", "fidele_b", "score", "reasons", "status", "updated_at")
+    list_filter = ("status",)
+    list_select_related = ("fidele_a__user", "fidele_b__user")
+    readonly_fields = ("fidele_a", "fidele_b", "score", "reasons", "created_at", "updated_at")
+    actions = ["dismiss"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Écarter les paires sélectionnées (pas des doublons)")
+    def dismiss(self, request, queryset):
+        updated = queryset.update(status="dismissed")
+        self.message_user(request, f"{updated} paire(s) écartée(s).")
@@ -1,4 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
+
+
+def _ensure_search_extension(sender, using, **kwargs):
+    from abmci.services.member_search import ensure_extension
+
+    ensure_extension(using)
 
 
 class FideleConfig(AppConfig):
@@ -8,3 +15,6 @@ class FideleConfig(AppConfig):
     def ready(self):
         import fidele.signals
         import abmci.receivers
+
+        # Index trigramme de Fidele.search_text : pg_trgm doit exister avant les migrations
+        pre_migrate.connect(_ensure_search_extension, sender=self)
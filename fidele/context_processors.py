@@ -1,13 +1,14 @@
-from fidele.models import Department, Familles
+from abmci.services import reference_data
 
 
 def departement_processor(request):
-    departement = Department.objects.all()
-    famille = Familles.objects.all()
-
+    """
+    Menus directions / familles : listes en cache (process puis partagé), évaluées
+    uniquement si le gabarit les parcourt.
+    """
     context_data = {
-        'department': departement,
-        'famille': famille,
+        'department': reference_data.lazy('department'),
+        'famille': reference_data.lazy('familles'),
     }
 
     return context_data
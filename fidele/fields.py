@@ -0,0 +1,56 @@
+from django import forms
+from django.forms.models import ModelChoiceIterator
+
+from abmci.services import reference_data
+
+
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """Options lues depuis le cache des tables de référence (aucune requête au rendu)."""
+
+    def _rows(self):
+        return reference_data.get(self.field.reference)
+
+    def __iter__(self):
+        if self.field.reference is None:
+            yield from super().__iter__()
+            return
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self._rows():
+            yield self.choice(obj)
+
+    def __len__(self):
+        if self.field.reference is None:
+            return super().__len__()
+        return len(self._rows()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        if self.field.reference is None:
+            return super().__bool__()
+        return self.field.empty_label is not None or bool(self._rows())
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField sur une table de référence (reference_data.REFERENCE_TABLES).
+    La validation passe toujours par le queryset ; si une vue restreint le queryset,
+    le champ revient au comportement standard.
+    """
+    iterator = ReferenceChoiceIterator
+
+    def __init__(self, reference, **kwargs):
+        model, _ = reference_data.REFERENCE_TABLES[reference]
+        kwargs.setdefault("queryset", model._default_manager.all())
+        super().__init__(**kwargs)
+        self.reference = reference
+
+    def _set_queryset(self, queryset):
+        self.reference = None
+        super()._set_queryset(queryset)
+
+    queryset = property(forms.ModelChoiceField._get_queryset, _set_queryset)
+
+    def __deepcopy__(self, memo):
+        result = super().__deepcopy__(memo)
+        result.reference = self.reference
+        return result
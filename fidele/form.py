@@ -13,6 +13,10 @@ from fidele.models import Fidele, Fonction, OuvrierPermanence, Permanence, BAPTE
     MARITAL_CHOICES, MembreType, Location, Department, Eglise
 
 from event.models import Evenement
+from abmci.services import reference_data
+from fidele.fields import ReferenceChoiceField
+from fidele.widgets import EvenementSelect2Widget, FideleSelect2MultipleWidget, FideleSelect2Widget, \
+    LocationSelect2Widget
 
 
 class FideleSignupForm(SignupForm):
@@ -25,14 +29,14 @@ class FideleSignupForm(SignupForm):
     phone = forms.CharField(label="Téléphone", max_length=20, widget=forms.TextInput(attrs={'class': 'form-control'}))
     birthdate = forms.DateField(label="Date de naissance", required=True,
                                 widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
-    eglise = forms.ModelChoiceField(label="Église d'enregistrement", queryset=Eglise.objects.all(), required=True,
-                                    widget=forms.Select(attrs={'class': 'form-control'}))
+    eglise = ReferenceChoiceField('eglise', label="Église d'enregistrement", required=True,
+                                  widget=forms.Select(attrs={'class': 'form-control'}))
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         # ✅ Mettre une église par défaut (exemple : la première de la base)
-        default_eglise = Eglise.objects.first()
+        default_eglise = min(reference_data.get('eglise'), key=lambda e: e.pk, default=None)
         if default_eglise:
             self.fields['eglise'].initial = default_eglise.id
 
@@ -75,12 +79,13 @@ class PermanenceForm(forms.ModelForm):
         exclude = ['programme']
 
     event = forms.ModelChoiceField(required=True, queryset=Evenement.objects.all(), empty_label='Aucun evenement',
-                                   widget=forms.Select(attrs={'class': 'form-control', }))
+                                   widget=EvenementSelect2Widget(attrs={'class': 'form-control', }))
     ouvrier = forms.ModelChoiceField(required=True, queryset=Fidele.objects.all(), empty_label='Aucun ouvrier',
-                                     widget=forms.Select(
-                                         attrs={'class': 'form-select form-select-sm', 'data-search': 'on'}))
-    poste = forms.ModelChoiceField(required=True, queryset=Fonction.objects.all(), empty_label='Aucun poste',
-                                   widget=forms.Select(attrs={'class': 'form-control', }))
+                                     widget=FideleSelect2Widget(
+                                         attrs={'class': 'form-select form-select-sm',
+                                                'data-minimum-input-length': 2}))
+    poste = ReferenceChoiceField('fonction', required=True, empty_label='Aucun poste',
+                                 widget=forms.Select(attrs={'class': 'form-control', }))
 
     position = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
     activites = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
@@ -159,12 +164,16 @@ class FideleUpdateForm(ModelForm):
     salary_currency = forms.CharField(required=False, max_length=100,
                                       widget=forms.TextInput(attrs={'class': 'form-control', }))
     location = forms.ModelChoiceField(required=False, queryset=Location.objects.all(),
-                                      widget=forms.Select(attrs={'class': 'form-control', }))
+                                      widget=LocationSelect2Widget(attrs={'class': 'form-control', }))
 
-    departement = forms.ModelChoiceField(required=False, queryset=Department.objects.all(),
-                                         widget=forms.Select(attrs={'class': 'form-control', }))
-    fonction = forms.ModelChoiceField(required=False, queryset=Fonction.objects.all(),
-                                      widget=forms.Select(attrs={'class': 'form-control', }))
+    departement = ReferenceChoiceField('department', required=False,
+                                       widget=forms.Select(attrs={'class': 'form-control', }))
+    fonction = ReferenceChoiceField('fonction', required=False,
+                                    widget=forms.Select(attrs={'class': 'form-control', }))
+    eglise = ReferenceChoiceField('eglise', required=False,
+                                  widget=forms.Select(attrs={'class': 'form-control', }))
+    famille_alliance = ReferenceChoiceField('familles', required=False,
+                                            widget=forms.Select(attrs={'class': 'form-control', }))
 
     class Meta:
         model = Fidele
@@ -199,8 +208,8 @@ class UpdatePhotoForm(forms.ModelForm):
 
 
 class FideleTransferForm(forms.Form):
-    nouvelle_eglise = forms.ModelChoiceField(
-        queryset=Eglise.objects.all(),
+    nouvelle_eglise = ReferenceChoiceField(
+        'eglise',
         label="Nouvelle église",
         required=True
     )
@@ -334,18 +343,29 @@ class ProfileCompletionForm(forms.ModelForm):
                 widget=Select2Widget(attrs=common_attrs),
                 required=False
             )
+        elif isinstance(field, models.ForeignKey) and field.related_model in reference_data.MODEL_TABLES:
+            return ReferenceChoiceField(
+                reference_data.MODEL_TABLES[field.related_model],
+                label=label,
+                widget=Select2Widget(attrs={**common_attrs, 'class': 'form-control select2'}),
+                required=False
+            )
         elif isinstance(field, models.ForeignKey):
+            # Fidèles / localités : recherche côté serveur plutôt qu’une option par ligne
+            heavy = {Fidele: FideleSelect2Widget, Location: LocationSelect2Widget}.get(field.related_model)
             return forms.ModelChoiceField(
                 label=label,
                 queryset=field.related_model.objects.all(),
-                widget=Select2Widget(attrs={**common_attrs, 'class': 'form-control select2'}),
+                widget=(heavy(attrs={**common_attrs, 'class': 'form-control select2'}) if heavy
+                        else Select2Widget(attrs={**common_attrs, 'class': 'form-control select2'})),
                 required=False
             )
         elif isinstance(field, models.ManyToManyField):
+            widget_cls = FideleSelect2MultipleWidget if field.related_model is Fidele else Select2MultipleWidget
             return forms.ModelMultipleChoiceField(
                 label=label,
                 queryset=field.related_model.objects.all(),
-                widget=Select2MultipleWidget(attrs=common_attrs),
+                widget=widget_cls(attrs=common_attrs),
                 required=False
             )
         elif isinstance(field, models.IntegerField):
@@ -378,12 +398,12 @@ class FiancaillesForm(forms.ModelForm):
     homme = forms.ModelChoiceField(
         queryset=Fidele.objects.all(),
         label="Fiancé (Homme)",
-        widget=forms.Select(attrs={"class": "form-control"})
+        widget=FideleSelect2Widget(attrs={"class": "form-control", "data-minimum-input-length": 2})
     )
     femme = forms.ModelChoiceField(
         queryset=Fidele.objects.all(),
         label="Fiancée (Femme)",
-        widget=forms.Select(attrs={"class": "form-control"})
+        widget=FideleSelect2Widget(attrs={"class": "form-control", "data-minimum-input-length": 2})
     )
 
     class Meta:
@@ -431,12 +451,12 @@ class MariageForm(forms.ModelForm):
     couple = forms.ModelMultipleChoiceField(
         queryset=Fidele.objects.all(),
         label="Couple (sélectionne 2 personnes)",
-        widget=forms.SelectMultiple(attrs={"class": "form-select", "size": "8"})
+        widget=FideleSelect2MultipleWidget(attrs={"class": "form-select", "data-minimum-input-length": 2})
     )
     temoins = forms.ModelMultipleChoiceField(
         queryset=Fidele.objects.all(),
         required=False,
-        widget=forms.SelectMultiple(attrs={"class": "form-select", "size": "8"})
+        widget=FideleSelect2MultipleWidget(attrs={"class": "form-select", "data-minimum-input-length": 2})
     )
 
     class Meta:
@@ -1,11 +1,61 @@
-from django.core.management.base import BaseCommand
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.utils import timezone
 
-from abmci.services.nearest_church import assign_nearest_eglise_if_missing
-from fidele.models import Fidele, FidelePosition
+from abmci.services import member_stats
+from abmci.services.event_stats import shift_invites
+from fidele.models import Eglise, Fidele, FidelePosition
+
+# Un lot = une requête : dernière position valable (LATERAL) → KNN `<->` sur l’index GiST
+# des églises (K candidats re-classés en distance géographique) → UPDATE ensembliste.
+BACKFILL_SQL = """
+WITH pos AS (
+    SELECT f.id AS fidele_id, p.pt
+    FROM {fidele} f
+    CROSS JOIN LATERAL (
+        SELECT ST_SetSRID(ST_MakePoint(fp.longitude::float8, fp.latitude::float8), 4326) AS pt
+        FROM {position} fp
+        WHERE fp.fidele_id = f.id
+          AND fp.captured_at >= %(cutoff)s
+          AND fp.accuracy <= %(max_accuracy)s
+        ORDER BY fp.captured_at DESC
+        LIMIT 1
+    ) p
+    WHERE f.eglise_id IS NULL AND f.id > %(after)s AND f.id <= %(upto)s
+),
+nearest AS (
+    SELECT pos.fidele_id, e.id AS eglise_id
+    FROM pos
+    CROSS JOIN LATERAL (
+        SELECT c.id
+        FROM (
+            SELECT eg.id, eg.location
+            FROM {eglise} eg
+            WHERE eg.location IS NOT NULL
+            ORDER BY eg.location <-> pos.pt
+            LIMIT %(candidates)s
+        ) c
+        WHERE ST_DWithin(c.location::geography, pos.pt::geography, %(radius_m)s)
+        ORDER BY ST_Distance(c.location::geography, pos.pt::geography)
+        LIMIT 1
+    ) e
+)
+UPDATE {fidele} f
+SET eglise_id = nearest.eglise_id
+FROM nearest
+WHERE f.id = nearest.fidele_id AND f.eglise_id IS NULL
+RETURNING f.eglise_id, f.is_deleted
+"""
+
 
 class Command(BaseCommand):
-    help = "Assigne l’église la plus proche aux fidèles sans église, en se basant sur leur dernière position connue."
+    help = (
+        "Assigne l’église la plus proche aux fidèles sans église, en se basant sur leur dernière position connue. "
+        "Traitement ensembliste par lots (PostgreSQL/PostGIS)."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("--max-radius-km", type=float, default=50,
@@ -14,46 +64,75 @@ class Command(BaseCommand):
             help="Âge max des positions (heures)")
         parser.add_argument("--max-accuracy-m", type=float, default=1000,
             help="Précision max en mètres (par défaut 1000m)")
+        parser.add_argument("--chunk-size", type=int, default=10000,
+            help="Nombre de fidèles par lot (par défaut 10000)")
+        parser.add_argument("--candidates", type=int, default=5,
+            help="Églises candidates par KNN avant re-classement géographique (par défaut 5)")
         parser.add_argument("--verbose", action="store_true",
-            help="Affiche les détails des assignations")
+            help="Affiche la progression de chaque lot (sinon tous les 10 lots)")
 
     def handle(self, *args, **opts):
-        radius_km = opts["max_radius_km"]
-        max_age_hours = opts["max_age_hours"]
-        max_accuracy_m = opts["max_accuracy_m"]
-        verbose = opts["verbose"]
-
-        cutoff = timezone.now() - timezone.timedelta(hours=max_age_hours)
-
-        fideles = Fidele.objects.filter(eglise__isnull=True)
-        self.stdout.write(f"À traiter: {fideles.count()} fidèle(s)")
-
-        assigned = 0
-        for f in fideles:
-            pos = FidelePosition.objects.filter(
-                fidele=f,
-                captured_at__gte=cutoff,
-                accuracy__lte=max_accuracy_m
-            ).order_by("-captured_at").first()
-
-            if not pos:
-                if verbose:
-                    self.stdout.write(f"- Fidele {f.id}: aucune position valable")
-                continue
-
-            ok = assign_nearest_eglise_if_missing(f, max_radius_km=radius_km)
-            if ok:
-                assigned += 1
-                if verbose:
-                    self.stdout.write(
-                        f"✓ Fidele {f.id}: assigné à {f.eglise_id}"
-                    )
-            else:
-                if verbose:
-                    self.stdout.write(f"- Fidele {f.id}: pas d’église trouvée")
+        if connection.vendor != "postgresql":
+            raise CommandError("Cette commande nécessite PostgreSQL/PostGIS.")
+
+        chunk = max(1, opts["chunk_size"])
+        qn = connection.ops.quote_name
+        sql = BACKFILL_SQL.format(
+            fidele=qn(Fidele._meta.db_table),
+            position=qn(FidelePosition._meta.db_table),
+            eglise=qn(Eglise._meta.db_table),
+        )
+        params = {
+            "cutoff": timezone.now() - timezone.timedelta(hours=opts["max_age_hours"]),
+            "max_accuracy": opts["max_accuracy_m"],
+            "radius_m": opts["max_radius_km"] * 1000.0,
+            "candidates": max(1, opts["candidates"]),
+        }
+
+        pending = Fidele.objects.filter(eglise__isnull=True)
+        total = pending.count()
+        self.stdout.write(f"À traiter: {total} fidèle(s), lots de {chunk}")
+
+        started = time.perf_counter()
+        after, processed, assigned, batch_no = 0, 0, 0, 0
+        while True:
+            # Borne haute du lot (pagination par clé, sans rapatrier les ids)
+            ids = pending.filter(pk__gt=after).order_by("pk").values_list("pk", flat=True)
+            edge = list(ids[chunk - 1:chunk])
+            upto = edge[0] if edge else ids.order_by("-pk").first()
+            if upto is None:
+                break
 
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, {**params, "after": after, "upto": upto})
+                rows = cursor.fetchall()
+                # UPDATE ensembliste : pas de post_save → compteurs d’invités mis à jour ici
+                for eglise_id, delta in Counter(e for e, deleted in rows if not deleted).items():
+                    shift_invites(eglise_id, delta)
+                if rows:
+                    member_stats.bump_version(*{e for e, _ in rows})
+
+            batch_no += 1
+            processed = min(total, processed + chunk)
+            assigned += len(rows)
+            after = upto
+
+            if opts["verbose"] or batch_no % 10 == 0:
+                self._progress(processed, total, assigned, started)
+
+        self._progress(processed, total, assigned, started)
         self.stdout.write(
             self.style.SUCCESS(
-                f"Assignations effectuées: {assigned}/{fideles.count()}"
+                f"Assignations effectuées: {assigned}/{total}"
             )
-        )
\ No newline at end of file
+        )
+
+    def _progress(self, processed, total, assigned, started):
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        rate = processed / elapsed
+        eta = (total - processed) / rate if rate else 0
+        pct = (processed / total * 100) if total else 100
+        self.stdout.write(
+            f"  {processed}/{total} ({pct:.1f}%) — assignés: {assigned} — "
+            f"{rate:,.0f} fidèles/s — écoulé {elapsed:.1f}s, reste ~{eta:.0f}s"
+        )
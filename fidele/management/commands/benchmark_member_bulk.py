@@ -0,0 +1,100 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+
+from abmci.services import member_bulk
+from fidele.models import Eglise, Fidele
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare l’écriture de fidèles ligne par ligne (save() + signaux + historique) et les écritures "
+        "en masse d’abmci.services.member_bulk : création puis changement de statut de --count fidèles. "
+        "Tout est annulé à la fin (transaction), sauf --keep."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10_000,
+            help="Fidèles par méthode (par défaut 10000)")
+        parser.add_argument("--eglise", type=int, default=None,
+            help="Église des fidèles créés (par défaut la première)")
+        parser.add_argument("--keep", action="store_true",
+            help="Conserve les données créées (par défaut : ROLLBACK)")
+
+    def handle(self, *args, **opts):
+        count = max(1, opts["count"])
+        eglise = (Eglise.objects.filter(pk=opts["eglise"]).first() if opts["eglise"]
+                  else Eglise.objects.order_by("pk").first())
+        if eglise is None:
+            raise CommandError("Aucune église : créez-en une ou passez --eglise.")
+
+        self.results = []
+        try:
+            with transaction.atomic():
+                self._run(count, eglise)
+                if not opts["keep"]:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write("Données de test annulées (ROLLBACK).")
+
+        self.stdout.write(f"\n{'opération':<28}{'lignes':>8}{'secondes':>11}{'requêtes':>11}{'lignes/s':>11}")
+        for label, rows, seconds, queries in self.results:
+            self.stdout.write(f"{label:<28}{rows:>8}{seconds:>11.2f}{queries:>11}{rows / max(seconds, 1e-6):>11.0f}")
+        self.stdout.write(self.style.WARNING(
+            "Ligne par ligne : les tâches après COMMIT (foyers) ne sont pas exécutées dans le test ; "
+            "en masse : les effets de bord sont exécutés et inclus dans la mesure."
+        ))
+
+    def _users(self, count, prefix):
+        # Sans signal post_save (create_fidele) : les fidèles sont créés par chaque méthode
+        tag = get_random_string(6).lower()
+        users = [
+            User(username=f"bench-{prefix}-{tag}-{i}", first_name=f"Prénom{i}", last_name=f"Bench {prefix}")
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=1000)
+
+    def _measure(self, label, rows, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fn()
+            seconds = time.perf_counter() - started
+        self.results.append((label, rows, seconds, len(ctx.captured_queries)))
+        self.stdout.write(f"  {label} : {seconds:.2f}s")
+
+    def _run(self, count, eglise):
+        loop_users = self._users(count, "loop")
+        bulk_users = self._users(count, "bulk")
+
+        def create_loop():
+            for u in loop_users:
+                Fidele(user=u, eglise=eglise, phone=f"+22507{u.pk % 10 ** 8:08d}").save()
+
+        def create_bulk():
+            member_bulk.bulk_create_members(
+                [Fidele(user=u, eglise=eglise, phone=f"+22507{u.pk % 10 ** 8:08d}") for u in bulk_users],
+                reason="benchmark", run_side_effects_now=True,
+            )
+
+        self._measure("création save()", count, create_loop)
+        self._measure("création en masse", count, create_bulk)
+
+        def update_loop():
+            for f in Fidele.objects.filter(user__in=loop_users).select_related("user"):
+                f.membre = 1
+                f.save()
+
+        def update_bulk():
+            member_bulk.bulk_set(Fidele.objects.filter(user__in=bulk_users), {"membre": 1},
+                                 reason="benchmark", run_side_effects_now=True)
+
+        self._measure("statut save()", count, update_loop)
+        self._measure("statut en masse", count, update_bulk)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import positions
+
+
+class Command(BaseCommand):
+    help = (
+        "Sous-échantillonne l’historique des positions GPS : relevés bruts conservés pendant --raw-days, "
+        "puis un seul relevé par fidèle et par --bucket (PostgreSQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--raw-days", type=int, default=positions.RAW_DAYS,
+            help=f"Jours de relevés bruts conservés (par défaut {positions.RAW_DAYS})")
+        parser.add_argument("--bucket", choices=["minute", "hour", "day"], default=positions.DOWNSAMPLE_BUCKET,
+            help="Granularité conservée au-delà (par défaut hour)")
+        parser.add_argument("--purge-after-days", type=int, default=None,
+            help="Supprime tout relevé plus ancien (désactivé par défaut)")
+        parser.add_argument("--chunk-size", type=int, default=positions.DOWNSAMPLE_CHUNK,
+            help="Nombre de fidèles par DELETE")
+        parser.add_argument("--backfill", action="store_true",
+            help="Renseigne d’abord la géométrie des anciens relevés et reconstruit les dernières positions")
+
+    def handle(self, *args, **opts):
+        try:
+            if opts["backfill"]:
+                n = positions.backfill_points()
+                self.stdout.write(f"Géométries renseignées: {n}")
+                n = positions.rebuild_last_positions()
+                self.stdout.write(f"Dernières positions reconstruites: {n}")
+
+            result = positions.downsample(
+                raw_days=opts["raw_days"],
+                bucket=opts["bucket"],
+                purge_after_days=opts["purge_after_days"],
+                chunk=max(1, opts["chunk_size"]),
+                log=self.stdout.write,
+            )
+        except (RuntimeError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sous-échantillonnés: {result['downsampled']} — purgés: {result['purged']} "
+            f"— {result['seconds']}s"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from abmci.services import member_dedupe
+
+
+class Command(BaseCommand):
+    help = (
+        "Détecte les fidèles probablement en double (téléphone, e-mail, nom phonétique, date de naissance) "
+        "et met à jour la table DuplicateCandidate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--eglise", type=int, default=None,
+            help="Limite la recherche aux fidèles d’une église")
+        parser.add_argument("--min-score", type=float, default=member_dedupe.MIN_SCORE,
+            help=f"Score minimal d’une paire (par défaut {member_dedupe.MIN_SCORE})")
+        parser.add_argument("--dry-run", action="store_true",
+            help="Affiche les paires sans modifier la table")
+        parser.add_argument("--show", type=int, default=20,
+            help="Nombre de paires affichées en --dry-run")
+
+    def handle(self, *args, **opts):
+        if opts["dry_run"]:
+            found = member_dedupe.find_candidates(eglise_id=opts["eglise"], min_score=opts["min_score"])
+            for c in found[:opts["show"]]:
+                self.stdout.write(f"  {c.fidele_a:>8} ≈ {c.fidele_b:<8} {c.score:.2f}  {', '.join(c.reasons)}")
+            self.stdout.write(self.style.SUCCESS(f"{len(found)} paire(s) probable(s)"))
+            return
+
+        result = member_dedupe.refresh_candidates(
+            eglise_id=opts["eglise"], min_score=opts["min_score"], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Paires: {result['candidates']} — obsolètes supprimées: {result['removed']}"
+        ))
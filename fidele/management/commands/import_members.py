@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import member_import
+from fidele.models import Eglise
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des fidèles depuis un fichier CSV ou XLSX (colonnes : nom, prénom, email, téléphone, "
+        "date de naissance, sexe…), par lots, sans signal par ligne. Les erreurs sont listées par ligne."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Fichier .csv ou .xlsx")
+        parser.add_argument("--eglise", type=int, default=None,
+            help="Église des fidèles importés (sinon : église la plus proche, si position connue)")
+        parser.add_argument("--chunk-size", type=int, default=member_import.CHUNK_SIZE,
+            help=f"Lignes par lot (par défaut {member_import.CHUNK_SIZE})")
+        parser.add_argument("--dry-run", action="store_true",
+            help="Valide le fichier sans rien enregistrer")
+
+    def handle(self, *args, **opts):
+        eglise_id = opts["eglise"]
+        if eglise_id and not Eglise.objects.filter(pk=eglise_id).exists():
+            raise CommandError(f"Église {eglise_id} introuvable.")
+
+        fmt = member_import.format_for(opts["path"])
+
+        def progress(result):
+            self.stdout.write(f"  {result['rows']} ligne(s) lue(s) — créés: {result['created']} "
+                              f"— en erreur: {result['failed']}")
+
+        try:
+            with open(opts["path"], "rb") as fh:
+                result = member_import.run_import(
+                    fh, fmt, eglise_id=eglise_id, dry_run=opts["dry_run"],
+                    chunk_size=max(1, opts["chunk_size"]), on_chunk=progress,
+                )
+        except (OSError, ValueError, ImportError) as exc:
+            raise CommandError(str(exc))
+
+        for err in result["errors"]:
+            details = " ; ".join(f"{col}: {msg}" for col, msg in err["errors"].items())
+            self.stderr.write(f"  ligne {err['row']} — {details}")
+        if result["failed"] > len(result["errors"]):
+            self.stderr.write(f"  … {result['failed'] - len(result['errors'])} autre(s) erreur(s)")
+
+        verb = "à créer" if opts["dry_run"] else "créés"
+        self.stdout.write(self.style.SUCCESS(
+            f"Lignes: {result['rows']} — {verb}: {result['created']} — erreurs: {result['failed']} "
+            f"— {result['seconds']}s ({result['rows_per_minute']:,} lignes/min)"
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import member_dedupe
+from fidele.models import Fidele
+
+
+class Command(BaseCommand):
+    help = "Fusionne le fidèle DOUBLON dans le fidèle CONSERVE (références, historique, champs vides) puis supprime le doublon."
+
+    def add_arguments(self, parser):
+        parser.add_argument("keep", type=int, help="Identifiant du fidèle conservé")
+        parser.add_argument("duplicate", type=int, help="Identifiant du doublon (supprimé)")
+
+    def handle(self, *args, **opts):
+        try:
+            result = member_dedupe.merge(opts["keep"], opts["duplicate"])
+        except (ValueError, Fidele.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        for relation, count in sorted(result["moved"].items()):
+            self.stdout.write(f"  {relation}: {count}")
+        if result["filled"]:
+            self.stdout.write(f"  Champs complétés : {', '.join(result['filled'])}")
+        self.stdout.write(self.style.SUCCESS(f"Fidèle {result['merged']} fusionné dans {result['kept']}"))
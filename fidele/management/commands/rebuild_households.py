@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from abmci.services import family_graph
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule la table des foyers (FideleHousehold) : conjoints, enfants non mariés, "
+        "frères et sœurs déclarés."
+    )
+
+    def handle(self, *args, **opts):
+        result = family_graph.rebuild(log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fidèles: {result['members']} — foyers: {result['households']} — familles: {result['families']}"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from fidele.models import Location
+
+
+class Command(BaseCommand):
+    help = "Recalcule le chemin matérialisé (path, depth) de toutes les localités."
+
+    def handle(self, *args, **opts):
+        total = Location.rebuild_paths()
+        missing = Location.objects.filter(path="").count()
+        self.stdout.write(self.style.SUCCESS(f"Chemins recalculés: {total}"))
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{missing} localité(s) sans chemin (cycle dans la hiérarchie ?)"))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from abmci.services.member_search import search_text_for
+from fidele.models import Fidele
+
+
+class Command(BaseCommand):
+    help = "Recalcule le texte de recherche (Fidele.search_text) de tous les fidèles, par lots."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000,
+            help="Nombre de fidèles par lot (par défaut 2000)")
+
+    def handle(self, *args, **opts):
+        batch = max(1, opts["batch_size"])
+        qs = (Fidele.objects.select_related("user")
+              .only("id", "qlook_id", "phone", "search_text", "user__first_name", "user__last_name")
+              .order_by("pk"))
+
+        started = time.perf_counter()
+        pending, updated, seen = [], 0, 0
+        for fidele in qs.iterator(chunk_size=batch):
+            seen += 1
+            text = search_text_for(fidele)
+            if text != fidele.search_text:
+                fidele.search_text = text
+                pending.append(fidele)
+            if len(pending) >= batch:
+                Fidele.objects.bulk_update(pending, ["search_text"])
+                updated += len(pending)
+                pending = []
+        if pending:
+            Fidele.objects.bulk_update(pending, ["search_text"])
+            updated += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Fidèles parcourus: {seen} — mis à jour: {updated} — {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import engagement
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule l’assiduité des fidèles (dernière présence, présences sur 4 et 12 semaines, "
+        "décrochage) à partir des participations aux évènements."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fidele", type=int, action="append", default=None,
+            help="Limite le recalcul à ce fidèle (option répétable)")
+
+    def handle(self, *args, **opts):
+        try:
+            result = engagement.recompute(opts["fidele"], log=self.stdout.write)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Fidèles: {result['members']} — lignes supprimées: {result['removed']}"
+        ))
@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les instantanés quotidiens par église (effectifs, arrivées, présences, dons). "
+        "Par défaut : du dernier jour enregistré jusqu’à aujourd’hui."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=str, default=None,
+            help="Premier jour à (re)calculer, AAAA-MM-JJ")
+        parser.add_argument("--until", type=str, default=None,
+            help="Dernier jour à (re)calculer, AAAA-MM-JJ (par défaut aujourd’hui)")
+
+    def handle(self, *args, **opts):
+        try:
+            since = date.fromisoformat(opts["since"]) if opts["since"] else None
+            until = date.fromisoformat(opts["until"]) if opts["until"] else None
+        except ValueError:
+            raise CommandError("Dates attendues au format AAAA-MM-JJ.")
+
+        result = rollups.refresh(since=since, until=until, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Jours recalculés: {result['days']} — lignes: {result['rows']}"))
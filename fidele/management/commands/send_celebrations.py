@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from abmci.services import celebrations
+
+
+class Command(BaseCommand):
+    help = (
+        "Anniversaires de naissance, de baptême et de mariage du jour : notification de chaque fidèle "
+        "célébré, récapitulatif aux pasteurs et diffusion sur le topic de l’église."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", default=None, help="Jour traité (AAAA-MM-JJ, par défaut aujourd’hui)")
+        parser.add_argument("--dry-run", action="store_true", help="Liste les célébrations sans notifier")
+        parser.add_argument("--no-push", action="store_true", help="Sans diffusion FCM")
+
+    def handle(self, *args, **opts):
+        try:
+            day = date.fromisoformat(opts["date"]) if opts["date"] else None
+        except ValueError:
+            raise CommandError("--date : format AAAA-MM-JJ attendu.")
+
+        if opts["dry_run"]:
+            for eglise_id, entries in sorted(celebrations.celebrations_for(day).items(),
+                                             key=lambda item: item[0] or 0):
+                self.stdout.write(f"Église {eglise_id or '-'} : {celebrations.digest_body(entries)}")
+
+        result = celebrations.send_daily(day, push=not opts["no_push"], dry_run=opts["dry_run"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['date']} — célébrations: {result['celebrations']} ({result['eglises']} église(s)) — "
+            f"fidèles notifiés: {result['members']} — pasteurs: {result['pastors']} — diffusions: {result['pushes']}"
+        ))
@@ -6,7 +6,10 @@ from datetime import date
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat, ExtractDay, ExtractMonth, Substr
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.text import slugify
@@ -15,8 +18,12 @@ from simple_history.models import HistoricalRecords
 from django_countries.fields import CountryField
 from phonenumber_field.modelfields import PhoneNumberField
 from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.geos import Point
+from django.contrib.postgres.indexes import GinIndex
 
 from abmci.notifications.fcm import send_verse_to_eglise_topic
+from abmci.services.member_search import search_text_for
+from abmci.utils.storage import export_upload_to, import_upload_to, private_storage
 
 # Create your models here.
 
@@ -124,20 +131,120 @@ class TypeLocation(models.Model):
         return self.name
 
 
+class LocationQuerySet(models.QuerySet):
+    def descendants_of(self, *locations, include_self=True):
+        """Sous-arbres de plusieurs localités en une requête (préfixe de chemin indexé)."""
+        q = models.Q()
+        for loc in locations:
+            if loc.path:  # chemin pas encore calculé : ignoré plutôt que de tout renvoyer
+                q |= models.Q(path__startswith=loc.path)
+        if not q:
+            return self.none()
+        qs = self.filter(q)
+        return qs if include_self else qs.exclude(pk__in=[loc.pk for loc in locations])
+
+    def ancestors_map(self, locations):
+        """
+        {location_id: [parent, grand-parent, …]} pour un lot de localités :
+        une seule requête pour tous les ancêtres.
+        """
+        ids = {pk for loc in locations for pk in loc.ancestor_ids()}
+        by_id = self.in_bulk(ids)
+        return {loc.pk: [by_id[pk] for pk in reversed(loc.ancestor_ids()) if pk in by_id] for loc in locations}
+
+
 class Location(models.Model):
+    PATH_SEP = "/"
+
     name = models.CharField(null=True, blank=True, max_length=150, )
     type = models.ForeignKey(TypeLocation, on_delete=models.CASCADE, default=1, null=True, blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, default=None, null=True, blank=True)
+    # Chemin matérialisé « /racine/…/parent/id/ » et profondeur (0 = racine), maintenus par save()
+    path = models.CharField(max_length=255, blank=True, default="", editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = LocationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # LIKE 'préfixe%' indexable quelle que soit la collation
+            models.Index(fields=["path"], name="location_path_idx", opclasses=["varchar_pattern_ops"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        sep = self.PATH_SEP
+        with transaction.atomic():
+            parent_path = ""
+            if self.parent_id:
+                parent_path = Location.objects.filter(pk=self.parent_id).values_list("path", flat=True).first() or ""
+                if self.pk and f"{sep}{self.pk}{sep}" in parent_path:
+                    raise ValidationError("Une localité ne peut pas être déplacée sous l’un de ses descendants.")
+
+            old_path = ""
+            if self.pk:
+                old_path = Location.objects.filter(pk=self.pk).values_list("path", flat=True).first() or ""
+            if not self.pk or self._state.adding:
+                # Création : l’id n’est connu qu’après l’INSERT ; chemin écrit par un UPDATE
+                # ciblé (pas de second save(), post_save n’est émis qu’une fois)
+                super().save(*args, **kwargs)
+                self.path = f"{parent_path or sep}{self.pk}{sep}"
+                self.depth = self.path.count(sep) - 2
+                Location.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            else:
+                self.path = f"{parent_path or sep}{self.pk}{sep}"
+                self.depth = self.path.count(sep) - 2
+                update_fields = kwargs.get("update_fields")
+                if update_fields is not None:
+                    # Chemin recalculé : toujours écrit, sinon le sous-arbre serait réécrit vers
+                    # un préfixe absent de la ligne elle-même
+                    kwargs["update_fields"] = {*update_fields, "path", "depth"}
+                super().save(*args, **kwargs)
+
+            # Déplacement : ré-écriture du chemin de tout le sous-arbre en un UPDATE
+            if old_path and old_path != self.path:
+                Location.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                    depth=F("depth") + (self.depth - (old_path.count(sep) - 2)),
+                )
+
+    def ancestor_ids(self):
+        """Ids des ancêtres, de la racine au parent (lus dans le chemin, sans requête)."""
+        parts = [int(p) for p in self.path.strip(self.PATH_SEP).split(self.PATH_SEP) if p]
+        return parts[:-1]
 
     def get_all_parents(self):
-        parents = []
-        current_parent = self.parent
+        """Parents du plus proche au plus lointain (une requête)."""
+        return Location.objects.ancestors_map([self])[self.pk]
 
-        while current_parent:
-            parents.append(current_parent)
-            current_parent = current_parent.parent
+    def get_descendants(self, include_self=True):
+        return Location.objects.descendants_of(self, include_self=include_self)
 
-        return parents
+    def members(self):
+        """Fidèles de la région, sous-régions comprises (une requête indexée)."""
+        if not self.path:
+            return Fidele.objects.filter(location=self)
+        return Fidele.objects.filter(location__path__startswith=self.path)
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        (Re)calcule tous les chemins, un UPDATE par niveau (données importées sans save(),
+        bulk_create…). Les éventuels cycles restent sans chemin.
+        """
+        sep = cls.PATH_SEP
+        cls.objects.filter(parent__isnull=False).update(path="")
+        total = cls.objects.filter(parent__isnull=True).update(
+            path=Concat(Value(sep), Cast("pk", models.CharField()), Value(sep)), depth=0,
+        )
+        parent = cls.objects.filter(pk=OuterRef("parent_id"))
+        while True:
+            updated = cls.objects.filter(path="", parent__isnull=False).exclude(parent__path="").update(
+                path=Concat(Subquery(parent.values("path")[:1]), Cast("pk", models.CharField()), Value(sep)),
+                depth=Subquery(parent.values("depth")[:1]) + 1,
+            )
+            if not updated:
+                return total
+            total += updated
 
     def __str__(self):
         return self.name
@@ -314,7 +421,9 @@ class Fidele(models.Model):
     slug = models.SlugField(null=True, blank=True, help_text="slug field", verbose_name="slug ", unique=True,
                             editable=False)
     created_at = models.DateTimeField(auto_now_add=now, )
-    history = HistoricalRecords()
+    # Nom, prénom, qlook_id et chiffres du téléphone, normalisés (abmci.services.member_search)
+    search_text = models.TextField(blank=True, default="", editable=False)
+    history = HistoricalRecords(excluded_fields=["search_text"])
 
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}'
@@ -322,12 +431,32 @@ class Fidele(models.Model):
     def save(self, *args, **kwargs):
         # self.age = (date.today() - self.date_naissance) // (timedelta(days=365.2425))
         self.slug = slugify(self.qlook_id)
+        self.search_text = search_text_for(self)
         super(Fidele, self).save(*args, **kwargs)
 
     class Meta:
         permissions = (
             ("can_edit_employee", "Can edit employee"),
         )
+        indexes = [
+            # LIKE '%terme%' (trigrammes, extension pg_trgm) et préfixe pour les saisies courtes
+            GinIndex(fields=["search_text"], name="fidele_search_trgm", opclasses=["gin_trgm_ops"]),
+            models.Index(fields=["search_text"], name="fidele_search_prefix", opclasses=["text_pattern_ops"]),
+            # Filtres / pagination par curseur de l’API (fidèles non supprimés uniquement)
+            models.Index(fields=["eglise", "-created_at", "-id"], name="fidele_eglise_created_idx",
+                         condition=models.Q(is_deleted=0)),
+            models.Index(fields=["-created_at", "-id"], name="fidele_created_idx",
+                         condition=models.Q(is_deleted=0)),
+            models.Index(fields=["eglise", "membre"], name="fidele_eglise_membre_idx",
+                         condition=models.Q(is_deleted=0)),
+            models.Index(fields=["eglise", "date_entree"], name="fidele_eglise_entree_idx",
+                         condition=models.Q(is_deleted=0)),
+            # Célébrations du jour (abmci.services.celebrations) : WHERE mois = … AND jour = …
+            models.Index(ExtractMonth("birthdate"), ExtractDay("birthdate"), name="fidele_birth_md_idx",
+                         condition=models.Q(is_deleted=0, birthdate__isnull=False)),
+            models.Index(ExtractMonth("date_bapteme"), ExtractDay("date_bapteme"), name="fidele_bapteme_md_idx",
+                         condition=models.Q(is_deleted=0, date_bapteme__isnull=False)),
+        ]
 
     @property
     def est_nouveau(self):
@@ -396,16 +525,42 @@ class FidelePosition(models.Model):
     captured_at = models.DateTimeField(default=timezone.now)
     source = models.CharField(max_length=20, choices=SOURCES, default="manual")
     note = models.CharField(max_length=255, null=True, blank=True)
+    # 📍 géométrie dérivée de (longitude, latitude), SRID=4326
+    point = gis_models.PointField(srid=4326, null=True, blank=True, spatial_index=True)
 
     class Meta:
         indexes = [
             models.Index(fields=["fidele", "captured_at"]),
+            models.Index(fields=["captured_at"]),
         ]
         ordering = ["-captured_at"]
 
     def __str__(self):
         return f"{self.fidele_id} @ ({self.latitude}, {self.longitude}) {self.captured_at:%Y-%m-%d %H:%M}"
 
+    def build_point(self):
+        return Point(float(self.longitude), float(self.latitude), srid=4326)
+
+    def save(self, *args, **kwargs):
+        if self.point is None and self.latitude is not None and self.longitude is not None:
+            self.point = self.build_point()
+        super().save(*args, **kwargs)
+
+
+class FideleLastPosition(models.Model):
+    """Dernière position connue d’un fidèle (dénormalisée : lecture par clé primaire)."""
+    fidele = models.OneToOneField("Fidele", on_delete=models.CASCADE, primary_key=True, related_name="last_position")
+    point = gis_models.PointField(srid=4326, spatial_index=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    accuracy = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+    captured_at = models.DateTimeField(db_index=True)
+    source = models.CharField(max_length=20, choices=FidelePosition.SOURCES, default="manual")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.fidele_id} @ ({self.latitude}, {self.longitude}) {self.captured_at:%Y-%m-%d %H:%M}"
+
 
 class UserProfileCompletion(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -885,3 +1040,203 @@ class AccountDeletionRequest(models.Model):
 
     def __str__(self):
         return f"DeletionRequest(user={self.user_id}, status={self.status})"
+
+
+class ExportJob(models.Model):
+    """Export volumineux (CSV/XLSX) produit en tâche de fond et téléchargeable une fois prêt."""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    FORMAT_CHOICES = [("csv", "CSV"), ("xlsx", "XLSX")]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name="export_jobs")
+    kind = models.CharField(max_length=32)  # participants | positions | donations
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES, default="csv")
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending", db_index=True)
+    file = models.FileField(upload_to=export_upload_to, storage=private_storage, null=True, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"Export {self.kind}.{self.format} #{self.pk} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """Import de fidèles (CSV/XLSX) traité en tâche de fond par lots (voir abmci.services.member_import)."""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    FORMAT_CHOICES = [("csv", "CSV"), ("xlsx", "XLSX")]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name="import_jobs")
+    eglise = models.ForeignKey("Eglise", null=True, blank=True, on_delete=models.SET_NULL, related_name="import_jobs")
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES, default="csv")
+    # Stockage privé, supprimé une fois l’import traité (liste nominative : noms, téléphones, naissances)
+    file = models.FileField(upload_to=import_upload_to, storage=private_storage)
+    dry_run = models.BooleanField(default=False)  # validation seule
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending", db_index=True)
+    rows = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # [{"row": n° de ligne du fichier, "errors": {colonne: message}}], tronqué à MAX_REPORTED_ERRORS
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"Import {self.format} #{self.pk} ({self.status}, {self.created}/{self.rows})"
+
+
+class MemberDensityCell(models.Model):
+    """
+    Densité de fidèles agrégée sur une grille Web Mercator, précalculée par zoom
+    depuis les dernières positions (voir abmci.services.member_density).
+    """
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    center = gis_models.PointField(srid=4326)
+    members = models.PositiveIntegerField(default=0)
+    # Distance (m) de chaque fidèle à l’église la plus proche
+    dist_avg_m = models.FloatField(null=True, blank=True)
+    dist_median_m = models.FloatField(null=True, blank=True)
+    dist_max_m = models.FloatField(null=True, blank=True)
+    far_members = models.PositiveIntegerField(default=0)  # au-delà de FAR_DISTANCE_M
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["zoom", "cell_x", "cell_y"], name="uniq_density_cell"),
+        ]
+
+    def __str__(self):
+        return f"Densité z{self.zoom} ({self.cell_x}, {self.cell_y}) : {self.members}"
+
+
+class EgliseDailyStats(models.Model):
+    """
+    Instantané quotidien par église (voir abmci.services.rollups), rafraîchi par Celery beat.
+    eglise = NULL : fidèles / dons sans église.
+    """
+    eglise = models.ForeignKey(Eglise, on_delete=models.CASCADE, null=True, blank=True, related_name="daily_stats")
+    day = models.DateField()
+
+    # Effectifs à la date (fidèles inscrits au plus tard ce jour-là, non supprimés)
+    members = models.PositiveIntegerField(default=0)
+    visiteurs = models.PositiveIntegerField(default=0)
+    membres_actifs = models.PositiveIntegerField(default=0)
+    fiss = models.PositiveIntegerField(default=0)
+    sympathisants = models.PositiveIntegerField(default=0)
+    hommes = models.PositiveIntegerField(default=0)
+    femmes = models.PositiveIntegerField(default=0)
+    baptises = models.PositiveIntegerField(default=0)
+    age_distribution = models.JSONField(default=dict, blank=True)  # {"0-17": n, …}
+
+    # Activité du jour
+    nouveaux = models.PositiveIntegerField(default=0)  # date_entree = day
+    participations = models.PositiveIntegerField(default=0)
+    scans = models.PositiveIntegerField(default=0)
+    donations_count = models.PositiveIntegerField(default=0)
+    donations_amount = models.PositiveBigIntegerField(default=0)
+
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-day",)
+        constraints = [
+            models.UniqueConstraint(fields=["eglise", "day"], name="uniq_eglise_daily_stats"),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="eglise_daily_stats_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.eglise_id or '-'} @ {self.day}"
+
+
+class FideleHousehold(models.Model):
+    """
+    Foyer précalculé de chaque fidèle (voir abmci.services.family_graph) :
+    les fidèles d’un même foyer partagent household_key (plus petit id du foyer).
+    """
+    fidele = models.OneToOneField("Fidele", on_delete=models.CASCADE, primary_key=True, related_name="household")
+    household_key = models.PositiveIntegerField(db_index=True)
+    size = models.PositiveIntegerField(default=1)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.fidele_id} → foyer {self.household_key} ({self.size})"
+
+
+class MemberEngagement(models.Model):
+    """
+    Assiduité de chaque fidèle (voir abmci.services.engagement) : dernière présence et présences
+    sur 4 / 12 semaines glissantes, incrémentées à chaque présence et recalculées chaque nuit.
+    drifting : fidèle régulier dont la présence récente a chuté (à relancer).
+    """
+    fidele = models.OneToOneField("Fidele", on_delete=models.CASCADE, primary_key=True, related_name="engagement")
+    eglise = models.ForeignKey(Eglise, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                               db_index=False)
+    last_attended_at = models.DateTimeField(null=True, blank=True)
+    attended_4w = models.PositiveIntegerField(default=0)
+    attended_12w = models.PositiveIntegerField(default=0)
+    drifting = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # « Fidèles à relancer » d’une église : parcours d’index paginé par clé (dernière présence, id)
+            models.Index(fields=["eglise", "last_attended_at", "fidele"], name="engagement_follow_up_idx",
+                         condition=models.Q(drifting=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.fidele_id} : {self.attended_4w}/{self.attended_12w}{' (à relancer)' if self.drifting else ''}"
+
+
+class DuplicateCandidate(models.Model):
+    """
+    Paire de fidèles probablement en double, détectée par abmci.services.member_dedupe
+    (fidele_a_id < fidele_b_id). Une paire écartée n’est plus proposée aux recalculs suivants.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("dismissed", "Dismissed"),
+    ]
+
+    fidele_a = models.ForeignKey("Fidele", on_delete=models.CASCADE, related_name="+")
+    fidele_b = models.ForeignKey("Fidele", on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    # Critères concordants : ["telephone", "email", "naissance", "nom", …]
+    reasons = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending", db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-score", "id")
+        constraints = [
+            models.UniqueConstraint(fields=["fidele_a", "fidele_b"], name="uniq_duplicate_pair"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "-score"], name="duplicate_status_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.fidele_a_id} ≈ {self.fidele_b_id} ({self.score:.2f})"
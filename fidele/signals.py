@@ -4,15 +4,19 @@ import random
 from allauth.account.signals import user_signed_up
 from django.contrib.auth.hashers import make_password
 from django.core.mail import send_mail, EmailMessage
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete, post_init, m2m_changed
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from django.template.loader import get_template
 
 from abmci.notifications.fcm import send_to_topic
-from abmci.services.nearest_church import assign_nearest_eglise_if_missing
+from abmci.services import church_index, family_graph, member_stats, reference_data
+from abmci.services.nearest_church import assign_nearest_eglise_if_missing, assign_nearest_eglise_from_position
+from abmci.services.positions import update_last_position
+from abmci.services.member_search import search_text_for
 from abmci.services.notifications import notify_new_comment
-from fidele.models import Fidele, PrayerRequest, PrayerComment
+from fidele.models import Fidele, PrayerRequest, PrayerComment, FidelePosition, Eglise, ProblemeParticulier
 from django.dispatch import Signal
 
 notify = Signal()
@@ -24,9 +28,19 @@ def qlook():
 
 
 @receiver(post_save, sender=User)
-def create_fidele(sender, instance, created, **kwargs):
+def create_fidele(sender, instance, created, update_fields=None, **kwargs):
     if created:
         fidele = Fidele.objects.create(user=instance)
+        return
+    # Sauvegarde partielle sans les noms (ex. last_login à chaque connexion) : rien à recalculer
+    if update_fields and not {"first_name", "last_name"} & set(update_fields):
+        return
+    # Nom modifié : texte de recherche du fidèle mis à jour sans passer par Fidele.save()
+    fidele = Fidele.objects.filter(user=instance).only("id", "qlook_id", "phone", "search_text").first()
+    if fidele:
+        text = search_text_for(fidele, user=instance)
+        if text != fidele.search_text:
+            Fidele.objects.filter(pk=fidele.pk).update(search_text=text)
 
 
 @receiver(user_signed_up)
@@ -80,16 +94,112 @@ def on_comment_created(sender, instance: PrayerComment, created: bool, **kwargs)
 @receiver(post_save, sender=Fidele)
 def set_nearest_church_on_create(sender, instance: Fidele, created: bool, **kwargs):
     """
-    Après création (ou update), si aucune église et qu’on a des coordonnées,
-    on affecte la plus proche. On limite aux créations (ou seulement si encore vide).
+    À l’inscription seulement : si aucune église et qu’on a des coordonnées,
+    on affecte la plus proche. Les mises à jour (photo, profil…) ne déclenchent rien ;
+    les nouvelles positions sont traitées par set_nearest_church_on_position.
     """
-    # Tu peux restreindre à 'created is True' si tu veux éviter les updates :
-    # if not created: return
+    if not created or instance.eglise_id:
+        return
     try:
-        updated = assign_nearest_eglise_if_missing(instance, max_radius_km=50)  # par ex. 50 km
-        # Optionnel: logger si updated
-        # if updated:
-        #     logger.info("Fidele %s affecté à l’église %s", instance.pk, instance.eglise_id)
+        assign_nearest_eglise_if_missing(instance, max_radius_km=50)  # par ex. 50 km
     except Exception as e:
         # Evite que le signal casse la transaction ; remplace par un logger
         print(f"[signals] assign_nearest_eglise_if_missing error: {e!r}")
+
+
+@receiver(post_save, sender=FidelePosition)
+def set_nearest_church_on_position(sender, instance: FidelePosition, created: bool, **kwargs):
+    """Nouvelle position : met à jour la dernière position puis affecte l’église la plus proche."""
+    if not created:
+        return
+    update_last_position(instance)
+    try:
+        assign_nearest_eglise_from_position(instance, max_radius_km=50)
+    except Exception as e:
+        print(f"[signals] assign_nearest_eglise_from_position error: {e!r}")
+
+
+@receiver(post_init, sender=Eglise)
+def remember_church_location(sender, instance: Eglise, **kwargs):
+    # Lecture via __dict__ : pas de requête si la géométrie est différée (.only())
+    instance._indexed_location = instance.__dict__.get("location", False)
+
+
+@receiver([post_save, post_delete], sender=Eglise)
+def rebuild_church_index_on_change(sender, instance: Eglise, created: bool = False, **kwargs):
+    # Seul un changement de géométrie affecte l’index (les versets du jour sont sauvés chaque matin)
+    if kwargs.get("signal") is post_save and not created:
+        previous = getattr(instance, "_indexed_location", False)
+        if previous is not False and previous == instance.__dict__.get("location", False):
+            return
+    church_index.invalidate()
+    instance._indexed_location = instance.__dict__.get("location", False)
+
+
+@receiver(post_init, sender=Fidele)
+def remember_fidele_stats_scope(sender, instance: Fidele, **kwargs):
+    instance._stats_eglise_id = instance.__dict__.get("eglise_id")
+
+
+@receiver([post_save, post_delete], sender=Fidele)
+def invalidate_member_stats(sender, instance: Fidele, **kwargs):
+    # Ancienne et nouvelle église (transfert) + vue “toutes églises”
+    member_stats.bump_version(getattr(instance, "_stats_eglise_id", None), instance.__dict__.get("eglise_id"))
+    instance._stats_eglise_id = instance.__dict__.get("eglise_id")
+
+
+@receiver([post_save, post_delete], sender=ProblemeParticulier)
+def invalidate_member_stats_on_problem(sender, instance: ProblemeParticulier, **kwargs):
+    eglise_id = Fidele.objects.filter(pk=instance.fidele_id).values_list("eglise_id", flat=True).first()
+    member_stats.bump_version(eglise_id)
+
+
+def invalidate_reference_data(sender, **kwargs):
+    # Tables de référence (menus, listes des formulaires) : nouvelle version pour tous les processus
+    reference_data.bump_version(reference_data.MODEL_TABLES[sender])
+
+
+# Un branchement par table de référence (pas de receveur global appelé à chaque save du projet)
+for _model in reference_data.MODEL_TABLES:
+    post_save.connect(invalidate_reference_data, sender=_model, dispatch_uid=f"refdata_save_{_model._meta.label}")
+    post_delete.connect(invalidate_reference_data, sender=_model, dispatch_uid=f"refdata_delete_{_model._meta.label}")
+
+
+# -------------------------------
+# Foyers (abmci.services.family_graph)
+# -------------------------------
+def _refresh_households(ids):
+    def run():
+        try:
+            family_graph.refresh_for(ids)
+        except Exception as e:
+            # Rattrapé par le recalcul complet nocturne
+            print(f"[signals] family_graph.refresh_for error: {e!r}")
+
+    transaction.on_commit(run)
+
+
+@receiver(post_init, sender=Fidele)
+def remember_family_links(sender, instance: Fidele, **kwargs):
+    instance._family_links = tuple(instance.__dict__.get(f) for f in family_graph.LINK_FIELDS)
+
+
+@receiver([post_save, post_delete], sender=Fidele)
+def refresh_household_on_links_change(sender, instance: Fidele, created: bool = False, **kwargs):
+    previous = getattr(instance, "_family_links", None)
+    current = tuple(instance.__dict__.get(f) for f in family_graph.LINK_FIELDS)
+    instance._family_links = current
+    if kwargs.get("signal") is post_save and previous == current and not created:
+        return
+    # Fidèle, anciens et nouveaux parents / conjoint : leurs foyers (actuels et passés) sont recalculés
+    ids = {instance.pk, *(previous or ())[:3], *current[:3]}
+    if kwargs.get("signal") is post_delete:
+        ids.discard(instance.pk)
+    _refresh_households(ids)
+
+
+@receiver(m2m_changed, sender=Fidele.frere.through)
+@receiver(m2m_changed, sender=Fidele.soeur.through)
+def refresh_household_on_siblings_change(sender, instance, action, pk_set=None, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        _refresh_households({instance.pk, *(pk_set or ())})
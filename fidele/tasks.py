@@ -0,0 +1,118 @@
+from celery import shared_task
+
+from fidele.models import ExportJob, ImportJob, Notification
+
+
+@shared_task
+def run_export_job(job_id):
+    """Produit le fichier d’un export volumineux puis prévient son auteur."""
+    from abmci.services.exports import download_url, run_job
+
+    job = ExportJob.objects.filter(pk=job_id, status="pending").first()
+    if job is None:
+        return None
+
+    job = run_job(job)
+    if job.user_id:
+        if job.status == "done":
+            title, body = "Export prêt", f"Votre export {job.kind} ({job.rows} lignes) est disponible."
+        else:
+            title, body = "Export échoué", f"L’export {job.kind} a échoué : {job.error[:200]}"
+        Notification.objects.create(
+            user_id=job.user_id,
+            type="EXPORT",
+            title=title,
+            body=body,
+            data={"export_job": job.pk, "url": download_url(job)},
+        )
+    return job.status
+
+
+@shared_task
+def downsample_positions_task():
+    """Rétention nocturne des relevés GPS (un relevé par fidèle et par heure au-delà de 7 jours)."""
+    from abmci.services.positions import downsample
+
+    return downsample()
+
+
+@shared_task
+def compute_member_density_task():
+    """Recalcul nocturne de la grille de densité des fidèles (tous les zooms)."""
+    from abmci.services.member_density import compute
+
+    return compute()
+
+
+@shared_task
+def refresh_church_rollups_task():
+    """Instantanés quotidiens par église : du dernier jour enregistré jusqu’à aujourd’hui."""
+    from abmci.services.rollups import refresh
+
+    return refresh()
+
+
+@shared_task
+def rebuild_households_task():
+    """Recalcul complet nocturne des foyers (filet de sécurité des mises à jour incrémentales)."""
+    from abmci.services.family_graph import rebuild
+
+    return rebuild()
+
+
+@shared_task
+def find_duplicates_task():
+    """Recalcul hebdomadaire des doublons probables de fidèles."""
+    from abmci.services.member_dedupe import refresh_candidates
+
+    return refresh_candidates()
+
+
+@shared_task
+def send_celebrations_task():
+    """Anniversaires (naissance, baptême, mariage) du jour : notifications groupées aux fidèles et pasteurs."""
+    from abmci.services.celebrations import send_daily
+
+    return send_daily()
+
+
+@shared_task
+def recompute_engagement_task():
+    """Recalcul nocturne de l’assiduité (fenêtres glissantes de 4 et 12 semaines, décrochage)."""
+    from abmci.services.engagement import recompute
+
+    return recompute()
+
+
+@shared_task
+def apply_member_side_effects_task(payload):
+    """Effets de bord groupés d’une écriture en masse de fidèles (abmci.services.member_bulk)."""
+    from abmci.services.member_bulk import apply_side_effects
+
+    return apply_side_effects(payload)
+
+
+@shared_task
+def run_import_job(job_id):
+    """Import de fidèles (CSV/XLSX) par lots, puis notification de son auteur."""
+    from abmci.services.member_import import run_job
+
+    job = ImportJob.objects.filter(pk=job_id, status="pending").first()
+    if job is None:
+        return None
+
+    job = run_job(job)
+    if job.user_id:
+        if job.status == "done":
+            title = "Import terminé"
+            body = f"{job.created} fidèle(s) importé(s) sur {job.rows} ligne(s), {job.failed} en erreur."
+        else:
+            title, body = "Import échoué", f"L’import a échoué : {job.error[:200]}"
+        Notification.objects.create(
+            user_id=job.user_id,
+            type="IMPORT",
+            title=title,
+            body=body,
+            data={"import_job": job.pk},
+        )
+    return job.status
@@ -5,7 +5,8 @@ from django.urls import path
 from . import views
 from .views import FideleListView, permanencecreate, FideleDetailView, VieDeLEgliseListView, EngagementListView, \
     StatutSocialListView, MessagerieListView, DirectionDetailView, FideleUpdateView, SuivieFideleListView, \
-    FideleDeleteView, FideleTransferView, FideleCreateView, complete_profile, profile_complete, Politique, SaftyChildren
+    FideleDeleteView, FideleTransferView, FideleCreateView, complete_profile, profile_complete, Politique, \
+    SaftyChildren, FidelesARelancerView
 
 urlpatterns = [
                   path('membres/', FideleListView.as_view(), name='membres'),
@@ -20,6 +21,7 @@ urlpatterns = [
                   path('safety-policy/', SaftyChildren.as_view(), name='safety_policy'),
 
                   path('suivie/', SuivieFideleListView.as_view(), name='suivie'),
+                  path('suivie/a-relancer/', FidelesARelancerView.as_view(), name='a_relancer'),
                   path('membre/?P<str:slug>[0-9]+/', FideleDetailView.as_view(), name='membre'),
                   path('update/?P<int:pk>[0-9]+/', FideleUpdateView.as_view(), name='update'),
                   path('<int:pk>/infos_generale/', FideleDetailView.as_view(), name='infos_generale'),
@@ -31,7 +33,10 @@ urlpatterns = [
                   path('createpermanence/<int:pk>', views.permanencecreate, name='createpermanence'),
 
                   path('donations/', views.DonationListView.as_view(), name='donation-list'),
+                  path('donations/export/', views.DonationExportView.as_view(), name='donation-export'),
                   path('donations/<int:pk>/', views.DonationDetailView.as_view(), name='donation-detail'),
+                  path('densite/', views.MemberDensityView.as_view(), name='member-density'),
+                  path('exports/<int:pk>/telecharger/', views.ExportDownloadView.as_view(), name='export-download'),
               ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -9,6 +9,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMix
 from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Count, Q, Case, When, IntegerField, Sum
+from django.http import FileResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
@@ -16,9 +17,11 @@ from django.utils.dateparse import parse_date
 from django.views import View
 from django.views.generic import TemplateView, ListView, DetailView, UpdateView, FormView, DeleteView, CreateView
 from fidele.models import Fidele, Department, Permanence, Eglise, ProblemeParticulier, Fonction, MembreType, \
-    TransferHistory, Notification, UserProfileCompletion, AccountDeletionRequest, Donation, DonationCategory
+    TransferHistory, Notification, UserProfileCompletion, AccountDeletionRequest, Donation, DonationCategory, ExportJob
 from fidele.form import PermanenceForm, FideleUpdateForm, FideleTransferForm, ProfileCompletionForm, ConfirmDeleteForm
 from event.models import ParticipationEvenement
+from abmci.services import engagement, exports, family_graph, member_density, member_search, member_stats, \
+    reference_data, rollups
 
 
 @login_required
@@ -64,9 +67,25 @@ class HomePageView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
+        # Instantanés quotidiens (abmci.services.rollups) : pas d’agrégat sur les tables de base
+        snapshot = rollups.latest()
+        trend = rollups.trend(days=30, fields=('members', 'nouveaux', 'participations', 'donations_amount'))
+
         # Récupérer le nombre total de membres
-        context['nombre_membres'] = Fidele.objects.all().count()
-        context['direction'] = Department.objects.all().count()
+        context['nombre_membres'] = snapshot['members'] if snapshot else Fidele.objects.all().count()
+        context['direction'] = len(reference_data.get('department'))
+        context['snapshot'] = snapshot
+        members = trend['members']
+        context['croissance_membres'] = (
+            (members[-1] - members[0]) / members[0] * 100 if len(members) > 1 and members[0] else 0
+        )
+        context['nouveaux_30j'] = sum(trend['nouveaux'])
+        context['dons_30j'] = sum(trend['donations_amount'])
+        context['dashboard_charts'] = {
+            'genre': [snapshot['hommes'], snapshot['femmes']] if snapshot else [0, 0],
+            'ages': snapshot['age_distribution'] if snapshot else [],
+            'trend': trend,
+        }
 
         return context
 
@@ -130,6 +149,7 @@ class SuivieFideleListView(LoginRequiredMixin, ListView):
     template_name = "fidele/suivie_fidele.html"
     context_object_name = "membres"
     paginate_by = 25
+    stats_filter_params = ('statut', 'date_range', 'bapteme', 'q')
 
     def get_queryset(self):
         # Récupérer l'église de l'utilisateur connecté
@@ -184,35 +204,40 @@ class SuivieFideleListView(LoginRequiredMixin, ListView):
         elif bapteme == 'non_baptise':
             queryset = queryset.filter(date_bapteme__isnull=True)
 
-        # Filtre par recherche texte
+        # Filtre par recherche texte (index trigramme, insensible aux accents)
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(
-                Q(user__first_name__icontains=search_query) |
-                Q(user__last_name__icontains=search_query) |
-                Q(phone__icontains=search_query) |
-                Q(personal_mail__icontains=search_query)
-            )
+            queryset = member_search.filter_queryset(queryset, search_query)
 
         return queryset
 
+    def get_stats_queryset(self):
+        # Sans annotations ni tri : l’agrégat porte directement sur les fidèles filtrés
+        user_eglise = self.request.user.fidele.eglise
+        return self.apply_filters(Fidele.objects.filter(eglise=user_eglise))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
 
-        # Statistiques pour les cartes
-        total_visiteurs = queryset.count()
-        nouveaux_visiteurs = queryset.filter(est_recent=1).count()
-        baptises = queryset.exclude(date_bapteme__isnull=True).count()
-        total_problemes = ProblemeParticulier.objects.filter(fidele__in=queryset).count()
+        # Statistiques pour les cartes (une requête, en cache par église et filtres)
+        eglise_id = self.request.user.fidele.eglise_id
+        filters = {k: self.request.GET.get(k, '') for k in self.stats_filter_params}
+        filters['eglise_id'] = eglise_id
+        stats = member_stats.member_stats(
+            self.get_stats_queryset(), eglise_id=eglise_id, filters=filters, with_problems=True
+        )
+        total_visiteurs = stats['total']
+        nouveaux_visiteurs = stats['nouveaux']
+        baptises = stats['baptises']
+        total_problemes = stats['problemes']
+        total_fideles = member_stats.total_members()
 
         context.update({
             'total_visiteurs': total_visiteurs,
             'nouveaux_visiteurs': nouveaux_visiteurs,
             'baptises': baptises,
             'total_problemes': total_problemes,
-            'pourcentage_visiteurs': (
-                    total_visiteurs / Fidele.objects.count() * 100) if Fidele.objects.count() > 0 else 0,
+            'pourcentage_visiteurs': (total_visiteurs / total_fideles * 100) if total_fideles > 0 else 0,
             'pourcentage_nouveaux': (nouveaux_visiteurs / total_visiteurs * 100) if total_visiteurs > 0 else 0,
             'pourcentage_baptises': (baptises / total_visiteurs * 100) if total_visiteurs > 0 else 0,
             'pourcentage_avec_problemes': (total_problemes / total_visiteurs * 100) if total_visiteurs > 0 else 0,
@@ -228,6 +253,7 @@ class FideleListView(LoginRequiredMixin, ListView):
     template_name = "fidele/fidele_list.html"
     context_object_name = "membres"
     paginate_by = 10
+    stats_filter_params = ('eglise_id', 'statut', 'departement_id', 'type_membre_id', 'q')
 
     def get_page_range(self, paginator, page_obj):
         """Génère une liste de pages à afficher dans la pagination."""
@@ -248,15 +274,17 @@ class FideleListView(LoginRequiredMixin, ListView):
         # Filtre par église
         eglise_id = self.request.GET.get('eglise_id')
         context['eglise_id'] = eglise_id
-        context['eglise_selectionnee'] = Eglise.objects.filter(id=eglise_id).first() if eglise_id else None
+        context['church'] = reference_data.get('eglise')
+        context['eglise_selectionnee'] = next(
+            (e for e in context['church'] if eglise_id and str(e.pk) == eglise_id), None
+        )
 
         # Statistiques générales
-        context['nombre_fideles'] = queryset.count()
-        context['church'] = Eglise.objects.all()
         context['page_range'] = self.get_page_range(context['paginator'], context['page_obj'])
 
         # Préparation des données pour les graphiques
         self.prepare_chart_data(context, queryset)
+        context['nombre_fideles'] = context['stats']['total']
 
         # Préparation des filtres avancés
         self.prepare_advanced_filters(context)
@@ -264,44 +292,27 @@ class FideleListView(LoginRequiredMixin, ListView):
         return context
 
     def prepare_chart_data(self, context, queryset):
-        """Prépare les données pour les graphiques statistiques."""
+        """Prépare les données pour les graphiques statistiques (un seul agrégat, en cache)."""
+        eglise_id = self.request.GET.get('eglise_id')
+        filters = {k: self.request.GET.get(k, '') for k in self.stats_filter_params}
+        stats = member_stats.member_stats(
+            queryset, eglise_id=int(eglise_id) if eglise_id and eglise_id.isdigit() else None, filters=filters
+        )
+
         # Statistiques démographiques
-        context['stats'] = {
-            'hommes': queryset.filter(sexe='M').count(),
-            'femmes': queryset.filter(sexe='F').count(),
-            'nouveaux': queryset.filter(date_entree__gte=timezone.now() - timedelta(days=21)).count(),
-            'baptises': queryset.exclude(date_bapteme=None).count(),
-            'visiteurs': queryset.filter(membre=0).count(),
-            'membres_actifs': queryset.filter(membre=1).count(),
-            'fiss': queryset.filter(membre=2).count(),
-        }
+        context['stats'] = stats
 
         # Répartition par âge
-        age_ranges = [
-            ('0-17', queryset.filter(birthdate__gte=timezone.now() - timedelta(days=365 * 18))),
-            ('18-25', queryset.filter(birthdate__lt=timezone.now() - timedelta(days=365 * 18),
-                                      birthdate__gte=timezone.now() - timedelta(days=365 * 26))),
-            ('26-35', queryset.filter(birthdate__lt=timezone.now() - timedelta(days=365 * 26),
-                                      birthdate__gte=timezone.now() - timedelta(days=365 * 36))),
-            ('36-50', queryset.filter(birthdate__lt=timezone.now() - timedelta(days=365 * 36),
-                                      birthdate__gte=timezone.now() - timedelta(days=365 * 51))),
-            ('50+', queryset.filter(birthdate__lt=timezone.now() - timedelta(days=365 * 51))),
-        ]
-        context['age_distribution'] = [(label, qs.count()) for label, qs in age_ranges]
+        context['age_distribution'] = stats['age_distribution']
 
         # Répartition par statut
-        context['status_distribution'] = [
-            ('Visiteurs', context['stats']['visiteurs']),
-            ('Membres actifs', context['stats']['membres_actifs']),
-            ('FISS', context['stats']['fiss']),
-            ('Sympathisants', queryset.filter(membre__isnull=True).count())
-        ]
+        context['status_distribution'] = member_stats.status_distribution(stats)
 
     def prepare_advanced_filters(self, context):
         """Prépare les données pour les filtres avancés."""
-        context['departments'] = Department.objects.all()
-        context['fonctions'] = Fonction.objects.all()
-        context['type_membres'] = MembreType.objects.all()
+        context['departments'] = reference_data.get('department')
+        context['fonctions'] = reference_data.get('fonction')
+        context['type_membres'] = reference_data.get('membre_type')
 
     def get_queryset(self):
         queryset = super().get_queryset().select_related(
@@ -333,15 +344,10 @@ class FideleListView(LoginRequiredMixin, ListView):
         if type_membre_id:
             queryset = queryset.filter(type_membre_id=type_membre_id)
 
-        # Filtre par recherche
+        # Filtre par recherche (index trigramme, insensible aux accents)
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(
-                Q(user__first_name__icontains=search_query) |
-                Q(user__last_name__icontains=search_query) |
-                Q(personal_mail__icontains=search_query) |
-                Q(phone__icontains=search_query)
-            )
+            queryset = member_search.filter_queryset(queryset, search_query)
 
         return queryset.order_by('user__last_name', 'user__first_name')
 
@@ -467,7 +473,9 @@ class VieDeLEgliseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         fidele_instance = get_object_or_404(Fidele, pk=self.kwargs["pk"])
-        participations = ParticipationEvenement.objects.filter(fidele=fidele_instance)
+        # Évènements chargés avec les participations (une requête), plus récents d’abord
+        participations = (ParticipationEvenement.objects.filter(fidele=fidele_instance)
+                          .select_related("evenement").order_by("-date"))
         evenements_participes = [participation.evenement for participation in participations]
         return evenements_participes
 
@@ -479,6 +487,37 @@ class EngagementListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["fidele_detail"] = Fidele.objects.get(pk=self.kwargs["pk"])
+        # Assiduité précalculée (abmci.services.engagement) : aucune lecture des participations
+        context["assiduite"] = engagement.for_member(self.kwargs["pk"])
+        return context
+
+    def get_queryset(self):
+        return Fidele.objects.none()
+
+
+class FidelesARelancerView(LoginRequiredMixin, TemplateView):
+    """
+    Fidèles réguliers dont la présence a chuté (drapeau de décrochage), absents depuis le plus
+    longtemps d’abord ; page suivante par clé (?apres=<id du dernier fidèle>).
+    """
+    template_name = "fidele/fideles_a_relancer.html"
+    paginate_by = 25
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        eglise_id = self.request.user.fidele.eglise_id
+        try:
+            after_id = int(self.request.GET.get("apres") or 0)
+        except ValueError:
+            after_id = 0
+        rows = engagement.follow_up(eglise_id, limit=self.paginate_by + 1, after_id=after_id)
+        context.update({
+            "a_relancer": rows[:self.paginate_by],
+            "page_suivante": rows[self.paginate_by - 1].fidele_id if len(rows) > self.paginate_by else None,
+            "premiere_page": not after_id,
+            "fenetre_courte": engagement.SHORT_WINDOW_DAYS // 7,
+            "fenetre_longue": engagement.LONG_WINDOW_DAYS // 7,
+        })
         return context
 
 
@@ -488,14 +527,26 @@ class StatutSocialListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["fidele_detail"] = Fidele.objects.get(pk=self.kwargs["pk"])
-        fidele_instance = get_object_or_404(Fidele, pk=self.kwargs["pk"])
-        context["frere"] = fidele_instance.frere.all()
-        context["soeur"] = fidele_instance.soeur.all()
-        context["enfant"] = Fidele.objects.filter(pere=fidele_instance)
-        context["enfantnbr"] = Fidele.objects.filter(pere=fidele_instance).count()
+        fidele_instance = get_object_or_404(
+            Fidele.objects.select_related("user", "marie_a__user", "pere__user", "mere__user"), pk=self.kwargs["pk"]
+        )
+        context["fidele_detail"] = fidele_instance
+        context["frere"] = fidele_instance.frere.select_related("user")
+        context["soeur"] = fidele_instance.soeur.select_related("user")
+        # Enfants évalués une fois (liste + nombre), par le père ou la mère
+        enfants = list(
+            Fidele.objects.filter(Q(pere=fidele_instance) | Q(mere=fidele_instance), is_deleted=0)
+            .select_related("user")
+        )
+        context["enfant"] = enfants
+        context["enfantnbr"] = len(enfants)
+        context["foyer"] = [f for f in family_graph.household(fidele_instance.pk) if f.pk != fidele_instance.pk]
         return context
 
+    def get_queryset(self):
+        # Page d’un fidèle : la liste de la ListView n’est pas affichée
+        return Fidele.objects.none()
+
     # def get_queryset(self):
     #     fidele_instance = get_object_or_404(Fidele, pk=self.kwargs["pk"])
     #     enfants = Fidele.objects.filter(pere=fidele_instance)
@@ -723,25 +774,8 @@ class DonationListView(LoginRequiredMixin, ListView):
 
         qs = self.get_base_queryset()
 
-        # --- Filtres ---
-        status = (self.request.GET.get('status') or '').strip()
-        category = (self.request.GET.get('category') or '').strip()  # code ou id
-        date_from = parse_date(self.request.GET.get('date_from') or '')
-        date_to = parse_date(self.request.GET.get('date_to') or '')
-
-        if status:
-            qs = qs.filter(status=status)
-
-        if category:
-            if category.isdigit():
-                qs = qs.filter(category_id=int(category))
-            else:
-                qs = qs.filter(category__code=category)
-
-        if date_from:
-            qs = qs.filter(created_at__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(created_at__date__lte=date_to)
+        # --- Filtres (statut, catégorie code ou id, période) ---
+        qs = exports.filter_donations(qs, self.request.GET)
 
         self._qs = qs.order_by('-created_at')
         return self._qs
@@ -789,8 +823,72 @@ class DonationListView(LoginRequiredMixin, ListView):
 
         # Pour l’admin: savoir si “all=1” est actif
         ctx['showing_all'] = self.request.user.is_staff and self.request.GET.get('all') == '1'
+
+        # Évolution mensuelle (vue globale) : lue dans les instantanés quotidiens
+        ctx['donation_trend'] = rollups.monthly(months=12) if ctx['showing_all'] else None
         return ctx
 
+class DonationExportView(DonationListView):
+    """
+    Export des dons filtrés (mêmes filtres que la liste) :
+    CSV en flux, ou fichier produit en arrière-plan (XLSX / gros volumes).
+    """
+
+    def get(self, request, *args, **kwargs):
+        fmt = 'xlsx' if request.GET.get('format') == 'xlsx' else 'csv'
+        params = {
+            'filters': {k: request.GET.get(k, '') for k in ('status', 'category', 'date_from', 'date_to')},
+            'user_id': None if (request.user.is_staff and request.GET.get('all') == '1') else request.user.pk,
+        }
+        response = exports.export_response(request, 'donations', params, fmt=fmt)
+        if response is None:
+            query = request.GET.copy()
+            query.pop('format', None)
+            return redirect(f"{reverse('donation-list')}?{query.urlencode()}")
+        return response
+
+
+class ExportDownloadView(LoginRequiredMixin, View):
+    """Fichier d’un export terminé (stockage privé) : réservé à son auteur et aux superutilisateurs."""
+
+    def get(self, request, pk, *args, **kwargs):
+        jobs = ExportJob.objects.filter(status='done').exclude(file='')
+        if not request.user.is_superuser:
+            jobs = jobs.filter(user=request.user)
+        job = get_object_or_404(jobs, pk=pk)
+        response = FileResponse(job.file.open('rb'), as_attachment=True, filename=exports.download_name(job))
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
+class MemberDensityView(LoginRequiredMixin, PermissionRequiredMixin, View):
+    """
+    Densité des fidèles par cellule (grille précalculée chaque nuit) et distance à l’église
+    la plus proche. Paramètres : zoom, bbox=ouest,sud,est,nord (optionnel).
+    """
+    permission_required = 'fidele.view_memberdensitycell'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            zoom = member_density.stored_zoom(int(request.GET.get('zoom', member_density.ZOOMS[0])))
+            bbox = request.GET.get('bbox')
+            bbox = tuple(float(v) for v in bbox.split(',')) if bbox else None
+            if bbox is not None and len(bbox) != 4:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({'detail': 'Paramètres zoom/bbox invalides.'}, status=400)
+
+        rows = member_density.cells(zoom, bbox)
+        computed_at = member_density.last_computed_at(zoom)
+        return JsonResponse({
+            'zoom': zoom,
+            'computed_at': computed_at.isoformat() if computed_at else None,
+            'far_distance_m': member_density.FAR_DISTANCE_M,
+            'summary': member_density.summary(rows),
+            'cells': member_density.public_cells(rows),
+        })
+
+
 class DonationDetailView(LoginRequiredMixin, DetailView):
     model = Donation
     template_name = 'donations/donation_detail.html'
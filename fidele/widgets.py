@@ -0,0 +1,101 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django_select2.forms import ModelSelect2MultipleWidget, ModelSelect2Widget
+
+from abmci.services import member_search
+from event.models import Evenement
+from fidele.models import Fidele, Location
+
+# Résultats d’autocomplétion mis en cache brièvement (saisies identiques des utilisateurs d’une église)
+RESULTS_TTL = 60
+RESULTS_MAX = 200
+
+
+def _user_eglise_id(request):
+    fidele = getattr(request.user, "fidele", None) if request else None
+    return getattr(fidele, "eglise_id", None)
+
+
+class _CachedResultsMixin:
+    """
+    Recherche côté serveur (django_select2 « heavy ») : le rendu du formulaire n’émet que
+    l’option sélectionnée ; les candidats sont servis par /select2/fields/auto.json,
+    limités à l’église de l’utilisateur (staff : toutes) et mis en cache par (église, saisie).
+    """
+    cache_prefix = ""
+
+    def scope_queryset(self, request, queryset):
+        if request and request.user.is_staff:
+            return queryset
+        eglise_id = _user_eglise_id(request)
+        return queryset.filter(eglise_id=eglise_id) if eglise_id else queryset.none()
+
+    def search(self, queryset, term):
+        """Par défaut : saisie recherchée dans chacun des `search_fields` (OU)."""
+        term = term.strip()
+        if not term:
+            return queryset
+        q = Q()
+        for field in self.search_fields:
+            q |= Q(**{field: term})
+        return queryset.filter(q)
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        base = queryset if queryset is not None else self.get_queryset()
+        try:
+            # Le queryset du champ fait partie de la clé : deux sélecteurs « fidele »
+            # (ex. ouvriers d’une direction / toute l’église) ne partagent pas leurs résultats
+            scope = hashlib.md5(str(base.query).encode("utf-8")).hexdigest()
+        except EmptyResultSet:
+            return base.none()
+        queryset = self.scope_queryset(request, base)
+        staff = bool(request and request.user.is_staff)
+        church = "all" if staff else _user_eglise_id(request)
+        key = f"select2:{self.cache_prefix}:{scope}:{church}:{term.strip().lower()}"
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(self.search(queryset, term).values_list("pk", flat=True)[:RESULTS_MAX])
+            cache.set(key, ids, RESULTS_TTL)
+        return queryset.filter(pk__in=ids)
+
+
+class _FideleSearchMixin(_CachedResultsMixin):
+    model = Fidele
+    search_fields = ["search_text__contains"]
+    cache_prefix = "fidele"
+    max_results = 20
+
+    def get_queryset(self):
+        # Queryset du champ (éventuellement restreint par la vue, ex. ouvriers d’une direction)
+        return super().get_queryset().filter(is_deleted=0).select_related("user").order_by("search_text")
+
+    def search(self, queryset, term):
+        # Index trigramme de Fidele.search_text (noms, téléphone, qlook_id, sans accents)
+        return member_search.filter_queryset(queryset, term)
+
+
+class FideleSelect2Widget(_FideleSearchMixin, ModelSelect2Widget):
+    pass
+
+
+class FideleSelect2MultipleWidget(_FideleSearchMixin, ModelSelect2MultipleWidget):
+    pass
+
+
+class EvenementSelect2Widget(_CachedResultsMixin, ModelSelect2Widget):
+    model = Evenement
+    queryset = Evenement.objects.order_by("-date_debut")
+    search_fields = ["titre__icontains"]
+    cache_prefix = "evenement"
+    max_results = 20
+
+
+class LocationSelect2Widget(ModelSelect2Widget):
+    """Localités : recherche par nom côté serveur (la table n’est plus rendue en entier)."""
+    model = Location
+    queryset = Location.objects.order_by("depth", "name")
+    search_fields = ["name__icontains"]
+    max_results = 20